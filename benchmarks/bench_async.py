@@ -0,0 +1,56 @@
+"""N overlapping streaming sessions, blocking solver on a thread pool vs the asyncio solver
+
+    python benchmarks/bench_async.py [n_sessions] [pool_workers]
+"""
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_server import MockHandler, start_server
+from ovos_solver_openai_persona.async_engines import AsyncOpenAIChatCompletionsSolver
+from ovos_solver_openai_persona.engines import OpenAIChatCompletionsSolver
+from ovos_solver_openai_persona.transport import close_async_sessions
+
+
+class SlowHandler(MockHandler):
+    latency = 0.2  # time to first token
+    token_delay = 0.01
+
+
+def run_threads(solver, n: int, workers: int) -> float:
+    def session(i):
+        return list(solver.stream_utterances(f"question {i}"))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(session, range(n)))
+    return time.perf_counter() - start
+
+
+async def run_async(solver, n: int) -> float:
+    async def session(i):
+        return [utt async for utt in solver.stream_utterances(f"question {i}")]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(n)))
+    elapsed = time.perf_counter() - start
+    await close_async_sessions()
+    return elapsed
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    server = start_server(handler=SlowHandler)
+    cfg = {"api_url": f"http://127.0.0.1:{server.server_port}/v1", "key": "sk-mock",
+           "enable_memory": False, "pool_size": n}
+    results = {
+        "sessions": n,
+        f"threads_{workers}_workers_s": run_threads(OpenAIChatCompletionsSolver(cfg), n, workers),
+        "thread_per_session_s": run_threads(OpenAIChatCompletionsSolver(cfg), n, n),
+        "asyncio_s": asyncio.run(run_async(AsyncOpenAIChatCompletionsSolver(cfg), n))
+    }
+    print(json.dumps(results, indent=2))
+    server.shutdown()
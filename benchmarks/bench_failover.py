@@ -0,0 +1,48 @@
+"""latency of a chat request while the preferred backend is down, with and without the circuit breaker
+
+    python benchmarks/bench_failover.py [n_requests]
+"""
+import json
+import socket
+import statistics
+import sys
+import time
+
+from mock_server import start_server
+from ovos_solver_openai_persona.engines import OpenAIChatCompletionsSolver
+from ovos_solver_openai_persona.endpoints import _HEALTH
+
+
+def unused_url() -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def bench(n: int, config: dict) -> list:
+    _HEALTH.clear()
+    solver = OpenAIChatCompletionsSolver(config)
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        assert solver.continue_chat([{"role": "user", "content": "hello"}], lang="en")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server = start_server()
+    endpoints = [{"api_url": unused_url(), "priority": 0},
+                 {"api_url": f"http://127.0.0.1:{server.server_port}/v1", "priority": 1}]
+    base = {"key": "sk-mock", "max_retries": 0, "enable_memory": False, "endpoints": endpoints}
+
+    results = {}
+    for name, threshold in (("no_breaker", n + 1), ("breaker", 3)):
+        t = bench(n, {**base, "circuit_breaker_failures": threshold})
+        results[name] = {"mean_ms": statistics.mean(t), "p50_ms": statistics.median(t),
+                         "p95_ms": sorted(t)[int(len(t) * 0.95) - 1]}
+    print(json.dumps(results, indent=2))
+    server.shutdown()
@@ -0,0 +1,91 @@
+"""time to first utterance with and without prewarm() at wake word time, against a stub with prefix caching
+
+the stub charges prefill time for every prompt word not covered by its KV cache,
+the sliding chat history window changes the prompt prefix on every turn so
+without priming the whole history is processed again after the query arrives
+
+    python benchmarks/bench_prewarm.py [turns] [stt_seconds]
+"""
+import hashlib
+import json
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from mock_server import MockHandler, start_server
+from ovos_solver_openai_persona import OpenAIChatCompletionsSolver
+
+PERSONA = "You are a friendly assistant for a smart home. " * 40  # a long system prompt
+ANSWER = " ".join(" ".join(f"word{i}" for i in range(s, s + 10)) + "." for s in range(0, 60, 10))
+
+
+class PrefixCacheHandler(MockHandler):
+    """prefill cost per uncached prompt word, the cache keeps the last few sequences"""
+    latency = 0.02  # fixed overhead
+    prefill_per_word = 0.0005
+    token_delay = 0.002
+    answer = ANSWER
+    slots = 4
+    cache: "OrderedDict[str, None]" = OrderedDict()
+    lock = threading.Lock()
+
+    @staticmethod
+    def _prefix_keys(messages: list) -> list:
+        keys, digest = [], hashlib.sha256()
+        for m in messages:
+            digest.update(json.dumps([m["role"], m["content"]]).encode("utf-8"))
+            keys.append(digest.copy().hexdigest())
+        return keys
+
+    def _latency(self, payload: dict) -> float:
+        messages = payload.get("messages", [])
+        keys = self._prefix_keys(messages)
+        # the generated answer ends up in the KV cache as well
+        keys += self._prefix_keys(messages + [{"role": "assistant", "content": self.answer}])[-1:]
+        with self.lock:
+            cached = 0
+            for idx, key in enumerate(keys[:len(messages)]):
+                if key in self.cache:
+                    cached = idx + 1
+            for key in keys:
+                self.cache[key] = None
+                self.cache.move_to_end(key)
+            while len(self.cache) > self.slots * 20:
+                self.cache.popitem(last=False)
+        uncached = sum(len(m["content"].split()) for m in messages[cached:])
+        return self.latency + uncached * self.prefill_per_word
+
+
+def run(api_url: str, turns: int, stt: float, mode: str) -> list:
+    PrefixCacheHandler.cache.clear()
+    solver = OpenAIChatCompletionsSolver({"api_url": api_url, "key": "sk-mock", "memory_size": 3,
+                                          "initial_prompt": PERSONA, "cache_prompt": True,
+                                          "prefix_priming": mode == "priming"})
+    timings = []
+    for i in range(turns):
+        thread = solver.prewarm() if mode != "off" else None
+        time.sleep(stt)  # the user is still speaking
+        if thread is not None:
+            thread.join(stt)  # not needed, makes the measurement deterministic
+        start = time.perf_counter()
+        for idx, _ in enumerate(solver.stream_utterances(f"question number {i}")):
+            if idx == 0:
+                timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    stt = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    server = start_server(handler=PrefixCacheHandler)
+    api_url = f"http://127.0.0.1:{server.server_port}/v1"
+    results = {}
+    for mode in ("off", "connection", "priming"):
+        t = run(api_url, turns, stt, mode)
+        results[mode] = {"first_utterance_mean_ms": statistics.mean(t) * 1000,
+                         "first_utterance_p50_ms": statistics.median(t) * 1000}
+    results["saved_ms"] = results["off"]["first_utterance_mean_ms"] - results["priming"]["first_utterance_mean_ms"]
+    print(json.dumps(results, indent=2))
+    server.shutdown()
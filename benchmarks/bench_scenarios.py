@@ -0,0 +1,164 @@
+"""end to end scenarios of the public plugins against the local mock server, results as JSON
+
+    python benchmarks/bench_scenarios.py [--sessions 8] [--requests 20] [--long-run 2000] \
+        [--latency 0.05] [--jitter 0.02] [--token-delay 0.005] [--error-rate 0] [--output results.json]
+
+measures latency of get_spoken_answer, time to first utterance of stream_utterances,
+dialog transformer rewrites (cold and cached), summaries of short and long documents,
+throughput under N concurrent sessions and memory growth over a long run with many users
+"""
+import argparse
+import gc
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_server import make_handler, start_server
+from ovos_solver_openai_persona import OpenAIPersonaSolver
+from ovos_solver_openai_persona.dialog_transformers import OpenAIDialogTransformer
+from ovos_solver_openai_persona.summarizer import OpenAISummarizer
+
+
+def summarize(timings: list) -> dict:
+    timings = sorted(timings)
+    return {"n": len(timings), "mean_ms": statistics.mean(timings) * 1000,
+            "p50_ms": statistics.median(timings) * 1000,
+            "p95_ms": timings[max(0, int(len(timings) * 0.95) - 1)] * 1000,
+            "max_ms": timings[-1] * 1000}
+
+
+def bench_spoken_answer(cfg: dict, n: int) -> dict:
+    solver = OpenAIPersonaSolver(cfg)
+    timings = []
+    for i in range(n):
+        start = time.perf_counter()
+        solver.get_spoken_answer(f"question {i}", lang="en-us")
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def bench_stream(cfg: dict, n: int) -> dict:
+    solver = OpenAIPersonaSolver(cfg)
+    first, total = [], []
+    for i in range(n):
+        start = time.perf_counter()
+        for idx, _ in enumerate(solver.stream_utterances(f"question {i}", lang="en-us")):
+            if idx == 0:
+                first.append(time.perf_counter() - start)
+        total.append(time.perf_counter() - start)
+    return {"first_utterance": summarize(first), "total": summarize(total)}
+
+
+def bench_transform(cfg: dict, n: int) -> dict:
+    transformer = OpenAIDialogTransformer(config={**cfg, "rewrite_prompt": "talk like a pirate"})
+    cold, cached = [], []
+    for i in range(n):
+        for timings in (cold, cached):  # second call of the same dialog is a cache hit
+            start = time.perf_counter()
+            transformer.transform(f"the weather is sunny {i}", {"lang": "en-us"})
+            timings.append(time.perf_counter() - start)
+    return {"cold": summarize(cold), "cached": summarize(cached)}
+
+
+def bench_tldr(cfg: dict, n: int) -> dict:
+    summarizer = OpenAISummarizer({**cfg, "tokenizer": "heuristic", "chunk_tokens": 500})
+    short_doc = "Some sentence about things here. " * 20
+    results = {}
+    for name, doc in (("short", short_doc), ("long", "\n\n".join([short_doc] * 40))):
+        timings = []
+        for i in range(n):
+            summarizer.chunk_cache.clear()
+            start = time.perf_counter()
+            summarizer.get_tldr(f"{doc} {i}")
+            timings.append(time.perf_counter() - start)
+        results[name] = summarize(timings)
+    return results
+
+
+def bench_concurrency(cfg: dict, sessions: int, n: int) -> dict:
+    solver = OpenAIPersonaSolver({**cfg, "pool_size": sessions})
+
+    def user(idx):
+        timings = []
+        for i in range(n):
+            start = time.perf_counter()
+            list(solver.stream_utterances(f"question {i}", "en-us", session_id=f"user-{idx}"))
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        timings = [t for ts in pool.map(user, range(sessions)) for t in ts]
+    elapsed = time.perf_counter() - start
+    return {"sessions": sessions, "answers_per_s": len(timings) / elapsed, "answer": summarize(timings)}
+
+
+def bench_memory(cfg: dict, turns: int) -> dict:
+    """every turn is a new user, so the chat memory of the solver must stay bounded"""
+    solver = OpenAIPersonaSolver({**cfg, "memory_max_turns": 500})
+    tracemalloc.start()
+    samples = []
+    for i in range(turns):
+        solver.get_spoken_answer(f"question {i}", "en-us", session_id=f"user-{i}")
+        if i % max(1, turns // 10) == 0:
+            gc.collect()
+            samples.append(tracemalloc.get_traced_memory()[0])
+    gc.collect()
+    samples.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+    return {"turns": turns, "traced_kb": [s // 1024 for s in samples],
+            "growth_after_warmup_kb": (samples[-1] - samples[1]) // 1024 if len(samples) > 1 else 0,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--long-run", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--tokens-per-chunk", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = start_server(handler=make_handler(latency=args.latency, jitter=args.jitter,
+                                               token_delay=args.token_delay,
+                                               tokens_per_chunk=args.tokens_per_chunk,
+                                               error_rate=args.error_rate, error_status=503))
+    fast_server = start_server()
+    cfg = {"api_url": f"http://127.0.0.1:{server.server_port}/v1", "key": "sk-mock"}
+    results = {
+        "meta": {"revision": git_revision(), "python": platform.python_version(),
+                 "timestamp": time.time(), "settings": vars(args)},
+        "get_spoken_answer": bench_spoken_answer(cfg, args.requests),
+        "stream_utterances": bench_stream(cfg, args.requests),
+        "dialog_transform": bench_transform(cfg, args.requests),
+        "get_tldr": bench_tldr(cfg, max(1, args.requests // 4)),
+        "concurrency": bench_concurrency(cfg, args.sessions, args.requests),
+        # no latency, only the growth of the process matters
+        "memory": bench_memory({**cfg, "api_url": f"http://127.0.0.1:{fast_server.server_port}/v1"},
+                               args.long_run),
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    server.shutdown()
+    fast_server.shutdown()
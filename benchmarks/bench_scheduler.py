@@ -0,0 +1,93 @@
+"""interactive latency while a burst of background requests hits a backend that slows down under load
+
+the stub models a local GPU box: every request in flight slows the others
+down, and more so the more of them there are (thrashing), so letting the whole
+burst through at once makes every answer late
+
+    python benchmarks/bench_scheduler.py [background_requests] [interactive_requests]
+"""
+import json
+import statistics
+import sys
+import threading
+import time
+
+from mock_server import MockHandler, start_server
+from ovos_solver_openai_persona.endpoints import _HEALTH
+from ovos_solver_openai_persona.engines import OpenAIChatCompletionsSolver
+from ovos_solver_openai_persona.scheduler import _SCHEDULERS, PRIORITY_BACKGROUND
+
+
+class ThrashHandler(MockHandler):
+    work = 0.1  # seconds of compute for a request alone on the box
+    thrash = 0.25  # extra slowdown per additional request in flight
+    active = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        with self.lock:
+            ThrashHandler.active += 1
+        try:
+            super().do_POST()
+        finally:
+            with self.lock:
+                ThrashHandler.active -= 1
+
+    def _latency(self, payload: dict) -> float:
+        n = self.active
+        return self.work * n * (1 + self.thrash * (n - 1))
+
+
+def run(api_url: str, n_background: int, n_interactive: int, extra: dict) -> dict:
+    _HEALTH.clear()
+    _SCHEDULERS.clear()
+    config = {"api_url": api_url, "key": "sk-mock", "enable_memory": False, "coalesce_requests": False,
+              "max_retries": 0, **extra}
+    background = OpenAIChatCompletionsSolver({**config, "request_priority": PRIORITY_BACKGROUND})
+    interactive = OpenAIChatCompletionsSolver(config)
+    first_utt, done, shed = [], [], []
+
+    def summarize(i):
+        start = time.perf_counter()
+        if background.continue_chat([{"role": "user", "content": f"summarize document {i}"}], lang="en") is None:
+            shed.append(i)
+        done.append(time.perf_counter() - start)
+
+    def ask(i):
+        start = time.perf_counter()
+        for _ in interactive.stream_chat_utterances([{"role": "user", "content": f"question {i}"}], lang="en"):
+            first_utt.append(time.perf_counter() - start)
+            break
+        else:
+            shed.append(i)
+
+    threads = [threading.Thread(target=summarize, args=(i,)) for i in range(n_background)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)  # the user speaks while the burst is running
+    asks = [threading.Thread(target=ask, args=(i,)) for i in range(n_interactive)]
+    start = time.perf_counter()
+    for t in asks:
+        t.start()
+    for t in asks + threads:
+        t.join()
+    return {"interactive_first_utterance_mean_ms": statistics.mean(first_utt) * 1000 if first_utt else None,
+            "interactive_first_utterance_max_ms": max(first_utt) * 1000 if first_utt else None,
+            "background_mean_ms": statistics.mean(done) * 1000,
+            "all_done_s": time.perf_counter() - start,
+            "shed": len(shed)}
+
+
+if __name__ == "__main__":
+    n_background = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    n_interactive = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    server = start_server(handler=ThrashHandler)
+    api_url = f"http://127.0.0.1:{server.server_port}/v1"
+    results = {
+        "unlimited": run(api_url, n_background, n_interactive, {}),
+        "max_in_flight_2": run(api_url, n_background, n_interactive, {"max_in_flight": 2}),
+        "max_in_flight_2_queue_timeout_0.3": run(api_url, n_background, n_interactive,
+                                                 {"max_in_flight": 2, "queue_timeout": 0.3}),
+    }
+    print(json.dumps(results, indent=2))
+    server.shutdown()
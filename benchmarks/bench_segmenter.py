@@ -0,0 +1,76 @@
+"""replay sample LLM token streams (GPT style tokens, realistic inter-token delays)
+and measure time to first utterance of the old chunk based splitter vs SentenceSegmenter
+
+    python benchmarks/bench_segmenter.py
+"""
+import json
+import os
+import time
+
+from ovos_solver_openai_persona.segmenter import SentenceSegmenter
+
+STREAMS = os.path.join(os.path.dirname(__file__), "data", "token_streams.json")
+
+
+class LegacySplitter:
+    """splitter used by stream_chat_utterances before SentenceSegmenter"""
+
+    def __init__(self):
+        self.answer = ""
+
+    def feed(self, chunk):
+        self.answer += chunk
+        if any(chunk.endswith(p) for p in [".", "!", "?", "\n", ":"]):
+            if len(chunk) >= 2 and chunk[-2].isdigit() and chunk[-1] == ".":
+                return []
+            answer, self.answer = self.answer.strip(), ""
+            return [answer] if answer else []
+        return []
+
+    def flush(self):
+        return None  # trailing text was dropped
+
+
+def cpu_per_token(stream: dict, factory, rounds: int = 200) -> float:
+    """microseconds spent splitting per token, without the stream delays"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        splitter = factory(stream["lang"])
+        for token in stream["tokens"]:
+            splitter.feed(token)
+        splitter.flush()
+    return round((time.perf_counter() - start) / rounds / len(stream["tokens"]) * 1e6, 2)
+
+
+def replay(stream: dict, factory) -> dict:
+    splitter = factory(stream["lang"])
+    start = time.perf_counter()
+    first = None
+    utterances = []
+    for token, delay in zip(stream["tokens"], stream["delays_ms"]):
+        time.sleep(delay / 1000)
+        out = splitter.feed(token)
+        if out and first is None:
+            first = time.perf_counter() - start
+        utterances += out
+    tail = splitter.flush()
+    if tail:
+        utterances.append(tail)
+    return {"first_utterance_ms": round(first * 1000, 1) if first else None,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            "us_per_token": cpu_per_token(stream, factory),
+            "utterances": utterances}
+
+
+if __name__ == "__main__":
+    with open(STREAMS) as f:
+        streams = json.load(f)
+    splitters = {
+        "legacy": lambda lang: LegacySplitter(),
+        "segmenter": lambda lang: SentenceSegmenter(lang),
+        "segmenter_early_6_words": lambda lang: SentenceSegmenter(lang, early_flush_words=6),
+        "segmenter_early_500ms": lambda lang: SentenceSegmenter(lang, early_flush_ms=500),
+    }
+    results = {s["name"]: {name: replay(s, factory) for name, factory in splitters.items()}
+               for s in streams}
+    print(json.dumps(results, indent=2, ensure_ascii=False))
@@ -0,0 +1,103 @@
+"""decode sample streams in the wire format of OpenAI, llama.cpp and vLLM servers
+with the old line based parser and ChatStreamParser, split at random network boundaries
+
+    python benchmarks/bench_sse.py [rounds]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+from ovos_solver_openai_persona.sse import ChatStreamParser
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+SAMPLES = {"openai": "sse_openai.txt", "llama.cpp": "sse_llamacpp.txt", "vllm": "sse_vllm.txt"}
+EXPECTED = 'Hello! The boiling point of water is 100 °C at sea level, e.g. in Lisbon.\n\n' \
+           '1. Heat it.\n2. Wait for "bubbles".'
+
+
+def _iter_lines(packets: list):
+    """requests.Response.iter_lines"""
+    pending = None
+    for chunk in packets:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def legacy_parse(packets: list) -> str:
+    """_do_streaming_api_request before ChatStreamParser, iter_lines + json.loads per line"""
+    answer = ""
+    for line in _iter_lines(packets):
+        if line:
+            chunk = json.loads(line.decode("utf-8").split("data: ", 1)[-1])
+            if "error" in chunk and "message" in chunk["error"]:
+                break
+            if chunk["choices"][0].get("finish_reason"):
+                break
+            if "content" not in chunk["choices"][0]["delta"]:
+                continue
+            answer += chunk["choices"][0]["delta"]["content"]
+    return answer
+
+
+def parse(packets: list) -> str:
+    parser = ChatStreamParser()
+    deltas = []
+    for packet in packets:
+        deltas += parser.feed(packet)
+        if parser.done:
+            break
+    else:
+        deltas += parser.close()
+    return "".join(deltas)
+
+
+def split_packets(raw: bytes, rng: random.Random, max_size: int = 64) -> list:
+    packets, idx = [], 0
+    while idx < len(raw):
+        size = rng.randint(1, max_size)
+        packets.append(raw[idx:idx + size])
+        idx += size
+    return packets
+
+
+def timed(func, packets: list, rounds: int, repeat: int = 5) -> float:
+    """best of repeat runs, seconds per decoded stream"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(packets)
+        best = min(best, (time.perf_counter() - start) / rounds)
+    return best
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(42)
+    results = {}
+    for server, filename in SAMPLES.items():
+        with open(os.path.join(DATA, filename), "rb") as f:
+            raw = f.read()
+        n_events = raw.count(b"data:")
+        packets = split_packets(raw, rng, 512)  # requests reads the stream in 512 bytes chunks
+        result = {"events": n_events,
+                  "correct": all(parse(split_packets(raw, rng, size)) == EXPECTED for size in (1, 7, 64, 4096)),
+                  "us_per_event": round(timed(parse, packets, rounds) / n_events * 1e6, 2)}
+        try:
+            result["legacy_correct"] = legacy_parse(packets) == EXPECTED
+            result["legacy_us_per_event"] = round(timed(legacy_parse, packets, rounds) / n_events * 1e6, 2)
+        except Exception as e:
+            result["legacy_correct"] = False
+            result["legacy_error"] = repr(e)
+        results[server] = result
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,73 @@
+"""import time, construction time and resident memory of each plugin entry point
+
+every measurement runs in a fresh python process; the OPM templates are
+imported first as ovos-core has them loaded before any plugin, so only the
+cost of this plugin is measured
+
+    python benchmarks/bench_startup.py [repeats]
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = {
+    "solver": ("ovos_solver_openai_persona", "OpenAIPersonaSolver", "{'key': 'sk-mock'}"),
+    "dialog_transformer": ("ovos_solver_openai_persona.dialog_transformers", "OpenAIDialogTransformer",
+                           "config={'key': 'sk-mock'}"),
+    "summarizer": ("ovos_solver_openai_persona.summarizer", "OpenAISummarizer", "{'key': 'sk-mock'}"),
+}
+
+PROBE = """
+import json, resource, sys, time
+import ovos_plugin_manager.templates.solvers, ovos_plugin_manager.templates.transformers, ovos_utils.log
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+results = {}
+base_rss = rss_mb()
+base_modules = set(sys.modules)
+plugins = []
+for name, (module, cls, args) in %s:
+    start = time.perf_counter()
+    mod = __import__(module, fromlist=[cls])
+    imported = time.perf_counter()
+    plugins.append(eval(f"getattr(mod, cls)({args})"))
+    built = time.perf_counter()
+    results[name] = {"import_ms": (imported - start) * 1000, "construct_ms": (built - imported) * 1000}
+results["rss_mb"] = rss_mb() - base_rss
+results["modules"] = len(set(sys.modules) - base_modules)
+results["requests_imported"] = "requests" in sys.modules
+print(json.dumps(results))
+"""
+
+
+def probe(entries: list) -> dict:
+    out = subprocess.run([sys.executable, "-c", PROBE % repr(entries)], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def median_of(runs: list) -> dict:
+    merged = {}
+    for key in runs[0]:
+        if isinstance(runs[0][key], dict):
+            merged[key] = {k: statistics.median(r[key][k] for r in runs) for k in runs[0][key]}
+        elif isinstance(runs[0][key], bool):
+            merged[key] = runs[0][key]
+        else:
+            merged[key] = statistics.median(r[key] for r in runs)
+    return merged
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = {}
+    for name, entry in ENTRY_POINTS.items():
+        results[name] = median_of([probe([(name, entry)]) for _ in range(repeats)])
+    results["all"] = median_of([probe(list(ENTRY_POINTS.items())) for _ in range(repeats)])
+    print(json.dumps(results, indent=2))
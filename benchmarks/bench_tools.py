@@ -0,0 +1,57 @@
+"""latency of answers that need tool calls: parallel dispatch, cached idempotent tools and interim speech
+
+the mock calls every registered tool once before answering, each tool sleeps
+tool_seconds to stand in for a home assistant or web search lookup
+
+    python benchmarks/bench_tools.py [n_tools] [tool_seconds]
+"""
+import json
+import statistics
+import sys
+import time
+
+from mock_server import start_server
+from ovos_solver_openai_persona.engines import OpenAIChatCompletionsSolver
+
+
+def make_tool(name: str, seconds: float):
+    def tool():
+        time.sleep(seconds)
+        return {"tool": name, "value": 42}
+    tool.__name__ = name
+    return tool
+
+
+def bench(api_url: str, n_tools: int, seconds: float, workers: int, idempotent: bool, n: int = 5) -> dict:
+    solver = OpenAIChatCompletionsSolver({"api_url": api_url, "key": "sk-mock", "enable_memory": False,
+                                          "tool_workers": workers})
+    for i in range(n_tools):
+        solver.register_tool(make_tool(f"lookup_{i}", seconds), description="look something up",
+                             idempotent=idempotent)
+    answers, first_utts, full_streams = [], [], []
+    for _ in range(n):
+        start = time.perf_counter()
+        assert solver.get_spoken_answer("what is the state of the house?")
+        answers.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for idx, _ in enumerate(solver.stream_utterances("what is the state of the house?")):
+            if idx == 0:
+                first_utts.append(time.perf_counter() - start)
+        full_streams.append(time.perf_counter() - start)
+    return {"answer_mean_ms": statistics.mean(answers) * 1000,
+            "stream_first_utterance_mean_ms": statistics.mean(first_utts) * 1000,
+            "stream_full_mean_ms": statistics.mean(full_streams) * 1000}
+
+
+if __name__ == "__main__":
+    n_tools = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    server = start_server()
+    api_url = f"http://127.0.0.1:{server.server_port}/v1"
+    results = {
+        "sequential": bench(api_url, n_tools, seconds, workers=1, idempotent=False),
+        "parallel": bench(api_url, n_tools, seconds, workers=n_tools, idempotent=False),
+        "parallel_cached": bench(api_url, n_tools, seconds, workers=n_tools, idempotent=True),
+    }
+    print(json.dumps(results, indent=2))
+    server.shutdown()
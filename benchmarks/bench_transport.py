@@ -0,0 +1,44 @@
+"""compare a new requests.Session per call (old behaviour) with the pooled transport
+
+    python benchmarks/bench_transport.py [n_requests]
+"""
+import json
+import statistics
+import sys
+import time
+
+import requests
+
+from mock_server import start_server
+from ovos_solver_openai_persona.transport import get_session, close_sessions
+
+
+def bench(n: int, api_url: str, pooled: bool) -> list:
+    payload = json.dumps({"model": "mock", "messages": [{"role": "user", "content": "hello"}]})
+    headers = {"Content-Type": "application/json", "Authorization": "Bearer sk-mock"}
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        session = get_session(api_url) if pooled else requests.Session()
+        session.post(f"{api_url}/chat/completions", headers=headers, data=payload).json()
+        if not pooled:
+            session.close()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = start_server()
+    api_url = f"http://127.0.0.1:{server.server_port}/v1"
+    bench(10, api_url, pooled=True)  # warmup
+    close_sessions()
+
+    results = {}
+    for name, pooled in (("new_session", False), ("pooled", True)):
+        t = bench(n, api_url, pooled)
+        results[name] = {"mean_ms": statistics.mean(t), "p50_ms": statistics.median(t),
+                         "p95_ms": sorted(t)[int(len(t) * 0.95) - 1]}
+    results["saved_per_request_ms"] = results["new_session"]["mean_ms"] - results["pooled"]["mean_ms"]
+    print(json.dumps(results, indent=2))
+    server.shutdown()
@@ -0,0 +1,189 @@
+"""Minimal local OpenAI compatible server used by the benchmark scripts, no network access needed
+
+serves /chat/completions and /completions, streaming or not, with configurable
+latency, jitter, stream chunking and error rates; when offered tools it calls
+all of them once before answering
+
+    python benchmarks/mock_server.py [--port 8000] [--latency 0.2] [--jitter 0.05] \
+        [--token-delay 0.01] [--tokens-per-chunk 1] [--error-rate 0.05]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+ANSWER = "Quantum mechanics is the study of very small things. It explains how atoms behave. " \
+         "Particles can be in many states at once!"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    latency = 0.0  # seconds before the answer starts
+    jitter = 0.0  # up to this many seconds are randomly added to latency and token_delay
+    token_delay = 0.0  # seconds between streamed chunks
+    tokens_per_chunk = 1  # words sent in each streamed event
+    error_rate = 0.0  # fraction of requests answered with error_status
+    error_status = 500
+    retry_after = None  # Retry-After header sent with injected errors, eg. for 429
+    answer = ANSWER
+    tool_preamble = "Let me check."  # said before calling tools
+
+    def log_message(self, *args):
+        pass
+
+    def _sleep(self, seconds: float):
+        if self.jitter:
+            seconds += random.uniform(0, self.jitter)
+        if seconds:
+            time.sleep(seconds)
+
+    def _send_json(self, data: dict, status: int = 200, headers: Optional[dict] = None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _latency(self, payload: dict) -> float:
+        """seconds before the answer starts, override to simulate server side caching"""
+        return self.latency
+
+    def _usage(self, payload: dict) -> dict:
+        prompt = payload.get("prompt") or " ".join(m.get("content") or "" for m in payload.get("messages", []))
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(self.answer.split())
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _tool_calls(self, payload: dict) -> list:
+        """call every tool offered, unless the last message already is a tool result"""
+        messages = payload.get("messages") or []
+        if not payload.get("tools") or payload.get("tool_choice") == "none" or \
+                (messages and messages[-1].get("role") == "tool"):
+            return []
+        return [{"id": f"call_{idx}", "type": "function",
+                 "function": {"name": tool["function"]["name"], "arguments": "{}"}}
+                for idx, tool in enumerate(payload["tools"])]
+
+    def _send_stream(self, chat: bool, payload: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        calls = self._tool_calls(payload) if chat else []
+        words = (self.tool_preamble if calls else self.answer).split(" ")
+        step = max(1, self.tokens_per_chunk)
+        for idx in range(0, len(words), step):
+            token = " ".join(words[idx:idx + step])
+            token = token if idx == 0 else " " + token  # tokens carry the leading space
+            choice = {"delta": {"content": token}} if chat else {"text": token}
+            self._write_chunk(f"data: {json.dumps({'choices': [choice]})}\n\n")
+            if self.token_delay or self.jitter:
+                self._sleep(self.token_delay)
+        for idx, call in enumerate(calls):
+            # the name first, then the arguments in two fragments
+            fragments = [{"index": idx, "id": call["id"], "type": "function",
+                          "function": {"name": call["function"]["name"], "arguments": ""}},
+                         {"index": idx, "function": {"arguments": call["function"]["arguments"][:1]}},
+                         {"index": idx, "function": {"arguments": call["function"]["arguments"][1:]}}]
+            for fragment in fragments:
+                self._write_chunk(f"data: {json.dumps({'choices': [{'delta': {'tool_calls': [fragment]}}]})}\n\n")
+        finish = "tool_calls" if calls else "stop"
+        choice = {"delta": {}, "finish_reason": finish} if chat else {"text": "", "finish_reason": finish}
+        self._write_chunk(f"data: {json.dumps({'choices': [choice]})}\n\n")
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': self._usage(payload)})}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data: str):
+        data = data.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("utf-8") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        chat = self.path.endswith("/chat/completions")
+        if not chat and not self.path.endswith("/completions"):
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+            return
+        delay = self._latency(payload)
+        if delay or self.jitter:
+            self._sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else None
+            self._send_json({"error": {"message": "injected failure"}}, status=self.error_status, headers=headers)
+            return
+        if payload.get("stream"):
+            try:
+                self._send_stream(chat, payload)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # client stopped reading early
+            return
+        calls = self._tool_calls(payload) if chat else []
+        if calls:
+            choice = {"message": {"role": "assistant", "content": self.tool_preamble, "tool_calls": calls},
+                      "finish_reason": "tool_calls"}
+        elif chat:
+            choice = {"message": {"role": "assistant", "content": self.answer}}
+        else:
+            choice = {"text": self.answer}
+        self._send_json({"choices": [choice], "usage": self._usage(payload)})
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # clients dropping connections is expected
+            super().handle_error(request, client_address)
+
+
+def make_handler(**settings) -> type:
+    """MockHandler subclass with the given class attributes, eg. make_handler(latency=0.2, error_rate=0.1)"""
+    unknown = [k for k in settings if not hasattr(MockHandler, k)]
+    if unknown:
+        raise ValueError(f"unknown mock settings: {unknown}")
+    return type("ConfiguredHandler", (MockHandler,), settings)
+
+
+def start_server(port: int = 0, handler=MockHandler) -> ThreadingHTTPServer:
+    """start the mock server in a daemon thread, api_url is f"http://127.0.0.1:{server.server_port}/v1" """
+    server = MockServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--tokens-per-chunk", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+    server = MockServer(("127.0.0.1", args.port), make_handler(
+        latency=args.latency, jitter=args.jitter, token_delay=args.token_delay,
+        tokens_per_chunk=args.tokens_per_chunk, error_rate=args.error_rate, error_status=args.error_status))
+    print(f"api_url: http://127.0.0.1:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
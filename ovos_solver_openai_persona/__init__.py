@@ -11,17 +11,19 @@ class OpenAIPersonaSolver(OpenAIChatCompletionsSolver):
         super().__init__(config=config)
         self.default_persona = config.get("persona") or "helpful, creative, clever, and very friendly."
 
-    def get_chat_history(self, persona=None):
+    def get_chat_history(self, persona=None, session_id: Optional[str] = None):
         persona = persona or self.default_persona
         initial_prompt = f"You are a helpful assistant. " \
                          f"You give short and factual answers. " \
                          f"You are {persona}"
-        return super().get_chat_history(initial_prompt)
+        return super().get_chat_history(initial_prompt, session_id=session_id)
 
     # officially exported Solver methods
     def get_spoken_answer(self, query: str,
                           lang: Optional[str] = None,
-                          units: Optional[str] = None) -> Optional[str]:
+                          units: Optional[str] = None,
+                          params: Optional[dict] = None,
+                          session_id: Optional[str] = None) -> Optional[str]:
         """
         Obtain the spoken answer for a given query.
 
@@ -29,11 +31,13 @@ class OpenAIPersonaSolver(OpenAIChatCompletionsSolver):
             query (str): The query text.
             lang (Optional[str]): Optional language code. Defaults to None.
             units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones. Defaults to None.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
 
         Returns:
             str: The spoken answer as a text response.
         """
-        answer = super().get_spoken_answer(query, lang, units)
+        answer = super().get_spoken_answer(query, lang, units, params=params, session_id=session_id)
         if not answer or not answer.strip("?") or not answer.strip("_"):
             return None
         return answer
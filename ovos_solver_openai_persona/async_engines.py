@@ -0,0 +1,419 @@
+import asyncio
+import time
+from functools import partial
+from typing import Any, Callable, Optional, AsyncIterable, Union
+
+from ovos_utils.log import LOG
+
+from ovos_solver_openai_persona.endpoints import Endpoint
+from ovos_solver_openai_persona.engines import OpenAIChatCompletionsSolver, MessageList, \
+    _ChatAnswer, _StreamAttempt, _auth_headers, _http_error, _parse_content, _parse_message, \
+    _queue_deadline, _record_admission, _record_answer, _record_failure
+from ovos_solver_openai_persona.cache import cache_key
+from ovos_solver_openai_persona.memory import get_session_id
+from ovos_solver_openai_persona.scheduler import PRIORITY_BACKGROUND
+from ovos_solver_openai_persona.singleflight import AsyncSingleFlight
+from ovos_solver_openai_persona.tools import ToolCalls
+from ovos_solver_openai_persona.transport import get_async_session, DEFAULT_POOL_SIZE, \
+    DEFAULT_RETRIES, DEFAULT_BACKOFF
+
+
+class AsyncOpenAIChatCompletionsSolver(OpenAIChatCompletionsSolver):
+    """asyncio flavour of OpenAIChatCompletionsSolver
+
+    shares config, chat history, payload building and stream parsing with the
+    blocking solver, only the IO is done with a pooled aiohttp session so one
+    event loop can serve many overlapping sessions without a thread per call
+
+    NOTE: requires aiohttp, 'pip install ovos-openai-plugin[async]'
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.single_flight is not None:
+            self.single_flight = AsyncSingleFlight()
+
+    def _get_async_session(self, endpoint: Optional[Endpoint] = None):
+        return get_async_session((endpoint or self.endpoints.primary).api_url,
+                                 pool_size=self.config.get("pool_size", DEFAULT_POOL_SIZE),
+                                 timeout=self.timeout)
+
+    @staticmethod
+    async def _blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+        """run func in a worker thread, it does disk or network IO that would stall every session of the loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def _cached_answer_async(self, payload: dict) -> Optional[str]:
+        # a semantic cache embeds the query over http, the sqlite store reads from disk
+        if self.response_cache is None:
+            return None
+        return await self._blocking(self.response_cache.get, payload)
+
+    async def _cache_answer_async(self, payload: dict, answer: Optional[str]):
+        if answer is not None and self.response_cache is not None:
+            await self._blocking(self.response_cache.put, payload, answer)
+
+    async def _memory_io(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """read or write the chat memory, off the loop as it may be a file or a database"""
+        if not self.memory:
+            return func(*args, **kwargs)
+        return await self._blocking(func, *args, **kwargs)
+
+    async def _admit(self, endpoint: Endpoint, priority: int, deadline: Optional[float]) -> bool:
+        """wait for a free slot on endpoint, False if the request was shed"""
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if self.metrics.enabled:
+            self.metrics.set("llm_queue_depth", endpoint.scheduler.queued, endpoint=endpoint.api_url)
+        start = time.monotonic()
+        admitted = await endpoint.scheduler.acquire_async(priority, timeout)
+        return _record_admission(self, endpoint, priority, admitted, time.monotonic() - start)
+
+    async def _post(self, endpoint: Endpoint, path: str, payload: dict):
+        """POST with retry and backoff when the connection could not be made and on 502/503/504
+
+        other answers, 429 included, are returned right away for the caller to
+        pause the endpoint and fail over, a request that reached the server is
+        never replayed after a read timeout or a dropped connection, the server
+        may still be generating it (same as read=0 of the blocking transport)
+        """
+        import aiohttp
+        retries = self.config.get("max_retries", DEFAULT_RETRIES)
+        backoff = self.config.get("retry_backoff", DEFAULT_BACKOFF)
+        url = f"{endpoint.api_url}/{path}"
+        data = self.payload_builder.dumps(payload, model=endpoint.model or payload["model"])
+        for attempt in range(retries + 1):
+            if attempt:
+                self.metrics.inc("llm_retries_total", endpoint=endpoint.api_url)
+            try:
+                response = await self._get_async_session(endpoint).post(url, headers=_auth_headers(endpoint.key),
+                                                                        data=data)
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError) as e:
+                if attempt == retries:
+                    raise e
+                LOG.warning(f"connection to {url} failed, retrying: {e}")
+            else:
+                if response.status not in (502, 503, 504) or attempt == retries:
+                    return response
+                response.release()
+            await asyncio.sleep(backoff * (2 ** attempt))
+
+    # OpenAI API integration
+    async def _do_api_request(self, messages: MessageList, request_priority: Optional[int] = None,
+                              queue_timeout: Optional[float] = None, **params) -> Optional[str]:
+        if self.tools:
+            return await self._complete_with_tools(messages, request_priority, queue_timeout, **params)
+        payload = self._build_payload(messages, **params)
+        if self.single_flight is not None:
+            return await self.single_flight.do(cache_key(payload),
+                                               lambda: self._complete(payload, request_priority, queue_timeout))
+        return await self._complete(payload, request_priority, queue_timeout)
+
+    async def _complete(self, payload: dict, request_priority: Optional[int] = None,
+                        queue_timeout: Optional[float] = None) -> Optional[str]:
+        answer = await self._cached_answer_async(payload)
+        if answer is None:
+            answer = await self._request(payload, _parse_content, request_priority, queue_timeout)
+            await self._cache_answer_async(payload, answer)
+        return answer
+
+    async def _complete_with_tools(self, messages: MessageList, request_priority: Optional[int] = None,
+                                   queue_timeout: Optional[float] = None, **params) -> Optional[str]:
+        """see OpenAIChatCompletionsSolver._complete_with_tools"""
+        for rounds in range(self.max_tool_rounds + 1):
+            payload = self._build_payload(messages, **self._tool_round_params(rounds, params))
+            message = await self._request(payload, _parse_message, request_priority, queue_timeout)
+            if message is None:
+                return None
+            calls = message.get("tool_calls")
+            if not calls:
+                return message.get("content")
+            messages = self._with_tool_calls(messages, message.get("content"), calls)
+            # tools are blocking functions, wait for them off the event loop
+            messages += await asyncio.get_running_loop().run_in_executor(None, self.tools.run, calls)
+        return None
+
+    async def _request(self, payload: dict, parse, request_priority: Optional[int] = None,
+                       queue_timeout: Optional[float] = None):
+        """see engines._post_with_failover"""
+        import aiohttp
+        priority = self._priority(request_priority=request_priority)
+        deadline = _queue_deadline(self, queue_timeout)
+        for endpoint in self.endpoints.candidates():
+            if not await self._admit(endpoint, priority, deadline):
+                continue
+            endpoint.health.acquire()
+            start = time.monotonic()
+            try:
+                response = await self._post(endpoint, "chat/completions", payload)
+                async with response:
+                    if response.status != 200:
+                        failover = _http_error(endpoint, response.status, await response.text(), response.headers)
+                        _record_failure(self, endpoint, status=response.status)
+                        if failover:
+                            continue
+                        return None
+                    data = await response.json(content_type=None)
+                answer = parse(data)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, IndexError, TypeError) as e:
+                _record_failure(self, endpoint, e)
+                continue
+            finally:
+                endpoint.health.release()
+                endpoint.scheduler.release()
+            _record_answer(self, endpoint, endpoint.model or payload["model"], start, data, answer)
+            return answer
+        LOG.error("no endpoint could answer the request")
+        return None
+
+    async def _stream_with_tools(self, messages: MessageList, request_priority: Optional[int] = None,
+                                 queue_timeout: Optional[float] = None,
+                                 **params) -> AsyncIterable[Union[str, ToolCalls]]:
+        """see OpenAIChatCompletionsSolver._stream_with_tools"""
+        if not self.tools:
+            async for chunk in self._do_streaming_api_request(messages, request_priority, queue_timeout, **params):
+                yield chunk
+            return
+        for rounds in range(self.max_tool_rounds + 1):
+            calls, text = None, []
+            stream = self._do_streaming_api_request(messages, request_priority, queue_timeout,
+                                                    **self._tool_round_params(rounds, params))
+            try:
+                async for chunk in stream:
+                    if isinstance(chunk, ToolCalls):
+                        calls = chunk
+                    else:
+                        text.append(chunk)
+                        yield chunk
+            finally:
+                await stream.aclose()
+            if not calls:
+                return
+            submitted = self.tools.submit(calls)
+            yield calls
+            messages = self._with_tool_calls(messages, "".join(text), calls)
+            messages += await asyncio.get_running_loop().run_in_executor(None, self.tools.collect, submitted)
+
+    async def _do_streaming_api_request(self, messages: MessageList, request_priority: Optional[int] = None,
+                                        queue_timeout: Optional[float] = None, **params) -> AsyncIterable[str]:
+        payload = self._build_payload(messages, stream=True, **params)
+        source = self.single_flight.stream(cache_key(payload),
+                                           lambda: self._stream(payload, request_priority, queue_timeout)) \
+            if self.single_flight is not None else self._stream(payload, request_priority, queue_timeout)
+        async for chunk in source:
+            yield chunk
+
+    async def _stream(self, payload: dict, request_priority: Optional[int] = None,
+                      queue_timeout: Optional[float] = None) -> AsyncIterable[str]:
+        """see OpenAIChatCompletionsSolver._stream"""
+        import aiohttp
+        answer = await self._cached_answer_async(payload)
+        if answer is not None:
+            yield answer
+            return
+        priority = self._priority(stream=True, request_priority=request_priority)
+        deadline = _queue_deadline(self, queue_timeout)
+        for endpoint in self.endpoints.candidates():
+            if not await self._admit(endpoint, priority, deadline):
+                continue
+            attempt = _StreamAttempt(self, endpoint, payload)
+            try:
+                async for chunk in self._stream_endpoint(attempt):
+                    yield chunk
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                attempt.failed(e)
+            finally:
+                endpoint.scheduler.release()
+            if attempt.answered:
+                break
+        else:
+            LOG.error("no endpoint could answer the request")
+            return
+        await self._cache_answer_async(payload, self._complete_answer(attempt))
+        calls = self._end_stream(attempt)
+        if calls:
+            yield calls
+
+    async def _stream_endpoint(self, attempt: _StreamAttempt) -> AsyncIterable[str]:
+        """see OpenAIChatCompletionsSolver._stream_endpoint"""
+        attempt.begin()
+        try:
+            response = await self._post(attempt.endpoint, "chat/completions", attempt.payload)
+            async with response:
+                if response.status != 200:
+                    attempt.http_error(response.status, await response.text(), response.headers)
+                    return
+                async for data in response.content.iter_any():
+                    for chunk in attempt.feed(data):
+                        yield chunk
+                    if attempt.parser.done:
+                        break
+                else:
+                    for chunk in attempt.close():
+                        yield chunk
+            attempt.ended()
+        except Exception:
+            attempt.interrupted()
+            raise
+        finally:
+            attempt.finish()
+
+    async def prewarm(self, session_id: Optional[str] = None,
+                      initial_prompt: Optional[str] = None):
+        """
+        Get ready for a query that is about to arrive, eg. call it on wake word.
+
+        see OpenAIChatCompletionsSolver.prewarm, wrap in asyncio.create_task
+        to not wait for it
+
+        Args:
+            session_id (Optional[str]): session the query will belong to. Defaults to the current session.
+            initial_prompt (Optional[str]): system prompt the query will use. Defaults to None.
+        """
+        import aiohttp
+        session_id = session_id or get_session_id()
+        payload = await self._memory_io(self._priming_payload, session_id, initial_prompt)
+        endpoint = self.endpoints.candidates()[0]
+        priming = self.config.get("prefix_priming")
+        # only prime if the backend is idle, never delay a real query for it
+        if priming and not await endpoint.scheduler.acquire_async(PRIORITY_BACKGROUND, timeout=0):
+            LOG.debug(f"{endpoint.api_url} is busy, not priming")
+            return
+        try:
+            if priming:
+                response = await self._post(endpoint, "chat/completions", payload)
+            else:
+                response = await self._get_async_session(endpoint).get(f"{endpoint.api_url}/models",
+                                                                       headers=_auth_headers(endpoint.key))
+            async with response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            LOG.debug(f"prewarm of {endpoint.api_url} failed: {e}")
+        finally:
+            if priming:
+                endpoint.scheduler.release()
+
+    # asbtract Solver methods
+    async def continue_chat(self, messages: MessageList,
+                            lang: Optional[str],
+                            units: Optional[str] = None,
+                            params: Optional[dict] = None,
+                            session_id: Optional[str] = None,
+                            request_priority: Optional[int] = None,
+                            queue_timeout: Optional[float] = None) -> Optional[str]:
+        """Generate a response based on the chat history.
+
+        Args:
+            messages (List[Dict[str, str]]): List of chat messages, each containing 'role' and 'content'.
+            lang (Optional[str]): The language code for the response. If None, will be auto-detected.
+            units (Optional[str]): Optional unit system for numerical values.
+            params (Optional[dict]): generation params overriding the configured ones, eg. {"temperature": 0}.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
+            request_priority (Optional[int]): scheduling priority, lower is admitted first. Defaults to the "request_priority" config.
+            queue_timeout (Optional[float]): seconds to wait for a free slot before giving up. Defaults to the "queue_timeout" config.
+
+        Returns:
+            Optional[str]: The generated response or None if no response could be generated.
+        """
+        messages = self._fit_context(messages)
+        response = await self._do_api_request(messages, request_priority, queue_timeout, **(params or {}))
+        return await self._memory_io(self._handle_answer, messages, response, session_id or get_session_id())
+
+    async def stream_chat_utterances(self, messages: MessageList,
+                                     lang: Optional[str] = None,
+                                     units: Optional[str] = None,
+                                     params: Optional[dict] = None,
+                                     max_sentences: Optional[int] = None,
+                                     max_seconds: Optional[float] = None,
+                                     session_id: Optional[str] = None,
+                                     request_priority: Optional[int] = None,
+                                     queue_timeout: Optional[float] = None) -> AsyncIterable[str]:
+        """
+        Stream utterances for the given chat history as they become available.
+
+        see OpenAIChatCompletionsSolver.stream_chat_utterances for the answer budget
+
+        Args:
+            messages: The chat messages.
+            lang (Optional[str]): Optional language code. Defaults to None.
+            units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones. Defaults to None.
+            max_sentences (Optional[int]): stop after this many utterances. Defaults to the "max_sentences" config.
+            max_seconds (Optional[float]): stop after this many seconds. Defaults to the "max_seconds" config.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
+            request_priority (Optional[int]): scheduling priority, lower is admitted first. Defaults to the "request_priority" config.
+            queue_timeout (Optional[float]): seconds to wait for a free slot before giving up. Defaults to the "queue_timeout" config.
+
+        Returns:
+            AsyncIterable[str]: An async iterable of utterances.
+        """
+        messages = self._fit_context(messages)
+        answer = _ChatAnswer(self, messages, lang, max_sentences, max_seconds,
+                             session_id or get_session_id())
+        stream = self._stream_with_tools(messages, request_priority, queue_timeout, **(params or {}))
+        try:
+            async for chunk in stream:
+                for utt in answer.feed(chunk):
+                    answer.spoken(utt)
+                    yield utt
+                if answer.over_budget():
+                    break
+            else:
+                for utt in answer.flush():
+                    answer.spoken(utt)
+                    yield utt
+                answer.completed = True
+        finally:
+            await stream.aclose()
+            await self._memory_io(answer.remember)
+
+    async def stream_utterances(self, query: str,
+                                lang: Optional[str] = None,
+                                units: Optional[str] = None,
+                                params: Optional[dict] = None,
+                                max_sentences: Optional[int] = None,
+                                max_seconds: Optional[float] = None,
+                                session_id: Optional[str] = None) -> AsyncIterable[str]:
+        """
+        Stream utterances for the given query as they become available.
+
+        Args:
+            query (str): The query text.
+            lang (Optional[str]): Optional language code. Defaults to None.
+            units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones. Defaults to None.
+            max_sentences (Optional[int]): stop after this many utterances. Defaults to the "max_sentences" config.
+            max_seconds (Optional[float]): stop after this many seconds. Defaults to the "max_seconds" config.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
+
+        Returns:
+            AsyncIterable[str]: An async iterable of utterances.
+        """
+        session_id = session_id or get_session_id()
+        messages = await self._memory_io(self.get_messages, query, session_id=session_id)
+        async for utt in self.stream_chat_utterances(messages, lang, units, params=params,
+                                                     max_sentences=max_sentences, max_seconds=max_seconds,
+                                                     session_id=session_id):
+            yield utt
+
+    async def get_spoken_answer(self, query: str,
+                                lang: Optional[str] = None,
+                                units: Optional[str] = None,
+                                params: Optional[dict] = None,
+                                session_id: Optional[str] = None) -> Optional[str]:
+        """
+        Obtain the spoken answer for a given query.
+
+        Args:
+            query (str): The query text.
+            lang (Optional[str]): Optional language code. Defaults to None.
+            units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones. Defaults to None.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
+
+        Returns:
+            str: The spoken answer as a text response.
+        """
+        session_id = session_id or get_session_id()
+        messages = await self._memory_io(self.get_messages, query, session_id=session_id)
+        return await self.continue_chat(messages=messages, lang=lang, units=units, params=params,
+                                        session_id=session_id)
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ovos_utils.log import LOG
+
+# payload keys that do not change the answer
+_IGNORED_KEYS = ("stream", "stream_options", "user", "cache_prompt")
+_SPACES = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _SPACES.sub(" ", text).strip().lower().rstrip("?!. ")
+
+
+def _normalized_payload(payload: dict) -> dict:
+    payload = {k: v for k, v in payload.items() if k not in _IGNORED_KEYS}
+    if "messages" in payload:
+        payload["messages"] = [{"role": m["role"], "content": _normalize(m.get("content") or "")}
+                               for m in payload["messages"]]
+    if "prompt" in payload:
+        payload["prompt"] = _normalize(payload["prompt"])
+    return payload
+
+
+def _hash(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def cache_key(payload: dict) -> str:
+    """key of a request payload, case and whitespace insensitive"""
+    return _hash(_normalized_payload(payload))
+
+
+def _split_query(payload: dict) -> Tuple[str, str]:
+    """(hash of everything but the last query, last query text)"""
+    payload = _normalized_payload(payload)
+    if "messages" in payload:
+        query = payload["messages"][-1]["content"] if payload["messages"] else ""
+        payload["messages"] = payload["messages"][:-1]
+    else:
+        query = payload.pop("prompt", "")
+    return _hash(payload), query
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class LRUStore:
+    """in memory key/value store with LRU and TTL eviction"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if self.ttl and time.time() - entry[0] > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """on disk key/value store with LRU and TTL eviction, survives restarts"""
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl: float = 86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def _db(self):
+        """sqlite connection, opened on first use so that loading the plugin does not touch the disk"""
+        if self._conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, now, now))
+            self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                             "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """cache of LLM answers keyed on the normalized request payload
+
+    requests sampled with temperature > 0 are not cached unless allow_sampling
+    is set, as they are not expected to give the same answer twice
+
+    if an embedder is given, a query missing the exact cache is embedded and
+    compared with previous queries sharing the same model, params and chat
+    history, an answer is reused if the cosine similarity is >= similarity
+    """
+
+    def __init__(self, store=None, allow_sampling: bool = False,
+                 embedder: Optional[Callable[[str], List[float]]] = None,
+                 similarity: float = 0.95):
+        self.store = store if store is not None else LRUStore()
+        self.allow_sampling = allow_sampling
+        # the query is embedded on lookup and again when storing the answer
+        self.embedder = lru_cache(maxsize=128)(embedder) if embedder is not None else None
+        self.similarity = similarity
+        # context hash -> {cache key: query embedding}, only kept in memory
+        self._vectors: Dict[str, Dict[str, List[float]]] = {}
+        # cache key -> context hash, least recently used first, at most as many vectors as store entries
+        self._vector_order: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "skipped": 0}
+
+    @staticmethod
+    def from_config(config: dict, embedder: Optional[Callable[[str], List[float]]] = None) -> "ResponseCache":
+        max_entries = config.get("cache_size", 256)
+        ttl = config.get("cache_ttl", 3600)
+        if config.get("cache_path"):
+            store = SQLiteStore(os.path.expanduser(config["cache_path"]), max_entries=max_entries, ttl=ttl)
+        else:
+            store = LRUStore(max_entries=max_entries, ttl=ttl)
+        return ResponseCache(store,
+                             allow_sampling=config.get("cache_allow_sampling", False),
+                             embedder=embedder if config.get("cache_semantic") else None,
+                             similarity=config.get("cache_similarity", 0.95))
+
+    def cacheable(self, payload: dict) -> bool:
+        return self.allow_sampling or not payload.get("temperature", 1)
+
+    def get(self, payload: dict) -> Optional[str]:
+        if not self.cacheable(payload):
+            self.stats["skipped"] += 1
+            return None
+        key = cache_key(payload)
+        answer = self.store.get(key)
+        if answer is not None:
+            self._touch_vector(key)
+        elif self.embedder is not None:
+            answer = self._semantic_get(payload)
+            if answer is not None:
+                self.stats["semantic_hits"] += 1
+        self.stats["hits" if answer is not None else "misses"] += 1
+        return answer
+
+    def put(self, payload: dict, answer: str):
+        if not answer or not self.cacheable(payload):
+            return
+        key = cache_key(payload)
+        self.store.put(key, answer)
+        if self.embedder is not None:
+            context, query = _split_query(payload)
+            try:
+                vector = self.embedder(query)
+            except Exception as e:
+                LOG.warning(f"failed to embed query for response cache: {e}")
+                return
+            with self._lock:
+                self._vectors.setdefault(context, {})[key] = vector
+                self._vector_order[key] = context
+                self._vector_order.move_to_end(key)
+                # the store evicted its least recently used entries too
+                while len(self._vector_order) > getattr(self.store, "max_entries", 256):
+                    old_key, old_context = self._vector_order.popitem(last=False)
+                    self._drop_vector(old_key, old_context)
+
+    def _drop_vector(self, key: str, context: str):
+        vectors = self._vectors.get(context)
+        if vectors is not None:
+            vectors.pop(key, None)
+            if not vectors:
+                del self._vectors[context]
+
+    def _touch_vector(self, key: str):
+        with self._lock:
+            if key in self._vector_order:
+                self._vector_order.move_to_end(key)
+
+    def _forget_vector(self, key: str):
+        """the store no longer has the answer of key, evicted or expired"""
+        with self._lock:
+            context = self._vector_order.pop(key, None)
+            if context is not None:
+                self._drop_vector(key, context)
+
+    def _semantic_get(self, payload: dict) -> Optional[str]:
+        context, query = _split_query(payload)
+        with self._lock:
+            candidates = list(self._vectors.get(context, {}).items())
+        if not candidates:
+            return None
+        try:
+            vector = self.embedder(query)
+        except Exception as e:
+            LOG.warning(f"failed to embed query for response cache: {e}")
+            return None
+        scored = sorted(((_cosine(vector, v), k) for k, v in candidates), reverse=True)
+        for score, key in scored:
+            if score < self.similarity:
+                break
+            answer = self.store.get(key)
+            if answer is not None:
+                self._touch_vector(key)
+                return answer
+            # the answer is gone, try the next most similar query
+            self._forget_vector(key)
+        return None
+
+    def clear(self):
+        self.store.clear()
+        with self._lock:
+            self._vectors.clear()
+            self._vector_order.clear()
@@ -0,0 +1,130 @@
+import math
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from ovos_utils.log import LOG
+
+MessageList = List[Dict[str, str]]  # for typing
+
+MESSAGE_OVERHEAD = 4  # role and separators added by the chat template, per message
+REPLY_OVERHEAD = 3  # every reply is primed with <|start|>assistant<|message|>
+MIN_COMPRESSED_TOKENS = 32  # below this a truncated message is not worth keeping
+
+
+class TokenCounter:
+    """count tokens with tiktoken if installed, else with a fast chars/4 heuristic
+
+    counts are cached per text, chat history is re-counted on every turn
+    """
+
+    def __init__(self, model: Optional[str] = None, tokenizer: str = "auto", cache_size: int = 4096):
+        self.model = model
+        self.tokenizer = tokenizer  # "auto", "tiktoken" or "heuristic"
+        self._encoding = None
+        self._loaded = False
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+
+    @property
+    def encoding(self):
+        """tiktoken encoding, imported on first use"""
+        if not self._loaded:
+            self._loaded = True
+            if self.tokenizer != "heuristic":
+                try:
+                    import tiktoken
+                    try:
+                        self._encoding = tiktoken.encoding_for_model(self.model)
+                    except KeyError:  # not an OpenAI model, close enough for budgeting
+                        self._encoding = tiktoken.get_encoding("cl100k_base")
+                except ImportError:
+                    if self.tokenizer == "tiktoken":
+                        LOG.warning("tiktoken not installed, estimating token counts")
+        return self._encoding
+
+    def _count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / 4)
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        return self.count(message.get("content") or "") + MESSAGE_OVERHEAD
+
+    def count_messages(self, messages: MessageList) -> int:
+        return sum(self.count_message(m) for m in messages) + REPLY_OVERHEAD
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """keep the start of text, cut to roughly max_tokens"""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+        return text[:max_tokens * 4]
+
+    def tail(self, text: str, max_tokens: int) -> str:
+        """keep the end of text, cut to roughly max_tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[-max_tokens:])
+        return text[-max_tokens * 4:]
+
+
+class ContextBuilder:
+    """fit a chat message list into a token budget
+
+    leading system messages and the last message (the current query) are
+    always kept, history is dropped oldest first; the answer of the oldest
+    turn that does not fit anymore is truncated instead of dropped if enough
+    budget remains
+    """
+
+    def __init__(self, counter: TokenCounter, max_tokens: Optional[int] = None):
+        self.counter = counter
+        self.max_tokens = max_tokens
+
+    def fit(self, messages: MessageList) -> Tuple[MessageList, Dict[str, int]]:
+        """
+        Args:
+            messages: chat messages, system prompt first and query last
+
+        Returns:
+            (the messages that fit the budget, token counts of the returned messages)
+        """
+        n_system = 0
+        while n_system < len(messages) and messages[n_system]["role"] == "system":
+            n_system += 1
+        system, history = messages[:n_system], messages[n_system:]
+        query = history[-1:] if history and history[-1]["role"] == "user" else []
+        history = history[:len(history) - len(query)]
+
+        pinned = self.counter.count_messages(system + query)
+        budget = (self.max_tokens - pinned) if self.max_tokens else math.inf
+        kept = []
+        used = 0
+        for idx in range(len(history) - 1, -1, -1):
+            msg = history[idx]
+            tokens = self.counter.count_message(msg)
+            if used + tokens <= budget:
+                kept.append(msg)
+                used += tokens
+                continue
+            # compress the answer, but only if the question that prompted it also fits
+            question = history[idx - 1] if idx and msg["role"] == "assistant" else None
+            if question is not None and question["role"] == "user":
+                q_tokens = self.counter.count_message(question)
+                remaining = budget - used - q_tokens - MESSAGE_OVERHEAD - 1  # 1 token for "..."
+                if remaining >= MIN_COMPRESSED_TOKENS:
+                    content = self.counter.truncate(msg["content"], remaining) + "..."
+                    kept.append({**msg, "content": content})
+                    kept.append(question)
+                    used += self.counter.count_message(kept[-2]) + q_tokens
+            break
+        kept.reverse()
+        # do not start the history with a dangling assistant answer
+        while kept and kept[0]["role"] == "assistant":
+            used -= self.counter.count_message(kept.pop(0))
+
+        stats = {"system": self.counter.count_messages(system) - REPLY_OVERHEAD,
+                 "history": used,
+                 "query": self.counter.count_messages(query) - REPLY_OVERHEAD,
+                 "dropped": len(history) - len(kept)}
+        stats["total"] = stats["system"] + stats["history"] + stats["query"] + REPLY_OVERHEAD
+        return system + kept + query, stats
@@ -1,19 +1,170 @@
-from typing import Tuple
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from ovos_plugin_manager.templates.transformers import DialogTransformer
+from ovos_utils.log import LOG
 
-from ovos_solver_openai_persona import OpenAIChatCompletionsSolver
+from ovos_solver_openai_persona.engines import MessageList, get_shared_engine
+from ovos_solver_openai_persona.payload import generation_params
+from ovos_solver_openai_persona.cache import LRUStore, SQLiteStore
+from ovos_solver_openai_persona.scheduler import PRIORITY_BACKGROUND
+
+BATCH_ANSWER_OVERHEAD = 16  # tokens of the JSON list around the rewrites
+REWRITE_OVERHEAD = 8  # quotes and separator of a rewrite in the JSON list
+
+# settings of the dialog transformer itself, not passed on to its chat engine
+_TRANSFORMER_KEYS = ("rewrite_prompt", "rewrite_cache_size", "rewrite_cache_ttl", "rewrite_cache_path",
+                     "rewrite_batch_size")
+
+_LANG_DIR = re.compile(r"^[a-z]{2,3}([-_][a-zA-Z]{2,4})?$")
+
+
+def rewrite_key(prompt: str, dialog: str, lang: Optional[str] = None) -> str:
+    """cache key of a rewritten dialog"""
+    data = "\0".join((prompt.strip(), dialog.strip(), (lang or "").lower()))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def iter_dialog_files(paths: Iterable[str]) -> Iterable[Tuple[str, Optional[str]]]:
+    """(dialog line, lang) for every static line of the .dialog files found under paths
+
+    lines with {placeholders} are skipped, they are only known once rendered,
+    (a|b) alternatives are expanded, the lang is taken from the locale folder
+    """
+    from ovos_utils.bracket_expansion import expand_template
+    for path in paths:
+        for root, _, files in os.walk(os.path.expanduser(path)):
+            lang = os.path.basename(root)
+            lang = lang.lower().replace("_", "-") if _LANG_DIR.match(lang) else None
+            for name in sorted(files):
+                if not name.endswith(".dialog"):
+                    continue
+                with open(os.path.join(root, name), encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line or line.startswith("#") or "{" in line:
+                            continue
+                        for dialog in expand_template(line):
+                            if dialog.strip():
+                                yield dialog.strip(), lang
 
 
 class OpenAIDialogTransformer(DialogTransformer):
     def __init__(self, name="ovos-dialog-transformer-openai-plugin", priority=10, config=None):
         super().__init__(name, priority, config)
-        self.solver = OpenAIChatCompletionsSolver({
-            "key": self.config.get("key"),
-            'api_url': self.config.get('api_url', 'https://api.openai.com/v1'),
-            "enable_memory": False,
-            "initial_prompt": "your task is to rewrite text as if it was spoken by a different character"
-        })
+        self.solver = get_shared_engine(self.config, plugin_keys=_TRANSFORMER_KEYS)
+        self.initial_prompt = "your task is to rewrite text as if it was spoken by a different character"
+        # rewrites can wait while the endpoint is busy answering someone
+        self.request_priority = self.config.get("request_priority", PRIORITY_BACKGROUND)
+        self.queue_timeout = self.config.get("queue_timeout")
+        # skills speak the same dialog over and over, rewrites are kept across calls
+        max_entries = self.config.get("rewrite_cache_size", 1024)
+        ttl = self.config.get("rewrite_cache_ttl", 0)  # 0 never expires
+        if self.config.get("rewrite_cache_path"):
+            self.rewrite_cache = SQLiteStore(os.path.expanduser(self.config["rewrite_cache_path"]),
+                                             max_entries=max_entries, ttl=ttl)
+        else:
+            self.rewrite_cache = LRUStore(max_entries=max_entries, ttl=ttl)
+        self.batch_size = self.config.get("rewrite_batch_size", 20)
+        # generation settings of the transformer config, eg. "temperature" or "max_tokens"
+        self.params = generation_params(self.config)
+
+    def _messages(self, query: str) -> MessageList:
+        return [{"role": "system", "content": self.initial_prompt},
+                {"role": "user", "content": query}]
+
+    def _ask(self, query: str, lang: Optional[str] = None, params: Optional[dict] = None) -> Optional[str]:
+        return self.solver.continue_chat(self._messages(query), lang=lang, params=params or self.params,
+                                         request_priority=self.request_priority, queue_timeout=self.queue_timeout)
+
+    def _get_prompt(self, context: Optional[dict] = None) -> Optional[str]:
+        return (context or {}).get("prompt") or self.config.get("rewrite_prompt")
+
+    def rewrite(self, dialog: str, prompt: str, lang: Optional[str] = None) -> str:
+        """rewrite a single dialog, from cache if possible, the dialog is returned as is on failure"""
+        key = rewrite_key(prompt, dialog, lang)
+        rewritten = self.rewrite_cache.get(key)
+        if rewritten is not None:
+            return rewritten
+        rewritten = self._ask(f"{prompt} : {dialog}", lang=lang)
+        if not rewritten:
+            return dialog
+        self.rewrite_cache.put(key, rewritten)
+        return rewritten
+
+    def _rewrite_batch(self, dialogs: List[str], prompt: str, lang: Optional[str] = None) -> List[Optional[str]]:
+        """rewrite several dialogs with a single request, None for dialogs the answer did not include"""
+        query = (f"{prompt}. Rewrite each of the following texts. "
+                 f"Answer only with a JSON list of strings, in the same order:\n"
+                 f"{json.dumps(dialogs, ensure_ascii=False)}")
+        # a rewrite is about as long as the dialog, leave room for twice that so the list is not cut short
+        counter = self.solver.token_counter
+        max_tokens = BATCH_ANSWER_OVERHEAD + sum(2 * counter.count(d) + REWRITE_OVERHEAD for d in dialogs)
+        params = {**self.params, "max_tokens": max(max_tokens, self.params.get("max_tokens", 0))}
+        answer = self._ask(query, lang=lang, params=params)
+        if not answer:
+            return [None] * len(dialogs)
+        try:
+            rewritten = json.loads(answer[answer.index("["):answer.rindex("]") + 1])
+        except (TypeError, ValueError):
+            LOG.warning("could not parse batched rewrite, rewriting one by one")
+            return [None] * len(dialogs)
+        if len(rewritten) != len(dialogs):
+            LOG.warning(f"batched rewrite returned {len(rewritten)} texts for {len(dialogs)} dialogs")
+            return [None] * len(dialogs)
+        return [r.strip() if isinstance(r, str) and r.strip() else None for r in rewritten]
+
+    def transform_batch(self, dialogs: List[str], context: dict = None) -> List[str]:
+        """
+        Rewrite many dialogs, sending only the ones not cached, rewrite_batch_size per request
+
+        :param dialogs: utterances to mutate before TTS
+        :param context: optional "prompt" and "lang"
+        :returns: the mutated dialogs, in the same order
+        """
+        context = context or {}
+        prompt = self._get_prompt(context)
+        if not prompt:
+            return list(dialogs)
+        lang = context.get("lang")
+        results: List[Optional[str]] = [self.rewrite_cache.get(rewrite_key(prompt, d, lang)) for d in dialogs]
+        missing = list(dict.fromkeys(d for d, r in zip(dialogs, results) if r is None))
+        rewritten: Dict[str, str] = {}
+        for idx in range(0, len(missing), self.batch_size):
+            batch = missing[idx:idx + self.batch_size]
+            for dialog, r in zip(batch, self._rewrite_batch(batch, prompt, lang)):
+                if r is None:
+                    rewritten[dialog] = self.rewrite(dialog, prompt, lang)
+                else:
+                    self.rewrite_cache.put(rewrite_key(prompt, dialog, lang), r)
+                    rewritten[dialog] = r
+        return [r if r is not None else rewritten[d] for d, r in zip(dialogs, results)]
+
+    def prewarm(self, paths: Iterable[str], prompt: Optional[str] = None, lang: Optional[str] = None) -> int:
+        """
+        Fill the rewrite cache with the static dialogs found in the .dialog files under paths
+
+        :param paths: skill folders or locale folders
+        :param prompt: the rewrite prompt, defaults to "rewrite_prompt" from config
+        :param lang: lang of dialog files that are not in a locale folder
+        :returns: number of dialogs in the cache for these files
+        """
+        prompt = prompt or self.config.get("rewrite_prompt")
+        if not prompt:
+            raise ValueError("rewrite_prompt not set")
+        by_lang: Dict[Optional[str], List[str]] = {}
+        for dialog, dialog_lang in iter_dialog_files(paths):
+            by_lang.setdefault(dialog_lang or lang, []).append(dialog)
+        total = 0
+        for dialog_lang, dialogs in by_lang.items():
+            dialogs = list(dict.fromkeys(dialogs))
+            LOG.info(f"pre-warming {len(dialogs)} dialogs ({dialog_lang})")
+            self.transform_batch(dialogs, {"prompt": prompt, "lang": dialog_lang})
+            total += len(dialogs)
+        return total
 
     def transform(self, dialog: str, context: dict = None) -> Tuple[str, dict]:
         """
@@ -21,7 +172,32 @@ class OpenAIDialogTransformer(DialogTransformer):
         :param dialog: str utterance to mutate before TTS
         :returns: str mutated dialog
         """
-        prompt = context.get("prompt") or self.config.get("rewrite_prompt")
+        context = context or {}
+        prompt = self._get_prompt(context)
         if not prompt:
             return dialog, context
-        return self.solver.get_spoken_answer(f"{prompt} : {dialog}", lang=context.get("lang")), context
+        return self.rewrite(dialog, prompt, lang=context.get("lang")), context
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="rewrite the dialog files of skills ahead of time, "
+                                                 "filling the persistent rewrite cache of the dialog transformer")
+    parser.add_argument("paths", nargs="+", help="skill or locale folders containing .dialog files")
+    parser.add_argument("--prompt", help="rewrite prompt, defaults to 'rewrite_prompt' from mycroft.conf")
+    parser.add_argument("--lang", help="lang of dialog files outside of a locale folder")
+    parser.add_argument("--cache-path", help="defaults to 'rewrite_cache_path' from mycroft.conf")
+    args = parser.parse_args()
+
+    from ovos_config import Configuration
+    config = dict(Configuration().get("dialog_transformers", {}).get("ovos-dialog-transformer-openai-plugin") or {})
+    if args.cache_path:
+        config["rewrite_cache_path"] = args.cache_path
+    if not config.get("rewrite_cache_path"):
+        parser.error("rewrite_cache_path not set, the rewrites would be lost on exit")
+    transformer = OpenAIDialogTransformer(config=config)
+    print(f"{transformer.prewarm(args.paths, args.prompt, args.lang)} dialogs cached")
+
+
+if __name__ == "__main__":
+    main()
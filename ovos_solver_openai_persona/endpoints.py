@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ovos_utils.log import LOG
+
+from ovos_solver_openai_persona.scheduler import EndpointScheduler, get_scheduler
+
+STRATEGIES = ("priority", "least_outstanding", "latency")
+
+
+class EndpointHealth:
+    """live state of a backend, shared by every plugin talking to the same url
+
+    tracks in-flight requests, an EWMA of the latency and a circuit breaker
+    that stops routing to the backend for cooldown seconds after
+    failure_threshold consecutive failures, then lets a single trial
+    request through per cooldown window until one succeeds
+    """
+
+    def __init__(self, url: str, failure_threshold: int = 3, cooldown: float = 30, alpha: float = 0.3):
+        self.url = url
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # EWMA in seconds
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.failure_threshold
+
+    def available(self) -> bool:
+        with self._lock:
+            if not self.is_open:
+                return True
+            now = time.monotonic()
+            if now < self.open_until:
+                return False
+            # half-open, let one request per cooldown window probe the backend
+            self.open_until = now + self.cooldown
+            return True
+
+    def acquire(self):
+        with self._lock:
+            self.outstanding += 1
+
+    def release(self):
+        with self._lock:
+            self.outstanding -= 1
+
+    def record_success(self, latency: float):
+        with self._lock:
+            if self.is_open:
+                LOG.info(f"endpoint {self.url} recovered")
+            self.failures = 0
+            self.latency = latency if self.latency is None else \
+                self.alpha * latency + (1 - self.alpha) * self.latency
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.is_open:
+                if self.failures == self.failure_threshold:
+                    LOG.warning(f"endpoint {self.url} failed {self.failures} times, "
+                                f"not used for {self.cooldown} seconds")
+                self.open_until = time.monotonic() + self.cooldown
+
+
+_HEALTH: Dict[str, EndpointHealth] = {}
+_LOCK = threading.Lock()
+
+
+def get_health(url: str, failure_threshold: int = 3, cooldown: float = 30) -> EndpointHealth:
+    """process wide EndpointHealth for a backend url"""
+    url = url.rstrip("/")
+    with _LOCK:
+        if url not in _HEALTH:
+            _HEALTH[url] = EndpointHealth(url, failure_threshold, cooldown)
+        return _HEALTH[url]
+
+
+class Endpoint:
+    """an OpenAI compatible backend as configured for a plugin"""
+
+    def __init__(self, api_url: str, key: str,
+                 weight: float = 1.0,
+                 priority: int = 0,
+                 model: Optional[str] = None,
+                 health: Optional[EndpointHealth] = None,
+                 scheduler: Optional[EndpointScheduler] = None):
+        self.api_url = api_url.rstrip("/")
+        self.key = key
+        self.weight = weight or 1.0
+        self.priority = priority
+        self.model = model
+        self.health = health or get_health(self.api_url)
+        self.scheduler = scheduler or get_scheduler(self.api_url)
+
+    def __repr__(self):
+        return f"Endpoint({self.api_url})"
+
+
+class EndpointPool:
+    """pick the order in which configured backends are tried
+
+    strategies:
+        priority: lowest priority value first, weighted random among equals
+        least_outstanding: fewest in-flight requests per unit of weight first
+        latency: lowest latency EWMA per unit of weight first, untried backends first
+
+    backends with an open circuit breaker are skipped, unless all of them are
+    """
+
+    def __init__(self, endpoints: List[Endpoint], strategy: str = "priority"):
+        if not endpoints:
+            raise ValueError("at least one endpoint must be configured")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown routing strategy '{strategy}', must be one of {STRATEGIES}")
+        self.endpoints = endpoints
+        self.strategy = strategy
+
+    @staticmethod
+    def from_config(config: dict) -> "EndpointPool":
+        """
+        build the pool from the "endpoints" list, each entry accepting
+        "api_url", "key", "weight", "priority", "model", "max_in_flight",
+        "rate_limit" and "rate_burst", missing values default to the top
+        level config; without "endpoints" the top level "api_url" and "key"
+        are the only backend
+        """
+        threshold = config.get("circuit_breaker_failures", 3)
+        cooldown = config.get("circuit_breaker_cooldown", 30)
+        entries = config.get("endpoints") or [{}]
+        endpoints = []
+        for entry in entries:
+            api_url = entry.get("api_url") or config.get("api_url", "https://api.openai.com/v1")
+            endpoints.append(Endpoint(api_url, entry.get("key") or config.get("key"),
+                                      weight=entry.get("weight", 1.0),
+                                      priority=entry.get("priority", 0),
+                                      model=entry.get("model"),
+                                      health=get_health(api_url, threshold, cooldown),
+                                      scheduler=get_scheduler(
+                                          api_url,
+                                          max_in_flight=entry.get("max_in_flight", config.get("max_in_flight")),
+                                          rate=entry.get("rate_limit", config.get("rate_limit")),
+                                          burst=entry.get("rate_burst", config.get("rate_burst")))))
+        return EndpointPool(endpoints, config.get("routing", "priority"))
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def _order(self, endpoints: List[Endpoint]) -> List[Endpoint]:
+        if len(endpoints) < 2:
+            return endpoints
+        if self.strategy == "least_outstanding":
+            return sorted(endpoints, key=lambda e: (e.health.outstanding / e.weight, e.priority))
+        if self.strategy == "latency":
+            return sorted(endpoints, key=lambda e: ((e.health.latency or 0) / e.weight, e.priority))
+        # weighted random shuffle, then stable sort by priority
+        keyed = sorted(endpoints, key=lambda e: random.random() ** (1 / e.weight), reverse=True)
+        return sorted(keyed, key=lambda e: e.priority)
+
+    def candidates(self) -> List[Endpoint]:
+        """endpoints to try, in order"""
+        healthy = [e for e in self.endpoints if e.health.available()]
+        if not healthy:
+            # every circuit is open, better to try than to fail without asking
+            return self._order(self.endpoints)
+        return self._order(healthy)
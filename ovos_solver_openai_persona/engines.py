@@ -1,5 +1,8 @@
 import json
-from typing import Optional, Iterable, List, Dict
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Iterable, List, Dict, Union
 
 import requests
 
@@ -8,9 +11,31 @@ from ovos_plugin_manager.templates.solvers import QuestionSolver
 from ovos_plugin_manager.templates.language import LanguageTranslator, LanguageDetector
 from ovos_utils.log import LOG
 
+from ovos_solver_openai_persona.cache import ResponseCache, cache_key
+from ovos_solver_openai_persona.context import ContextBuilder, TokenCounter
+from ovos_solver_openai_persona.endpoints import Endpoint, EndpointPool
+from ovos_solver_openai_persona.metrics import Metrics
+from ovos_solver_openai_persona.payload import GENERATION_DEFAULTS, GENERATION_OPTIONAL, PayloadBuilder
+from ovos_solver_openai_persona.scheduler import DEFAULT_RETRY_AFTER, PRIORITY_BACKGROUND, \
+    PRIORITY_INTERACTIVE, PRIORITY_NORMAL, retry_after
+from ovos_solver_openai_persona.memory import ChatMemory, InMemoryChatMemory, PersistentChatMemory, QAPair, \
+    get_session_id
+from ovos_solver_openai_persona.segmenter import SentenceSegmenter
+from ovos_solver_openai_persona.singleflight import SingleFlight
+from ovos_solver_openai_persona.sse import ChatStreamParser
+from ovos_solver_openai_persona.tools import Tool, ToolCalls, ToolRegistry
+from ovos_solver_openai_persona.transport import session_from_config, timeout_from_config
+
 MessageList = List[Dict[str, str]]  # for typing
 
 
+def _auth_headers(key: str) -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": "Bearer " + key
+    }
+
+
 class OpenAICompletionsSolver(QuestionSolver):
     def __init__(self, config=None,
                  translator: Optional[LanguageTranslator] = None,
@@ -23,45 +48,55 @@ class OpenAICompletionsSolver(QuestionSolver):
                          detector=detector, priority=priority,
                          enable_tx=enable_tx, enable_cache=enable_cache,
                          internal_lang=internal_lang)
-        self.api_url = f"{self.config.get('api_url', 'https://api.openai.com/v1')}/completions"
+        self.endpoints = EndpointPool.from_config(self.config)
+        base_url = self.endpoints.primary.api_url
+        self.api_url = f"{base_url}/completions"
+        self.session = session_from_config(base_url, self.config)
+        self.timeout = timeout_from_config(self.config)
         self.engine = self.config.get("model", "text-davinci-002")  # "ada" cheaper and faster, "davinci" better
         self.stop_token = "<|im_end|>"
-        self.key = self.config.get("key")
-        if not self.key:
+        self.key = self.endpoints.primary.key
+        if not all(e.key for e in self.endpoints.endpoints):
             LOG.error("key not set in config")
             raise ValueError("key must be set")
+        self.embeddings_url = f"{base_url}/embeddings"
+        self.response_cache: Optional[ResponseCache] = None
+        if self.config.get("response_cache"):
+            self.response_cache = ResponseCache.from_config(self.config, embedder=self._embed)
+        self.metrics = Metrics.from_config(self.config, persona=self.config.get("persona_name", "default"))
+        self.payload_builder = PayloadBuilder.from_config(self.config, self.engine, self.stop_token)
+        # scheduling priority of the requests, lower is admitted first when the endpoint is busy
+        self.request_priority = self.config.get("request_priority", PRIORITY_NORMAL)
+        self.last_usage: Optional[dict] = None  # usage reported by the last answer, if any
 
     # OpenAI API integration
-    def _do_api_request(self, prompt):
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer " + self.key
-        }
-
-        # TODO - params from config
+    def _embed(self, text: str) -> List[float]:
+        payload = {"model": self.config.get("embedding_model", "text-embedding-3-small"), "input": text}
+        response = self.session.post(self.embeddings_url, data=json.dumps(payload),
+                                     headers={"Content-Type": "application/json",
+                                              "Authorization": "Bearer " + self.key},
+                                     timeout=self.timeout).json()
+        return response["data"][0]["embedding"]
+
+    def _do_api_request(self, prompt, **params):
         # https://platform.openai.com/docs/api-reference/completions/create
-        payload = {
-            "model": self.engine,
-            "prompt": prompt,
-            "max_tokens": 300,
-            "temperature": 1,
-            # between 0 and 2. Higher values like 0.8 will make the output more random, while lower values like 0.2 will make it more focused and deterministic.
-            "top_p": 1,
-            # nucleus sampling alternative to temperature, the model considers the results of the tokens with top_p probability mass. 0.1 means only tokens comprising top 10% probability mass are considered.
-            "n": 1,  # How many completions to generate for each prompt.
-            "frequency_penalty": 0,
-            # Number between -2.0 and 2.0. Positive values penalize new tokens based on their existing frequency in the text so far, decreasing the model's likelihood to repeat the same line verbatim.
-            "presence_penalty": 0,
-            # Number between -2.0 and 2.0. Positive values penalize new tokens based on whether they appear in the text so far, increasing the model's likelihood to talk about new topics.
-            "stop": self.stop_token
-        }
-        response = requests.post(self.api_url, headers=headers, data=json.dumps(payload)).json()
-        return response["choices"][0]["text"]
+        payload = self.payload_builder.build(prompt=prompt, **params)
+        if self.response_cache is not None:
+            answer = self.response_cache.get(payload)
+            if answer is not None:
+                return answer
+        answer = _post_with_failover(self, "completions", payload,
+                                     lambda data: data["choices"][0]["text"],
+                                     priority=self.request_priority)
+        if answer is not None and self.response_cache is not None:
+            self.response_cache.put(payload, answer)
+        return answer
 
     # officially exported Solver methods
     def get_spoken_answer(self, query: str,
                           lang: Optional[str] = None,
-                          units: Optional[str] = None) -> Optional[str]:
+                          units: Optional[str] = None,
+                          params: Optional[dict] = None) -> Optional[str]:
         """
         Obtain the spoken answer for a given query.
 
@@ -69,22 +104,339 @@ class OpenAICompletionsSolver(QuestionSolver):
             query (str): The query text.
             lang (Optional[str]): Optional language code. Defaults to None.
             units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones, eg. {"temperature": 0}. Defaults to None.
 
         Returns:
             str: The spoken answer as a text response.
         """
-        response = self._do_api_request(query)
-        answer = response.strip()
+        response = self._do_api_request(query, **(params or {}))
+        answer = (response or "").strip()
         if not answer or not answer.strip("?") or not answer.strip("_"):
             return None
         return answer
 
 
+def _log_http_error(endpoint: Endpoint, status: int, body: str):
+    try:
+        message = json.loads(body)["error"]["message"]
+    except Exception:
+        message = body[:500]
+    LOG.error(f"{endpoint.api_url} returned an error (HTTP {status}): {message}")
+
+
+def _record_retries(metrics: Metrics, endpoint: Endpoint, response: requests.Response):
+    retries = getattr(response.raw, "retries", None)
+    if retries is not None and retries.history:
+        metrics.inc("llm_retries_total", len(retries.history), endpoint=endpoint.api_url)
+
+
+def _record_usage(solver, model: str, usage: Optional[dict], answer: Union[str, dict, None]):
+    """token spend of an answer, as reported by the server or else estimated"""
+    if usage:
+        prompt, completion, source = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), "usage"
+    elif getattr(solver, "token_counter", None) is not None:
+        prompt = solver.last_context_tokens.get("total", 0)
+        if isinstance(answer, dict):  # a message with tool calls
+            answer = json.dumps(answer, ensure_ascii=False)
+        completion = solver.token_counter.count(answer or "")
+        source = "estimate"
+    else:
+        return
+    solver.metrics.inc("llm_tokens_total", prompt, model=model, kind="prompt", source=source)
+    solver.metrics.inc("llm_tokens_total", completion, model=model, kind="completion", source=source)
+
+
+def _queue_deadline(solver, queue_timeout: Optional[float] = None) -> Optional[float]:
+    """time after which a request still waiting for a slot is shed, None to wait as long as needed"""
+    timeout = solver.config.get("queue_timeout") if queue_timeout is None else queue_timeout
+    return None if timeout is None else time.monotonic() + timeout
+
+
+def _record_admission(solver, endpoint: Endpoint, priority: int, admitted: bool, waited: float) -> bool:
+    metrics = solver.metrics
+    if not admitted:
+        LOG.warning(f"{endpoint.api_url} is busy, request shed after {waited:.2f} seconds in queue")
+        metrics.inc("llm_requests_total", endpoint=endpoint.api_url, outcome="shed")
+    if metrics.enabled:
+        metrics.observe("llm_queue_wait_seconds", waited, endpoint=endpoint.api_url, priority=priority)
+        metrics.set("llm_queue_depth", endpoint.scheduler.queued, endpoint=endpoint.api_url)
+    return admitted
+
+
+def _admit(solver, endpoint: Endpoint, priority: int, deadline: Optional[float]) -> bool:
+    """wait for a free slot on endpoint, False if the request was shed"""
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    if solver.metrics.enabled:
+        solver.metrics.set("llm_queue_depth", endpoint.scheduler.queued, endpoint=endpoint.api_url)
+    start = time.monotonic()
+    admitted = endpoint.scheduler.acquire(priority, timeout)
+    return _record_admission(solver, endpoint, priority, admitted, time.monotonic() - start)
+
+
+def _pause_if_rate_limited(endpoint: Endpoint, status: int, headers) -> Optional[float]:
+    """stop sending requests to endpoint for the Retry-After of a 429, returns the pause"""
+    if status != 429:
+        return None
+    seconds = retry_after(headers.get("Retry-After"))
+    if seconds is None:
+        seconds = DEFAULT_RETRY_AFTER
+    LOG.warning(f"{endpoint.api_url} is rate limiting, pausing requests for {seconds:.1f} seconds")
+    endpoint.scheduler.pause(seconds)
+    return seconds
+
+
+def _http_error(endpoint: Endpoint, status: int, body: str, headers) -> bool:
+    """log a non 200 answer, True if the request may still succeed on another endpoint
+
+    5xx are failures of the endpoint and 429 pauses it, any other answer
+    (bad params, context too long...) rejects the request itself, every
+    endpoint would reject it too
+    """
+    _log_http_error(endpoint, status, body)
+    if _pause_if_rate_limited(endpoint, status, headers) is not None:
+        return True
+    return status >= 500
+
+
+def _endpoint_fault(status: Optional[int]) -> bool:
+    """connection errors, timeouts (no status) and 5xx count against the health of an endpoint"""
+    return status is None or status >= 500
+
+
+def _failure_outcome(status: Optional[int]) -> str:
+    if _endpoint_fault(status):
+        return "error"
+    return "rate_limited" if status == 429 else "rejected"
+
+
+def _record_failure(solver, endpoint: Endpoint, error: Optional[Exception] = None, status: Optional[int] = None):
+    """a request to endpoint failed, with an exception or a non 200 status"""
+    if error is not None:
+        LOG.warning(f"request to {endpoint.api_url} failed: {error}")
+    if _endpoint_fault(status):
+        endpoint.health.record_failure()
+    solver.metrics.inc("llm_requests_total", endpoint=endpoint.api_url, outcome=_failure_outcome(status))
+
+
+def _record_answer(solver, endpoint: Endpoint, model: str, start: float, data: dict, answer):
+    """endpoint answered a (non streamed) request started at start"""
+    latency = time.monotonic() - start
+    endpoint.health.record_success(latency)
+    solver.last_usage = data.get("usage")
+    if solver.metrics.enabled:
+        solver.metrics.inc("llm_requests_total", endpoint=endpoint.api_url, outcome="ok")
+        solver.metrics.observe("llm_request_seconds", latency, endpoint=endpoint.api_url, stream="false")
+        _record_usage(solver, model, solver.last_usage, answer)
+
+
+def _parse_content(data: dict) -> str:
+    return data["choices"][0]["message"]["content"]
+
+
+def _parse_message(data: dict) -> dict:
+    return data["choices"][0]["message"]
+
+
+def _post_with_failover(solver, path: str, payload: dict, parse,
+                        priority: int = PRIORITY_NORMAL,
+                        queue_timeout: Optional[float] = None) -> Optional[str]:
+    """POST payload to the endpoints of a solver in routing order until one answers
+
+    Returns:
+        parse(response json) of the first endpoint that answered, None if all failed or were too busy
+    """
+    deadline = _queue_deadline(solver, queue_timeout)
+    for endpoint in solver.endpoints.candidates():
+        if not _admit(solver, endpoint, priority, deadline):
+            continue
+        model = endpoint.model or payload["model"]
+        data = solver.payload_builder.dumps(payload, model=model)
+        session = session_from_config(endpoint.api_url, solver.config)
+        endpoint.health.acquire()
+        start = time.monotonic()
+        try:
+            response = session.post(f"{endpoint.api_url}/{path}", headers=_auth_headers(endpoint.key),
+                                    data=data, timeout=solver.timeout)
+            if solver.metrics.enabled:
+                _record_retries(solver.metrics, endpoint, response)
+            if response.status_code != 200:
+                failover = _http_error(endpoint, response.status_code, response.text, response.headers)
+                _record_failure(solver, endpoint, status=response.status_code)
+                if failover:
+                    continue
+                return None
+            data = response.json()
+            answer = parse(data)
+        except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+            _record_failure(solver, endpoint, e)
+            continue
+        finally:
+            endpoint.health.release()
+            endpoint.scheduler.release()
+        _record_answer(solver, endpoint, model, start, data, answer)
+        return answer
+    LOG.error("no endpoint could answer the request")
+    return None
+
+
+class _StreamAttempt:
+    """streaming an answer from one endpoint: health, timing and metrics of the attempt
+
+    the IO is done by the blocking or asyncio solver, which feeds the raw
+    bytes received, failures are reported in parser.error
+    """
+
+    def __init__(self, solver, endpoint: Endpoint, payload: dict):
+        self.solver = solver
+        self.endpoint = endpoint
+        self.payload = payload
+        self.model = endpoint.model or payload["model"]
+        self.parser = ChatStreamParser()
+        self.chunks: List[str] = []
+        self.gaps: List[float] = []  # between chunks, reported once at the end of the stream
+        self.start = self.last = 0.0
+        self.status: Optional[int] = None  # of a non 200 answer
+        self.failover = True  # the request may succeed on another endpoint
+
+    def begin(self):
+        self.endpoint.health.acquire()
+        self.start = self.last = time.monotonic()
+
+    def _received(self, chunks: List[str]) -> List[str]:
+        for chunk in chunks:
+            if not self.chunks:
+                self.last = time.monotonic()
+                self.endpoint.health.record_success(self.last - self.start)
+                self.solver.metrics.observe("llm_ttft_seconds", self.last - self.start,
+                                            endpoint=self.endpoint.api_url)
+            elif self.solver.metrics.enabled:
+                now = time.monotonic()
+                self.gaps.append(now - self.last)
+                self.last = now
+            self.chunks.append(chunk)
+        return chunks
+
+    def feed(self, data: bytes) -> List[str]:
+        """text chunks of the answer in the bytes received"""
+        return self._received(self.parser.feed(data))
+
+    def close(self) -> List[str]:
+        """the server closed the stream, text left in the parser"""
+        return self._received(self.parser.close())
+
+    def http_error(self, status: int, body: str, headers):
+        self.failover = _http_error(self.endpoint, status, body, headers)
+        self.status = status
+        self.parser.error = f"HTTP {status}"
+
+    def failed(self, error: Exception):
+        LOG.warning(f"stream from {self.endpoint.api_url} failed: {error}")
+        self.parser.error = str(error)
+
+    def interrupted(self):
+        self.parser.error = self.parser.error or "stream interrupted"
+
+    def ended(self):
+        """the answer was read until the end, or it was not started and failed"""
+        if not self.chunks and not self.parser.error:
+            self.endpoint.health.record_success(time.monotonic() - self.start)
+
+    def finish(self):
+        self.endpoint.health.release()
+        if self.parser.error and not self.chunks and _endpoint_fault(self.status):
+            self.endpoint.health.record_failure()
+        if self.solver.metrics.enabled:
+            self._record(time.monotonic() - self.start)
+
+    def _record(self, latency: float):
+        metrics, url = self.solver.metrics, self.endpoint.api_url
+        metrics.inc("llm_requests_total", endpoint=url,
+                    outcome=_failure_outcome(self.status) if self.parser.error else "ok")
+        metrics.observe_many("llm_inter_chunk_seconds", self.gaps, endpoint=url)
+        if not self.parser.error:
+            metrics.observe("llm_request_seconds", latency, endpoint=url, stream="true")
+        if self.chunks or self.parser.tool_calls:
+            _record_usage(self.solver, self.model, self.parser.usage, "".join(self.chunks))
+
+    @property
+    def answered(self) -> bool:
+        """stop failing over, the answer was (partially) spoken already, there was no error or it was rejected"""
+        if self.chunks or not self.parser.error or not self.failover:
+            return True
+        LOG.info(f"no answer from {self.endpoint.api_url}, trying next endpoint")
+        return False
+
+
+def _over_budget(utterances: List[str], start: float,
+                 max_sentences: Optional[int], max_seconds: Optional[float]) -> bool:
+    """stop streaming once enough was spoken, the time budget only counts once something was"""
+    if max_sentences and len(utterances) >= max_sentences:
+        return True
+    return bool(max_seconds and utterances and time.monotonic() - start >= max_seconds)
+
+
 def post_process_sentence(text: str) -> str:
     text = text.replace("*", "")  # TTS often literally reads "asterisk"
     return text.strip()
 
 
+class _ChatAnswer:
+    """utterances of a streamed chat answer, as they are spoken
+
+    splits the streamed text into sentences, keeps track of the answer budget
+    and remembers what was said, the blocking and asyncio solvers only iterate
+    """
+
+    def __init__(self, solver, messages: MessageList, lang: Optional[str],
+                 max_sentences: Optional[int], max_seconds: Optional[float], session_id: str):
+        self.solver = solver
+        self.start = time.monotonic()
+        self.query = messages[-1]["content"]
+        self.session_id = session_id
+        self.max_sentences = max_sentences if max_sentences is not None else solver.config.get("max_sentences")
+        self.max_seconds = max_seconds if max_seconds is not None else solver.config.get("max_seconds")
+        self.segmenter = solver._get_segmenter(lang)
+        self.utterances: List[str] = []
+        self.chunks: List[str] = []
+        self.completed = False
+
+    def _ready(self, utts: List[Optional[str]]) -> List[str]:
+        utts = [utt for utt in (post_process_sentence(u or "") for u in utts) if utt]
+        if self.max_sentences:
+            utts = utts[:max(0, self.max_sentences - len(self.utterances))]
+        return utts
+
+    def feed(self, chunk: Union[str, ToolCalls]) -> List[str]:
+        """utterances completed by a streamed chunk"""
+        if isinstance(chunk, ToolCalls):
+            # speak what the model said before calling tools while they run
+            self.chunks = []  # only the final answer is remembered
+            return self._ready([self.segmenter.flush()])
+        self.chunks.append(chunk)
+        return self._ready(self.segmenter.feed(chunk))
+
+    def flush(self) -> List[str]:
+        """end of the stream, the last utterance"""
+        return self._ready([self.segmenter.flush()])
+
+    def spoken(self, utt: str):
+        if not self.utterances:
+            self.solver.metrics.observe("llm_first_sentence_seconds", time.monotonic() - self.start)
+        self.utterances.append(utt)
+
+    def over_budget(self) -> bool:
+        if _over_budget(self.utterances, self.start, self.max_sentences, self.max_seconds):
+            LOG.debug(f"answer budget reached after {len(self.utterances)} utterances, closing the stream")
+            return True
+        return False
+
+    def remember(self):
+        # also remember partial answers if the consumer stops listening early, but only what was spoken
+        if self.solver.memory and self.utterances:
+            answer = "".join(self.chunks).strip() if self.completed else " ".join(self.utterances)
+            self.solver.chat_memory.append(self.session_id, self.query, answer)
+
+
 class OpenAIChatCompletionsSolver(ChatMessageSolver):
     def __init__(self, config=None,
                  translator: Optional[LanguageTranslator] = None,
@@ -97,159 +449,479 @@ class OpenAIChatCompletionsSolver(ChatMessageSolver):
                          detector=detector, priority=priority,
                          enable_tx=enable_tx, enable_cache=enable_cache,
                          internal_lang=internal_lang)
-        self.api_url = f"{self.config.get('api_url', 'https://api.openai.com/v1')}/chat/completions"
+        self.endpoints = EndpointPool.from_config(self.config)
+        base_url = self.endpoints.primary.api_url
+        self.api_url = f"{base_url}/chat/completions"
+        self.session = session_from_config(base_url, self.config)
+        self.timeout = timeout_from_config(self.config)
         self.engine = self.config.get("model", "gpt-4o-mini")  # "ada" cheaper and faster, "davinci" better
         self.stop_token = "<|im_end|>"
-        self.key = self.config.get("key")
-        if not self.key:
+        self.key = self.endpoints.primary.key
+        if not all(e.key for e in self.endpoints.endpoints):
             LOG.error("key not set in config")
             raise ValueError("key must be set")
+        self.embeddings_url = f"{base_url}/embeddings"
+        self.response_cache: Optional[ResponseCache] = None
+        if self.config.get("response_cache"):
+            self.response_cache = ResponseCache.from_config(self.config, embedder=self._embed)
+        self.metrics = Metrics.from_config(self.config, persona=self.config.get("persona_name", "default"))
+        self.payload_builder = PayloadBuilder.from_config(self.config, self.engine, self.stop_token)
+        # scheduling priority of the requests, None for interactive streams ahead of blocking calls
+        self.request_priority: Optional[int] = self.config.get("request_priority")
         self.memory = config.get("enable_memory", True)
         self.max_utts = config.get("memory_size", 5)
-        self.qa_pairs = []  # tuple of q+a
+        # replace with another ChatMemory to persist conversations elsewhere
+        self.chat_memory: ChatMemory
+        if config.get("memory_path"):
+            summarize = self._summarize_history if config.get("memory_summarize", True) else None
+            self.chat_memory = PersistentChatMemory(os.path.expanduser(config["memory_path"]),
+                                                    max_turns=self.max_utts, summarize=summarize,
+                                                    max_sessions=config.get("memory_max_sessions", 256),
+                                                    compact_turns=config.get("memory_compact_turns", 50),
+                                                    summary_batch=config.get("memory_summary_batch", 5))
+        else:
+            self.chat_memory = InMemoryChatMemory(max_turns=self.max_utts,
+                                                  ttl=config.get("memory_ttl", 86400),
+                                                  max_total_turns=config.get("memory_max_turns", 5000))
         self.initial_prompt = config.get("initial_prompt", "You are a helpful assistant.")
+        self.token_counter = TokenCounter(self.engine, config.get("tokenizer", "auto"))
+        self.context_builder = ContextBuilder(self.token_counter, config.get("max_context_tokens"))
+        self.last_context_tokens: Dict[str, int] = {}  # token counts of the last prompt sent
+        self.last_usage: Optional[dict] = None  # usage reported by the last answer, if any
+        # identical requests in flight at the same time share one upstream call
+        self.single_flight = SingleFlight() if config.get("coalesce_requests", True) else None
+        # python functions the model can call, see register_tool
+        self.tools = ToolRegistry.from_config(self.config, self.metrics)
+        self.max_tool_rounds = config.get("max_tool_rounds", 5)
 
     # OpenAI API integration
-    def _do_api_request(self, messages):
-        s = requests.Session()
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer " + self.key
-        }
-
-        # TODO - params from config
-        # https://platform.openai.com/docs/api-reference/completions/create
-        payload = {
-            "model": self.engine,
-            "messages": messages,
-            "max_tokens": 300,
-            "temperature": 1,
-            # between 0 and 2. Higher values like 0.8 will make the output more random, while lower values like 0.2 will make it more focused and deterministic.
-            "top_p": 1,
-            # nucleus sampling alternative to temperature, the model considers the results of the tokens with top_p probability mass. 0.1 means only tokens comprising top 10% probability mass are considered.
-            "n": 1,  # How many completions to generate for each prompt.
-            "frequency_penalty": 0,
-            # Number between -2.0 and 2.0. Positive values penalize new tokens based on their existing frequency in the text so far, decreasing the model's likelihood to repeat the same line verbatim.
-            "presence_penalty": 0,
-            # Number between -2.0 and 2.0. Positive values penalize new tokens based on whether they appear in the text so far, increasing the model's likelihood to talk about new topics.
-            "stop": self.stop_token
-        }
-        response = s.post(self.api_url, headers=headers, data=json.dumps(payload)).json()
-        return response["choices"][0]["message"]["content"]
-
-    def _do_streaming_api_request(self, messages):
-
-        s = requests.Session()
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer " + self.key
-        }
-
-        # TODO - params from config
-        # https://platform.openai.com/docs/api-reference/completions/create
-        payload = {
-            "model": self.engine,
-            "messages": messages,
-            "max_tokens": 300,
-            "temperature": 1,
-            # between 0 and 2. Higher values like 0.8 will make the output more random, while lower values like 0.2 will make it more focused and deterministic.
-            "top_p": 1,
-            # nucleus sampling alternative to temperature, the model considers the results of the tokens with top_p probability mass. 0.1 means only tokens comprising top 10% probability mass are considered.
-            "n": 1,  # How many completions to generate for each prompt.
-            "frequency_penalty": 0,
-            # Number between -2.0 and 2.0. Positive values penalize new tokens based on their existing frequency in the text so far, decreasing the model's likelihood to repeat the same line verbatim.
-            "presence_penalty": 0,
-            # Number between -2.0 and 2.0. Positive values penalize new tokens based on whether they appear in the text so far, increasing the model's likelihood to talk about new topics.
-            "stop": self.stop_token,
-            "stream": True
-        }
-        for chunk in s.post(self.api_url, headers=headers,
-                            stream=True, data=json.dumps(payload)).iter_lines():
-            if chunk:
-                chunk = chunk.decode("utf-8")
-                chunk = json.loads(chunk.split("data: ", 1)[-1])
-                if "error" in chunk and "message" in chunk["error"]:
-                    LOG.error("API returned an error: " + chunk["error"]["message"])
-                    break
-                if chunk["choices"][0].get("finish_reason"):
-                    break
-                if "content" not in chunk["choices"][0]["delta"]:
-                    continue
-                yield chunk["choices"][0]["delta"]["content"]
+    @property
+    def _headers(self) -> Dict[str, str]:
+        return _auth_headers(self.key)
+
+    def _build_payload(self, messages: MessageList, stream: bool = False, **params) -> dict:
+        # https://platform.openai.com/docs/api-reference/chat/create
+        payload = self.payload_builder.build(messages, stream=stream, **params)
+        if self.tools:
+            payload["tools"] = self.tools.specs()
+        if stream and self.config.get("stream_usage"):
+            # ask for a last chunk with token usage, not every server supports it
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def _priority(self, stream: bool = False, request_priority: Optional[int] = None) -> int:
+        if request_priority is not None:
+            return request_priority
+        if self.request_priority is not None:
+            return self.request_priority
+        # someone is waiting to hear a streamed answer
+        return PRIORITY_INTERACTIVE if stream else PRIORITY_NORMAL
+
+    def _embed(self, text: str) -> List[float]:
+        payload = {"model": self.config.get("embedding_model", "text-embedding-3-small"), "input": text}
+        response = self.session.post(self.embeddings_url, headers=self._headers,
+                                     data=json.dumps(payload), timeout=self.timeout).json()
+        return response["data"][0]["embedding"]
+
+    def register_tool(self, func: Callable[..., Any],
+                      name: Optional[str] = None,
+                      description: Optional[str] = None,
+                      parameters: Optional[dict] = None,
+                      idempotent: bool = False,
+                      timeout: Optional[float] = None) -> Tool:
+        """
+        Let the model call a python function through the "tools" API.
+
+        The function is called with the arguments chosen by the model as keyword
+        arguments, its return value (a string, or anything JSON serializable) is
+        sent back to the model, which then answers or calls more tools.
+
+        Args:
+            func (Callable): the function to call.
+            name (Optional[str]): name shown to the model. Defaults to the function name.
+            description (Optional[str]): what the tool does, for the model. Defaults to the docstring.
+            parameters (Optional[dict]): JSON schema of the keyword arguments. Defaults to no arguments.
+            idempotent (bool): same arguments give the same result, so results can be cached. Defaults to False.
+            timeout (Optional[float]): seconds to wait for a result. Defaults to the "tool_timeout" config.
+
+        Returns:
+            Tool: the registered tool.
+        """
+        tool = Tool(func, name=name, description=description, parameters=parameters,
+                    idempotent=idempotent, timeout=timeout)
+        self.tools.register(tool)
+        return tool
+
+    def _tool_round_params(self, rounds: int, params: dict) -> dict:
+        if rounds == self.max_tool_rounds:
+            LOG.warning(f"the model called tools {rounds} times in a row, asking for an answer")
+            return {**params, "tool_choice": "none"}
+        return params
+
+    def _do_api_request(self, messages, request_priority: Optional[int] = None,
+                        queue_timeout: Optional[float] = None, **params):
+        if self.tools:
+            return self._complete_with_tools(messages, request_priority, queue_timeout, **params)
+        payload = self._build_payload(messages, **params)
+        if self.single_flight is not None:
+            return self.single_flight.do(cache_key(payload),
+                                         lambda: self._complete(payload, request_priority, queue_timeout))
+        return self._complete(payload, request_priority, queue_timeout)
+
+    def _cached_answer(self, payload: dict) -> Optional[str]:
+        return self.response_cache.get(payload) if self.response_cache is not None else None
+
+    def _cache_answer(self, payload: dict, answer: Optional[str]):
+        if answer is not None and self.response_cache is not None:
+            self.response_cache.put(payload, answer)
+
+    @staticmethod
+    def _with_tool_calls(messages: MessageList, content: Optional[str], calls: List[dict]) -> MessageList:
+        """the conversation so far plus the assistant message calling tools"""
+        return messages + [{"role": "assistant", "content": content or None, "tool_calls": list(calls)}]
+
+    def _complete(self, payload: dict, request_priority: Optional[int] = None,
+                  queue_timeout: Optional[float] = None) -> Optional[str]:
+        answer = self._cached_answer(payload)
+        if answer is None:
+            answer = _post_with_failover(self, "chat/completions", payload, _parse_content,
+                                         priority=self._priority(request_priority=request_priority),
+                                         queue_timeout=queue_timeout)
+            self._cache_answer(payload, answer)
+        return answer
+
+    def _complete_with_tools(self, messages: MessageList, request_priority: Optional[int] = None,
+                             queue_timeout: Optional[float] = None, **params) -> Optional[str]:
+        """ask, run the tools the model calls and ask again until it answers"""
+        for rounds in range(self.max_tool_rounds + 1):
+            payload = self._build_payload(messages, **self._tool_round_params(rounds, params))
+            message = _post_with_failover(self, "chat/completions", payload, _parse_message,
+                                          priority=self._priority(request_priority=request_priority),
+                                          queue_timeout=queue_timeout)
+            if message is None:
+                return None
+            calls = message.get("tool_calls")
+            if not calls:
+                return message.get("content")
+            messages = self._with_tool_calls(messages, message.get("content"), calls)
+            messages += self.tools.run(calls)
+        return None
+
+    def _stream_with_tools(self, messages: MessageList, request_priority: Optional[int] = None,
+                           queue_timeout: Optional[float] = None, **params) -> Iterable[Union[str, ToolCalls]]:
+        """stream the answer, and if the model calls tools run them and stream its next answer
+
+        text of every round is yielded, the ToolCalls of a round are yielded
+        once its text ended and the tools were started
+        """
+        if not self.tools:
+            yield from self._do_streaming_api_request(messages, request_priority, queue_timeout, **params)
+            return
+        for rounds in range(self.max_tool_rounds + 1):
+            calls, text = None, []
+            stream = self._do_streaming_api_request(messages, request_priority, queue_timeout,
+                                                    **self._tool_round_params(rounds, params))
+            try:
+                for chunk in stream:
+                    if isinstance(chunk, ToolCalls):
+                        calls = chunk
+                    else:
+                        text.append(chunk)
+                        yield chunk
+            finally:
+                stream.close()
+            if not calls:
+                return
+            submitted = self.tools.submit(calls)
+            yield calls
+            messages = self._with_tool_calls(messages, "".join(text), calls)
+            messages += self.tools.collect(submitted)
+
+    def _do_streaming_api_request(self, messages, request_priority: Optional[int] = None,
+                                  queue_timeout: Optional[float] = None, **params):
+        payload = self._build_payload(messages, stream=True, **params)
+        if self.single_flight is not None:
+            yield from self.single_flight.stream(cache_key(payload),
+                                                 lambda: self._stream(payload, request_priority, queue_timeout))
+        else:
+            yield from self._stream(payload, request_priority, queue_timeout)
+
+    def _stream(self, payload: dict, request_priority: Optional[int] = None,
+                queue_timeout: Optional[float] = None) -> Iterable[str]:
+        answer = self._cached_answer(payload)
+        if answer is not None:
+            yield answer
+            return
+        priority = self._priority(stream=True, request_priority=request_priority)
+        deadline = _queue_deadline(self, queue_timeout)
+        for endpoint in self.endpoints.candidates():
+            if not _admit(self, endpoint, priority, deadline):
+                continue
+            attempt = _StreamAttempt(self, endpoint, payload)
+            try:
+                yield from self._stream_endpoint(attempt)
+            except (requests.RequestException, ValueError) as e:
+                attempt.failed(e)
+            finally:
+                # the slot is held until the answer was read or the consumer stopped listening
+                endpoint.scheduler.release()
+            if attempt.answered:
+                break
+        else:
+            LOG.error("no endpoint could answer the request")
+            return
+        self._cache_answer(payload, self._complete_answer(attempt))
+        calls = self._end_stream(attempt)
+        if calls:
+            yield calls
+
+    def _end_stream(self, attempt: _StreamAttempt) -> Optional[ToolCalls]:
+        """keep the usage of a streamed answer, the tool calls it asked for if any"""
+        parser = attempt.parser
+        self.last_usage = parser.usage
+        if parser.error or not parser.tool_calls:
+            return None
+        return ToolCalls(parser.tool_calls)
 
-    def get_chat_history(self, initial_prompt=None):
-        qa = self.qa_pairs[-1 * self.max_utts:]
+    @staticmethod
+    def _complete_answer(attempt: _StreamAttempt) -> Optional[str]:
+        """text of a streamed answer that ended normally, only complete answers are cached"""
+        parser = attempt.parser
+        if parser.error or parser.tool_calls or not parser.finish_reason:
+            return None
+        return "".join(attempt.chunks)
+
+    def _stream_endpoint(self, attempt: _StreamAttempt) -> Iterable[str]:
+        """stream an answer from a single endpoint, failures are reported in attempt.parser.error"""
+        endpoint = attempt.endpoint
+        data = self.payload_builder.dumps(attempt.payload, model=attempt.model)
+        session = session_from_config(endpoint.api_url, self.config)
+        attempt.begin()
+        try:
+            # context manager returns the connection to the pool even if we stop reading early
+            with session.post(f"{endpoint.api_url}/chat/completions", headers=_auth_headers(endpoint.key),
+                              stream=True, data=data, timeout=self.timeout) as response:
+                if self.metrics.enabled:
+                    _record_retries(self.metrics, endpoint, response)
+                if response.status_code != 200:
+                    attempt.http_error(response.status_code, response.text, response.headers)
+                    return
+                for data in response.iter_content(chunk_size=512):
+                    yield from attempt.feed(data)
+                    if attempt.parser.done:
+                        break
+                else:
+                    yield from attempt.close()
+            attempt.ended()
+        except Exception:
+            attempt.interrupted()
+            raise
+        finally:
+            attempt.finish()
+
+    @property
+    def qa_pairs(self) -> List[QAPair]:
+        """(query, answer) pairs remembered for the current session"""
+        return self.chat_memory.get(get_session_id())
+
+    def get_chat_history(self, initial_prompt=None, session_id: Optional[str] = None):
+        session_id = session_id or get_session_id()
+        qa = self.chat_memory.get(session_id)
         initial_prompt = initial_prompt or self.initial_prompt or "You are a helpful assistant."
         messages = [
             {"role": "system", "content": initial_prompt},
         ]
+        summary = self.chat_memory.get_summary(session_id)
+        if summary:
+            # own message, the system prompt stays byte identical for prompt caching
+            messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{summary}"})
         for q, a in qa:
             messages.append({"role": "user", "content": q})
             messages.append({"role": "assistant", "content": a})
         return messages
 
-    def get_messages(self, utt, initial_prompt=None) -> MessageList:
-        messages = self.get_chat_history(initial_prompt)
+    def _summarize_history(self, summary: Optional[str], pairs: List[QAPair]) -> Optional[str]:
+        """fold turns that fell out of the memory window into the running summary, called from a background thread"""
+        from ovos_solver_openai_persona.summarizer import OpenAISummarizer
+        lines = [f"Summary of the earlier conversation: {summary}"] if summary else []
+        lines += [f"User: {q}\nAssistant: {a}" for q, a in pairs]
+        template = self.config.get("memory_summary_template") or OpenAISummarizer.TEMPLATE
+        messages = [{"role": "system", "content": self.initial_prompt},
+                    {"role": "user", "content": template.format(content="\n".join(lines))}]
+        # no tools, no response cache, and never ahead of someone waiting for an answer
+        payload = self.payload_builder.build(messages)
+        return _post_with_failover(self, "chat/completions", payload,
+                                   lambda data: data["choices"][0]["message"]["content"],
+                                   priority=PRIORITY_BACKGROUND)
+
+    def get_messages(self, utt, initial_prompt=None, session_id: Optional[str] = None) -> MessageList:
+        messages = self.get_chat_history(initial_prompt, session_id=session_id)
         messages.append({"role": "user", "content": utt})
         return messages
 
+    def _get_segmenter(self, lang: Optional[str] = None) -> SentenceSegmenter:
+        return SentenceSegmenter(lang or self.default_lang,
+                                 early_flush_words=self.config.get("early_flush_words", 0),
+                                 early_flush_ms=self.config.get("early_flush_ms", 0))
+
+    def _fit_context(self, messages: MessageList) -> MessageList:
+        """drop or compress the oldest turns so the prompt fits max_context_tokens"""
+        messages, self.last_context_tokens = self.context_builder.fit(messages)
+        LOG.debug(f"prompt tokens: {self.last_context_tokens}")
+        return messages
+
+    def _priming_payload(self, session_id: str, initial_prompt: Optional[str] = None) -> dict:
+        """the prompt of the next query of a session, minus the query itself, asking for a single token"""
+        messages = self.get_chat_history(initial_prompt, session_id=session_id)
+        # also fills the token count cache for the real query
+        messages, _ = self.context_builder.fit(messages)
+        return self._build_payload(messages, max_tokens=1)
+
+    def prewarm(self, session_id: Optional[str] = None,
+                initial_prompt: Optional[str] = None,
+                block: bool = False) -> Optional[threading.Thread]:
+        """
+        Get ready for a query that is about to arrive, eg. call it on wake word.
+
+        Opens (or refreshes) the pooled connection to the endpoint that will most
+        likely get the query and counts the tokens of the session chat history.
+        If "prefix_priming" is enabled the chat history is sent with max_tokens=1,
+        so a server with prefix caching (llama.cpp "cache_prompt", OpenAI prompt
+        caching) has it cached when the real query, which extends it, arrives.
+
+        Args:
+            session_id (Optional[str]): session the query will belong to. Defaults to the current session.
+            initial_prompt (Optional[str]): system prompt the query will use. Defaults to None.
+            block (bool): wait until done instead of working in a background thread. Defaults to False.
+
+        Returns:
+            Optional[threading.Thread]: the background thread, None if block is set.
+        """
+        session_id = session_id or get_session_id()
+        if block:
+            self._prewarm(session_id, initial_prompt)
+            return None
+        thread = threading.Thread(target=self._prewarm, args=(session_id, initial_prompt), daemon=True)
+        thread.start()
+        return thread
+
+    def _prewarm(self, session_id: str, initial_prompt: Optional[str] = None):
+        payload = self._priming_payload(session_id, initial_prompt)
+        endpoint = self.endpoints.candidates()[0]
+        session = session_from_config(endpoint.api_url, self.config)
+        headers = _auth_headers(endpoint.key)
+        try:
+            if self.config.get("prefix_priming"):
+                # only prime if the backend is idle, never delay a real query for it
+                if not endpoint.scheduler.acquire(PRIORITY_BACKGROUND, timeout=0):
+                    LOG.debug(f"{endpoint.api_url} is busy, not priming")
+                    return
+                data = self.payload_builder.dumps(payload, model=endpoint.model or payload["model"])
+                try:
+                    session.post(f"{endpoint.api_url}/chat/completions", headers=headers,
+                                 data=data, timeout=self.timeout)
+                finally:
+                    endpoint.scheduler.release()
+            else:
+                session.get(f"{endpoint.api_url}/models", headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            LOG.debug(f"prewarm of {endpoint.api_url} failed: {e}")
+
     # asbtract Solver methods
     def continue_chat(self, messages: MessageList,
                       lang: Optional[str],
-                      units: Optional[str] = None) -> Optional[str]:
+                      units: Optional[str] = None,
+                      params: Optional[dict] = None,
+                      session_id: Optional[str] = None,
+                      request_priority: Optional[int] = None,
+                      queue_timeout: Optional[float] = None) -> Optional[str]:
         """Generate a response based on the chat history.
 
         Args:
             messages (List[Dict[str, str]]): List of chat messages, each containing 'role' and 'content'.
             lang (Optional[str]): The language code for the response. If None, will be auto-detected.
             units (Optional[str]): Optional unit system for numerical values.
+            params (Optional[dict]): generation params overriding the configured ones, eg. {"temperature": 0}.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
+            request_priority (Optional[int]): scheduling priority, lower is admitted first. Defaults to the "request_priority" config.
+            queue_timeout (Optional[float]): seconds to wait for a free slot before giving up. Defaults to the "queue_timeout" config.
 
         Returns:
             Optional[str]: The generated response or None if no response could be generated.
         """
-        response = self._do_api_request(messages)
-        answer = post_process_sentence(response)
+        messages = self._fit_context(messages)
+        response = self._do_api_request(messages, request_priority, queue_timeout, **(params or {}))
+        return self._handle_answer(messages, response, session_id)
+
+    def _handle_answer(self, messages: MessageList, response: Optional[str],
+                       session_id: Optional[str] = None) -> Optional[str]:
+        answer = post_process_sentence(response or "")
         if not answer or not answer.strip("?") or not answer.strip("_"):
             return None
         if self.memory:
             query = messages[-1]["content"]
-            self.qa_pairs.append((query, answer))
+            # remember the answer as generated, so the next prompt extends the one the server cached
+            self.chat_memory.append(session_id or get_session_id(), query, response.strip())
         return answer
 
     def stream_chat_utterances(self, messages: List[Dict[str, str]],
                                lang: Optional[str] = None,
-                               units: Optional[str] = None) -> Iterable[str]:
+                               units: Optional[str] = None,
+                               params: Optional[dict] = None,
+                               max_sentences: Optional[int] = None,
+                               max_seconds: Optional[float] = None,
+                               session_id: Optional[str] = None,
+                               request_priority: Optional[int] = None,
+                               queue_timeout: Optional[float] = None) -> Iterable[str]:
         """
         Stream utterances for the given chat history as they become available.
 
+        Once max_sentences utterances were yielded, or max_seconds passed since the
+        request with at least one utterance spoken, the HTTP stream is closed so the
+        backend stops generating the rest of the answer.
+
         Args:
             messages: The chat messages.
             lang (Optional[str]): Optional language code. Defaults to None.
             units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones. Defaults to None.
+            max_sentences (Optional[int]): stop after this many utterances. Defaults to the "max_sentences" config.
+            max_seconds (Optional[float]): stop after this many seconds. Defaults to the "max_seconds" config.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
+            request_priority (Optional[int]): scheduling priority, lower is admitted first. Defaults to the "request_priority" config.
+            queue_timeout (Optional[float]): seconds to wait for a free slot before giving up. Defaults to the "queue_timeout" config.
 
         Returns:
             Iterable[str]: An iterable of utterances.
         """
-        answer = ""
-        query = messages[-1]["content"]
-        if self.memory:
-            self.qa_pairs.append((query, answer))
-
-        for chunk in self._do_streaming_api_request(messages):
-            answer += chunk
-            if any(chunk.endswith(p) for p in [".", "!", "?", "\n", ":"]):
-                if len(chunk) >= 2 and chunk[-2].isdigit() and chunk[-1] == ".":
-                    continue  # dont split numbers
-                if answer.strip():
-                    if self.memory:
-                        full_ans = f"{self.qa_pairs[-1][-1]}\n{answer}".strip()
-                        self.qa_pairs[-1] = (query, full_ans)
-                    yield post_process_sentence(answer)
-                answer = ""
+        messages = self._fit_context(messages)
+        answer = _ChatAnswer(self, messages, lang, max_sentences, max_seconds,
+                             session_id or get_session_id())
+        stream = self._stream_with_tools(messages, request_priority, queue_timeout, **(params or {}))
+        try:
+            for chunk in stream:
+                for utt in answer.feed(chunk):
+                    answer.spoken(utt)
+                    yield utt
+                if answer.over_budget():
+                    break
+            else:
+                for utt in answer.flush():
+                    answer.spoken(utt)
+                    yield utt
+                answer.completed = True
+        finally:
+            # closing the generator chain closes the HTTP response, the server stops generating
+            stream.close()
+            answer.remember()
 
     def stream_utterances(self, query: str,
                           lang: Optional[str] = None,
-                          units: Optional[str] = None) -> Iterable[str]:
+                          units: Optional[str] = None,
+                          params: Optional[dict] = None,
+                          max_sentences: Optional[int] = None,
+                          max_seconds: Optional[float] = None,
+                          session_id: Optional[str] = None) -> Iterable[str]:
         """
         Stream utterances for the given query as they become available.
 
@@ -257,16 +929,24 @@ class OpenAIChatCompletionsSolver(ChatMessageSolver):
             query (str): The query text.
             lang (Optional[str]): Optional language code. Defaults to None.
             units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones. Defaults to None.
+            max_sentences (Optional[int]): stop after this many utterances. Defaults to the "max_sentences" config.
+            max_seconds (Optional[float]): stop after this many seconds. Defaults to the "max_seconds" config.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
 
         Returns:
             Iterable[str]: An iterable of utterances.
         """
-        messages = self.get_messages(query)
-        yield from self.stream_chat_utterances(messages, lang, units)
+        messages = self.get_messages(query, session_id=session_id)
+        yield from self.stream_chat_utterances(messages, lang, units, params=params,
+                                               max_sentences=max_sentences, max_seconds=max_seconds,
+                                               session_id=session_id)
 
     def get_spoken_answer(self, query: str,
                           lang: Optional[str] = None,
-                          units: Optional[str] = None) -> Optional[str]:
+                          units: Optional[str] = None,
+                          params: Optional[dict] = None,
+                          session_id: Optional[str] = None) -> Optional[str]:
         """
         Obtain the spoken answer for a given query.
 
@@ -274,10 +954,53 @@ class OpenAIChatCompletionsSolver(ChatMessageSolver):
             query (str): The query text.
             lang (Optional[str]): Optional language code. Defaults to None.
             units (Optional[str]): Optional units for the query. Defaults to None.
+            params (Optional[dict]): generation params overriding the configured ones. Defaults to None.
+            session_id (Optional[str]): session the turn is remembered under. Defaults to the current session.
 
         Returns:
             str: The spoken answer as a text response.
         """
-        messages = self.get_messages(query)
+        messages = self.get_messages(query, session_id=session_id)
         # just for api compat since it's a subclass, shouldn't be directly used
-        return self.continue_chat(messages=messages, lang=lang, units=units)
+        return self.continue_chat(messages=messages, lang=lang, units=units, params=params,
+                                  session_id=session_id)
+
+
+_ENGINES: Dict[str, OpenAIChatCompletionsSolver] = {}
+_ENGINES_LOCK = threading.Lock()
+
+# sent with every request by the plugins sharing an engine, they do not need an engine of their own
+_PER_CALL_KEYS = ("initial_prompt", "request_priority", "queue_timeout", "enable_memory") + \
+                 tuple(GENERATION_DEFAULTS) + GENERATION_OPTIONAL
+
+
+def get_shared_engine(config: dict, plugin_keys: Iterable[str] = ()) -> OpenAIChatCompletionsSolver:
+    """
+    Get the process wide chat engine for the settings of a plugin config.
+
+    Plugins that wrap a chat engine (dialog transformer, summarizer) with the
+    same engine settings, eg. the same endpoint and nothing else, share a single
+    one instead of building their own at load time. Every setting of the config
+    reaches the engine (response cache, tokenizer, context budget, metrics...)
+    except the ones a plugin sends with each request: system prompt, generation
+    params, request_priority and queue_timeout. The engine keeps no chat history.
+
+    Args:
+        config (dict): plugin config, keys set to None are ignored
+        plugin_keys (Iterable[str]): settings of the plugin itself, not used by the engine
+
+    Returns:
+        OpenAIChatCompletionsSolver: engine shared by every caller with the same engine settings
+    """
+    settings = {k: v for k, v in config.items()
+                if v is not None and k not in _PER_CALL_KEYS and k not in plugin_keys
+                and not k.startswith("memory_")}
+    settings.setdefault("api_url", "https://api.openai.com/v1")
+    # objects in the config (translators, embedders...) are compared by identity
+    key = json.dumps(settings, sort_keys=True, default=lambda o: f"{type(o).__name__}@{id(o)}")
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = OpenAIChatCompletionsSolver(config={**settings, "enable_memory": False})
+            _ENGINES[key] = engine
+        return engine
@@ -0,0 +1,276 @@
+import abc
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, List, Optional, Tuple
+from urllib.parse import quote
+
+from ovos_bus_client.session import SessionManager
+from ovos_utils.log import LOG
+
+QAPair = Tuple[str, str]  # for typing
+
+
+def get_session_id() -> str:
+    """session_id of the Message being handled by this thread, "default" if there is none"""
+    return SessionManager.get().session_id
+
+
+class ChatMemory(abc.ABC):
+    """Conversation history store, keyed by session_id
+
+    subclass this to persist conversations somewhere else (sqlite, disk...)
+    and assign an instance to OpenAIChatCompletionsSolver.chat_memory
+    """
+
+    def __init__(self, max_turns: int = 5):
+        self.max_turns = max_turns
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> List[QAPair]:
+        """return the (query, answer) pairs of a session to send with the next prompt, oldest first"""
+
+    @abc.abstractmethod
+    def append(self, session_id: str, query: str, answer: str):
+        """store a new (query, answer) pair for a session"""
+
+    @abc.abstractmethod
+    def clear(self, session_id: Optional[str] = None):
+        """forget a session, or every session if session_id is None"""
+
+    def get_summary(self, session_id: str) -> Optional[str]:
+        """summary of the older turns of a session, None if they are simply forgotten"""
+        return None
+
+
+class InMemoryChatMemory(ChatMemory):
+    """thread safe in RAM store
+
+    each session is a ring buffer of the last max_turns pairs, sessions idle
+    for longer than ttl seconds are dropped and the least recently used
+    sessions are evicted once more than max_total_turns pairs are stored
+    """
+
+    def __init__(self, max_turns: int = 5, ttl: float = 86400, max_total_turns: int = 5000):
+        super().__init__(max_turns)
+        self.ttl = ttl
+        self.max_total_turns = max_total_turns
+        self._sessions: "OrderedDict[str, Tuple[float, Deque[QAPair]]]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.RLock()
+
+    def _evict(self, now: float):
+        # sessions are kept in least recently used order
+        while self._sessions:
+            session_id, (last_seen, turns) = next(iter(self._sessions.items()))
+            expired = self.ttl and now - last_seen > self.ttl
+            if not expired and self._total <= self.max_total_turns:
+                break
+            self._sessions.popitem(last=False)
+            self._total -= len(turns)
+
+    def get(self, session_id: str) -> List[QAPair]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            if session_id not in self._sessions:
+                return []
+            _, turns = self._sessions[session_id]
+            self._sessions[session_id] = (now, turns)
+            self._sessions.move_to_end(session_id)
+            return list(turns)
+
+    def append(self, session_id: str, query: str, answer: str):
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._sessions:
+                _, turns = self._sessions[session_id]
+            else:
+                turns = deque(maxlen=self.max_turns)
+            if len(turns) == turns.maxlen:
+                self._total -= 1  # oldest pair falls out of the ring buffer
+            turns.append((query, answer))
+            self._total += 1
+            self._sessions[session_id] = (now, turns)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+                self._total = 0
+            elif session_id in self._sessions:
+                _, turns = self._sessions.pop(session_id)
+                self._total -= len(turns)
+
+
+class _SessionLog:
+    """turns of a session not folded into its summary yet, plus that summary"""
+
+    def __init__(self):
+        self.turns: List[QAPair] = []
+        self.summary: Optional[str] = None
+        self.summarized = 0  # turns of the log covered by the summary
+        self.stale = 0  # turns of the log no longer sent, dropped when it is compacted
+        self.summarizing = False
+
+
+class PersistentChatMemory(ChatMemory):
+    """chat history kept on disk, with a running summary of the older turns
+
+    every session has its own append-only log under path, one compact JSON
+    record per line: ["t", query, answer] for a turn and ["s", n, summary] when
+    the summary covers the first n turns. Logs are read when a session is first
+    used after a restart, only the max_sessions most recently used are kept in RAM.
+    Once compact_turns turns of a log are summarized (or out of the window) it is
+    rewritten with only the summary and the turns still sent
+
+    the last max_turns pairs are sent as is, once summary_batch more pairs have
+    piled up they are folded into the summary by summarize(summary, pairs) in a
+    background thread, one call per batch. Until then they are still sent, so the
+    prompt only grows between two summaries and its prefix stays cacheable.
+    Without summarize pairs out of the window are dropped from the prompt as usual
+    """
+
+    def __init__(self, path: str, max_turns: int = 5,
+                 summarize: Optional[Callable[[Optional[str], List[QAPair]], Optional[str]]] = None,
+                 max_sessions: int = 256,
+                 compact_turns: int = 50,
+                 summary_batch: int = 5):
+        super().__init__(max_turns)
+        self.path = path
+        self.summarize = summarize
+        self.max_sessions = max_sessions
+        self.compact_turns = compact_turns
+        self.summary_batch = max(1, summary_batch)
+        self._sessions: "OrderedDict[str, _SessionLog]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _log_path(self, session_id: str) -> str:
+        return os.path.join(self.path, quote(session_id, safe="") + ".jsonl")
+
+    def _load(self, session_id: str) -> _SessionLog:
+        log = _SessionLog()
+        turns: List[QAPair] = []
+        line = ""
+        try:
+            with open(self._log_path(session_id), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # line cut short by a crash
+                    if record[0] == "t":
+                        turns.append((record[1], record[2]))
+                    elif record[0] == "s":
+                        log.summarized, log.summary = record[1], record[2]
+        except FileNotFoundError:
+            pass
+        if line and not line.endswith("\n"):
+            # start the next record on a line of its own
+            with open(self._log_path(session_id), "a", encoding="utf-8") as f:
+                f.write("\n")
+        log.turns = turns[log.summarized:]
+        if self.summarize is None:
+            del log.turns[:-self.max_turns]
+        log.stale = len(turns) - len(log.turns)
+        if log.stale >= self.compact_turns:
+            self._compact(session_id, log)
+        return log
+
+    def _session(self, session_id: str) -> _SessionLog:
+        log = self._sessions.get(session_id)
+        if log is None:
+            log = self._sessions[session_id] = self._load(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return log
+
+    def _write(self, session_id: str, record: list):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._log_path(session_id), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _compact(self, session_id: str, log: _SessionLog):
+        """rewrite the log with only the summary and the turns still sent"""
+        path = self._log_path(session_id)
+        records = ([["s", 0, log.summary]] if log.summary else []) + [["t", q, a] for q, a in log.turns]
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        os.replace(path + ".tmp", path)
+        log.summarized = log.stale = 0
+
+    def get(self, session_id: str) -> List[QAPair]:
+        with self._lock:
+            turns = self._session(session_id).turns
+            if self.summarize is None:
+                return turns[-self.max_turns:]
+            # turns waiting for the next summary are still sent
+            return turns[-(self.max_turns + self.summary_batch):]
+
+    def get_summary(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            return self._session(session_id).summary
+
+    def append(self, session_id: str, query: str, answer: str):
+        with self._lock:
+            log = self._session(session_id)
+            self._write(session_id, ["t", query, answer])
+            log.turns.append((query, answer))
+            if self.summarize is None:
+                # nothing to fold them into, the turns out of the window are dropped on compaction
+                log.stale += max(0, len(log.turns) - self.max_turns)
+                del log.turns[:-self.max_turns]
+                if log.stale >= self.compact_turns:
+                    self._compact(session_id, log)
+            elif len(log.turns) - self.max_turns >= self.summary_batch and not log.summarizing:
+                log.summarizing = True
+                threading.Thread(target=self._summarize, args=(session_id, log), daemon=True).start()
+
+    def _summarize(self, session_id: str, log: _SessionLog):
+        """fold the turns out of the window into the summary until less than a batch is left"""
+        while True:
+            with self._lock:
+                pending = log.turns[:-self.max_turns]
+                if len(pending) < self.summary_batch or self._sessions.get(session_id) is not log:
+                    log.summarizing = False
+                    return
+                summary = log.summary
+            try:
+                summary = self.summarize(summary, pending)
+            except Exception as e:
+                LOG.warning(f"could not summarize the chat history of session {session_id}: {e}")
+                summary = None
+            with self._lock:
+                if not summary or self._sessions.get(session_id) is not log:
+                    # retried on the next turn
+                    log.summarizing = False
+                    return
+                log.summary = summary
+                log.summarized += len(pending)
+                log.stale += len(pending)
+                del log.turns[:len(pending)]
+                if log.stale >= self.compact_turns:
+                    self._compact(session_id, log)
+                else:
+                    self._write(session_id, ["s", log.summarized, summary])
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+                names = os.listdir(self.path) if os.path.isdir(self.path) else []
+                paths = [os.path.join(self.path, n) for n in names if n.endswith(".jsonl")]
+            else:
+                self._sessions.pop(session_id, None)
+                paths = [self._log_path(session_id)]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
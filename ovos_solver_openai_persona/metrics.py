@@ -0,0 +1,294 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ovos_utils.log import LOG
+
+# upper bounds in seconds, good for both time to first token and full answers
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# metric name -> help text, also documents what is recorded
+METRICS = {
+    "llm_request_seconds": "time until a complete answer was received",
+    "llm_ttft_seconds": "time until the first streamed token",
+    "llm_inter_chunk_seconds": "time between streamed tokens",
+    "llm_first_sentence_seconds": "time until the first utterance was ready for TTS",
+    "llm_tldr_seconds": "time to summarize a document",
+    "llm_tokens_total": "prompt and completion tokens spent",
+    "llm_requests_total": "requests sent, by endpoint and outcome",
+    "llm_retries_total": "requests retried by the transport",
+    "llm_queue_wait_seconds": "time a request waited for a free slot on its endpoint",
+    "llm_queue_depth": "requests waiting for a free slot on an endpoint",
+    "llm_tool_seconds": "time a tool call took to run, by tool and outcome",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsSink:
+    """receives every measurement, subclass to export them somewhere"""
+
+    def observe(self, name: str, value: float, labels: Labels):
+        """a sample of a histogram, in seconds"""
+
+    def observe_many(self, name: str, values: List[float], labels: Labels):
+        """samples of a histogram taken during one request, eg. the gaps between streamed chunks"""
+        for value in values:
+            self.observe(name, value, labels)
+
+    def inc(self, name: str, value: float, labels: Labels):
+        """increment a counter"""
+
+    def set(self, name: str, value: float, labels: Labels):
+        """set a gauge"""
+
+
+class HistogramSink(MetricsSink):
+    """in-process histograms and counters, read them with snapshot()"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # (name, labels) -> [bucket counts..., +Inf count], sum
+        self.histograms: Dict[Tuple[str, Labels], Tuple[List[int], List[float]]] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, labels: Labels):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.histograms.get((name, labels))
+            if entry is None:
+                entry = self.histograms[(name, labels)] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][idx] += 1
+            entry[1][0] += value
+
+    def inc(self, name: str, value: float, labels: Labels):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def set(self, name: str, value: float, labels: Labels):
+        with self._lock:
+            self.gauges[(name, labels)] = value
+
+    def quantile(self, name: str, q: float, labels: Optional[Labels] = None) -> Optional[float]:
+        """estimate a quantile from the bucket counts, labels None merges all series of name"""
+        with self._lock:
+            series = [counts for (n, l), (counts, _) in self.histograms.items()
+                      if n == name and (labels is None or l == labels)]
+        if not series:
+            return None
+        counts = [sum(c) for c in zip(*series)]
+        target = q * sum(counts)
+        seen = 0
+        for idx, count in enumerate(counts):
+            seen += count
+            if seen >= target and count:
+                return self.buckets[idx] if idx < len(self.buckets) else float("inf")
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {f"{name}{_render_labels(labels)}": {"count": sum(counts), "sum": total[0]}
+                          for (name, labels), (counts, total) in self.histograms.items()}
+            counters = {f"{name}{_render_labels(labels)}": value
+                        for (name, labels), value in self.counters.items()}
+            gauges = {f"{name}{_render_labels(labels)}": value
+                      for (name, labels), value in self.gauges.items()}
+        return {"histograms": histograms, "counters": counters, "gauges": gauges}
+
+
+def _render_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{str(v)}"'.replace("\n", " ") for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class PrometheusSink(HistogramSink):
+    """histograms exported in the prometheus text format, optionally served over http"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, port: Optional[int] = None, host: str = "127.0.0.1"):
+        super().__init__(buckets)
+        self.server = None
+        if port:
+            self.serve(port, host)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        seen = set()
+        for (name, labels), (counts, total) in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {METRICS.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_render_labels(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_render_labels(labels)} {total[0]}")
+            lines.append(f"{name}_count{_render_labels(labels)} {cumulative}")
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in series:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {METRICS.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_render_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """expose render() at http://host:port/metrics from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        LOG.info(f"serving metrics at http://{host}:{port}/metrics")
+
+
+class BusSink(MetricsSink):
+    """emit measurements as "ovos.openai.metrics" messages
+
+    samples taken during a single request (inter chunk gaps) are sent as one
+    "summary" message per request, not one message per streamed chunk
+    """
+
+    def __init__(self, bus=None):
+        self.bus = bus
+
+    def _emit(self, kind: str, name: str, value: float, labels: Labels, **data):
+        from ovos_bus_client.message import Message
+        if self.bus is None:
+            from ovos_bus_client.util import get_mycroft_bus
+            self.bus = get_mycroft_bus()
+        self.bus.emit(Message("ovos.openai.metrics",
+                              {"type": kind, "name": name, "value": value, "labels": dict(labels), **data}))
+
+    def observe(self, name: str, value: float, labels: Labels):
+        self._emit("histogram", name, value, labels)
+
+    def observe_many(self, name: str, values: List[float], labels: Labels):
+        if values:
+            # value is the mean
+            self._emit("summary", name, sum(values) / len(values), labels,
+                       count=len(values), sum=sum(values), max=max(values))
+
+    def inc(self, name: str, value: float, labels: Labels):
+        self._emit("counter", name, value, labels)
+
+    def set(self, name: str, value: float, labels: Labels):
+        self._emit("gauge", name, value, labels)
+
+
+_SHARED: Dict[str, MetricsSink] = {}
+_LOCK = threading.Lock()
+
+
+def _shared_sink(kind: str, config: dict) -> MetricsSink:
+    """one sink of each kind per process, so all plugins report to the same place"""
+    with _LOCK:
+        if kind not in _SHARED:
+            if kind == "prometheus":
+                _SHARED[kind] = PrometheusSink(port=config.get("metrics_port"),
+                                               host=config.get("metrics_host", "127.0.0.1"))
+            elif kind == "bus":
+                _SHARED[kind] = BusSink()
+            elif kind == "histogram":
+                _SHARED[kind] = HistogramSink()
+            else:
+                raise ValueError(f"unknown metrics sink '{kind}'")
+        return _SHARED[kind]
+
+
+class Metrics:
+    """forward measurements to the configured sinks, a no-op if there are none
+
+    callers check enabled before doing any extra work to measure
+    """
+
+    def __init__(self, sinks: Optional[List[MetricsSink]] = None, **labels):
+        self.sinks = list(sinks or [])
+        self.labels = labels
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sinks)
+
+    @staticmethod
+    def from_config(config: dict, **labels) -> "Metrics":
+        """sinks from the "metrics" list, any of "histogram", "prometheus" and "bus" """
+        kinds = config.get("metrics") or []
+        if isinstance(kinds, str):
+            kinds = [kinds]
+        sinks = []
+        for kind in kinds:
+            try:
+                sinks.append(_shared_sink(kind, config))
+            except Exception as e:
+                LOG.error(f"failed to create metrics sink '{kind}': {e}")
+        return Metrics(sinks, **labels)
+
+    def add_sink(self, sink: MetricsSink):
+        self.sinks.append(sink)
+
+    def _labels(self, labels: dict) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in {**self.labels, **labels}.items() if v is not None))
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.sinks:
+            return
+        labels = self._labels(labels)
+        for sink in self.sinks:
+            try:
+                sink.observe(name, value, labels)
+            except Exception as e:
+                LOG.debug(f"metrics sink failed: {e}")
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.sinks:
+            return
+        labels = self._labels(labels)
+        for sink in self.sinks:
+            try:
+                sink.inc(name, value, labels)
+            except Exception as e:
+                LOG.debug(f"metrics sink failed: {e}")
+
+    def observe_many(self, name: str, values: List[float], **labels):
+        if not self.sinks or not values:
+            return
+        labels = self._labels(labels)
+        for sink in self.sinks:
+            try:
+                sink.observe_many(name, values, labels)
+            except Exception as e:
+                LOG.debug(f"metrics sink failed: {e}")
+
+    def set(self, name: str, value: float, **labels):
+        if not self.sinks:
+            return
+        labels = self._labels(labels)
+        for sink in self.sinks:
+            try:
+                sink.set(name, value, labels)
+            except Exception as e:
+                LOG.debug(f"metrics sink failed: {e}")
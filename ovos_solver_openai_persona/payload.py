@@ -0,0 +1,75 @@
+import json
+from typing import Any, Dict, List, Optional, Union
+
+# https://platform.openai.com/docs/api-reference/chat/create
+GENERATION_DEFAULTS = {
+    "max_tokens": 300,
+    "temperature": 1,
+    # between 0 and 2. Higher values like 0.8 will make the output more random, while lower values like 0.2 will make it more focused and deterministic.
+    "top_p": 1,
+    # nucleus sampling alternative to temperature, the model considers the results of the tokens with top_p probability mass. 0.1 means only tokens comprising top 10% probability mass are considered.
+    "n": 1,  # How many completions to generate for each prompt.
+    "frequency_penalty": 0,
+    # Number between -2.0 and 2.0. Positive values penalize new tokens based on their existing frequency in the text so far, decreasing the model's likelihood to repeat the same line verbatim.
+    "presence_penalty": 0,
+    # Number between -2.0 and 2.0. Positive values penalize new tokens based on whether they appear in the text so far, increasing the model's likelihood to talk about new topics.
+}
+# optional params only sent when set in config or per request
+GENERATION_OPTIONAL = ("seed", "stop", "logit_bias", "response_format", "min_p", "top_k",
+                       "repeat_penalty", "cache_prompt")
+
+
+def generation_params(config: dict) -> Dict[str, Any]:
+    """the generation params set in a config"""
+    return {k: config[k] for k in list(GENERATION_DEFAULTS) + list(GENERATION_OPTIONAL)
+            if config.get(k) is not None}
+
+
+class PayloadBuilder:
+    """build /chat/completions and /completions request bodies from config
+
+    generation params are read from the config keys of the same name, with
+    GENERATION_DEFAULTS for the ones not set, and can be overridden per request,
+    they are merged once so a request only copies a small dict
+    """
+
+    def __init__(self, model: str, params: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self.params = {"model": model, **GENERATION_DEFAULTS, **(params or {})}
+
+    @staticmethod
+    def from_config(config: dict, model: str, stop: Optional[Union[str, List[str]]] = None) -> "PayloadBuilder":
+        params = generation_params(config)
+        if stop and "stop" not in params:
+            params["stop"] = stop
+        return PayloadBuilder(model, params)
+
+    def build(self, messages: Optional[List[Dict[str, str]]] = None,
+              prompt: Optional[str] = None,
+              stream: bool = False,
+              **overrides) -> dict:
+        """
+        Args:
+            messages: chat messages, for /chat/completions
+            prompt: text prompt, for /completions
+            stream: ask for a streamed answer
+            overrides: generation params replacing the configured ones for this request, None removes a param
+
+        Returns:
+            the request body
+        """
+        if overrides:
+            payload = {k: v for k, v in {**self.params, **overrides}.items() if v is not None}
+        else:
+            payload = dict(self.params)
+        if messages is not None:
+            payload["messages"] = messages
+        if prompt is not None:
+            payload["prompt"] = prompt
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def dumps(self, payload: dict, **replace) -> str:
+        """serialize a request body, replace values such as "model" on the way"""
+        return json.dumps({**payload, **replace} if replace else payload)
@@ -0,0 +1,237 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+
+# request priorities, lower values are admitted first
+PRIORITY_INTERACTIVE = 0  # streamed answers someone is waiting to hear
+PRIORITY_NORMAL = 50
+PRIORITY_BACKGROUND = 100  # summaries, dialog rewrites, priming
+
+DEFAULT_RETRY_AFTER = 1.0  # seconds to pause after a 429 without a Retry-After header
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """seconds to wait from a Retry-After header, given in seconds or as a http date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Waiter:
+    """a request waiting for a slot, woken from any thread"""
+
+    def __init__(self, priority: int, seq: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.key = (priority, seq)
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class EndpointScheduler:
+    """admission control for a backend, shared by every plugin talking to the same url
+
+    at most max_in_flight requests run at once (0 is unlimited), the others wait
+    in a priority queue; rate adds a token bucket of that many requests per
+    second with bursts of up to burst requests, and pause() stops admitting
+    requests for a while, eg. after the server answered 429 with a Retry-After
+    """
+
+    def __init__(self, url: str, max_in_flight: int = 0, rate: float = 0, burst: Optional[float] = None):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._refilled = time.monotonic()
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def configure(self, max_in_flight: Optional[int] = None, rate: Optional[float] = None,
+                  burst: Optional[float] = None):
+        """change the limits, None keeps the current value"""
+        with self._lock:
+            if max_in_flight is not None:
+                self.max_in_flight = max_in_flight
+            if rate is not None:
+                self.rate = rate
+            if burst is not None or rate is not None:
+                self.burst = burst or max(1.0, self.rate)
+                self.tokens = min(self.tokens, self.burst)
+            self._dispatch()
+
+    def _next_admission(self, now: float) -> Optional[float]:
+        """seconds until a request can be admitted, None if it has to wait for a release"""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return None
+        wait = max(0.0, self.paused_until - now)
+        if self.rate and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def _dispatch(self, caller: Optional[_Waiter] = None) -> Optional[float]:
+        """admit waiters in priority order while there is capacity, call with the lock held
+
+        if the queue is blocked on time (rate limit, pause) the first waiter is
+        woken to sleep until then, waiters blocked on a release are woken by it
+        """
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        while self._queue:
+            wait = self._next_admission(now)
+            if wait != 0:
+                if wait is not None and self._queue[0] is not caller:
+                    self._queue[0].wake()
+                return wait
+            waiter = heapq.heappop(self._queue)
+            self.in_flight += 1
+            if self.rate:
+                self.tokens -= 1
+            waiter.granted = True
+            waiter.wake()
+        return self._next_admission(now)
+
+    def _enqueue(self, priority: int, loop: Optional[asyncio.AbstractEventLoop] = None) -> _Waiter:
+        waiter = _Waiter(priority, next(self._seq), loop)
+        heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _leave(self, waiter: _Waiter, deadline: Optional[float]) -> Optional[bool]:
+        """True if granted, False if the deadline passed, else None; call with the lock held"""
+        if waiter.granted:
+            return True
+        if deadline is not None and time.monotonic() >= deadline:
+            self._queue.remove(waiter)
+            heapq.heapify(self._queue)
+            return False
+        return None
+
+    @staticmethod
+    def _sleep_time(wait: Optional[float], deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return wait
+        remaining = max(0.0, deadline - time.monotonic())
+        return remaining if wait is None else min(wait, remaining)
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> bool:
+        """
+        wait for a slot, call release() once the request is done
+
+        Args:
+            priority (int): lower values are admitted first
+            timeout (Optional[float]): seconds to wait in the queue, None waits as long as needed
+
+        Returns:
+            bool: False if no slot was free within timeout, the request should be shed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            waiter = self._enqueue(priority)
+            wait = self._dispatch(waiter)
+        while True:
+            with self._lock:
+                done = self._leave(waiter, deadline)
+                if done is not None:
+                    return done
+                waiter.event.clear()
+            waiter.event.wait(self._sleep_time(wait, deadline))
+            with self._lock:
+                wait = self._dispatch(waiter)
+
+    async def acquire_async(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> bool:
+        """asyncio flavour of acquire, does not block the event loop"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            waiter = self._enqueue(priority, loop)
+            wait = self._dispatch(waiter)
+        try:
+            while True:
+                with self._lock:
+                    done = self._leave(waiter, deadline)
+                    if done is not None:
+                        return done
+                    if waiter.future.done():
+                        waiter.future = loop.create_future()
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), self._sleep_time(wait, deadline))
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    wait = self._dispatch(waiter)
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self.in_flight -= 1
+                    self._dispatch()
+                elif waiter in self._queue:
+                    self._queue.remove(waiter)
+                    heapq.heapify(self._queue)
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def pause(self, seconds: float):
+        """admit nothing for the next seconds, eg. the Retry-After of a 429"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            if self._queue:
+                self._queue[0].wake()
+
+
+_SCHEDULERS: Dict[str, EndpointScheduler] = {}
+_LOCK = threading.Lock()
+
+
+def get_scheduler(url: str, max_in_flight: Optional[int] = None, rate: Optional[float] = None,
+                  burst: Optional[float] = None) -> EndpointScheduler:
+    """process wide EndpointScheduler for a backend url
+
+    limits that are not None replace the current ones, so plugins that do
+    not configure any do not undo the limits set by another plugin
+    """
+    url = url.rstrip("/")
+    with _LOCK:
+        if url not in _SCHEDULERS:
+            _SCHEDULERS[url] = EndpointScheduler(url, max_in_flight or 0, rate or 0, burst)
+            return _SCHEDULERS[url]
+        scheduler = _SCHEDULERS[url]
+    if max_in_flight is not None or rate is not None or burst is not None:
+        scheduler.configure(max_in_flight, rate, burst)
+    return scheduler
@@ -0,0 +1,169 @@
+import time
+from typing import List, Optional
+
+# lowercase, without the final dot
+ABBREVIATIONS = {
+    "en": {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "inc", "ltd",
+           "co", "fig", "approx", "dept", "est", "mt", "ave", "jan", "feb", "mar", "apr", "jun",
+           "jul", "aug", "sep", "sept", "oct", "nov", "dec", "a.m", "p.m", "u.s", "u.k"},
+    "pt": {"sr", "sra", "srs", "dr", "dra", "prof", "profa", "etc", "ex", "p.ex", "pág", "av", "obs", "séc", "jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez"},
+    "es": {"sr", "sra", "srta", "dr", "dra", "prof", "ud", "uds", "etc", "p.ej", "pág", "av", "aprox"},
+    "fr": {"m", "mme", "mlle", "dr", "pr", "etc", "p.ex", "av", "bd", "env", "cf"},
+    "de": {"z.b", "bzw", "usw", "ca", "dr", "prof", "str", "u.a", "d.h", "evtl", "ggf", "vgl", "hr", "fr"},
+    "it": {"sig", "sigg", "sig.ra", "dott", "dott.ssa", "prof", "ecc", "es", "pag", "ca"},
+    "nl": {"bijv", "dhr", "mevr", "enz", "o.a", "d.w.z", "ca", "dr", "prof"},
+}
+# "No. 5", "Nr. 3": only abbreviations when a number follows, "No." alone is an answer
+NUMBER_ABBREVIATIONS = {"no", "nr", "nº", "n.º", "núm", "num"}
+TERMINATORS = ".!?…"
+FULLWIDTH_TERMINATORS = "。！？"  # not followed by spaces
+CLOSERS = "\"')]}”’»"
+MARKDOWN = "*_`~"  # emphasis and code markers, around a word on both sides
+OPENERS = "\"'([{“‘«" + MARKDOWN
+
+
+class SentenceSegmenter:
+    """incremental sentence splitter for streamed LLM tokens
+
+    every character is looked at once, text is kept as a list of pending
+    fragments and only joined when an utterance is emitted
+
+    a terminator only ends a sentence when followed by whitespace, so
+    decimals ("3.14"), ellipsis and urls split across tokens stay whole,
+    known abbreviations ("Dr.", "e.g.") and initials never end a sentence,
+    "No." and "Nr." only when followed by a number, closing quotes, brackets
+    and markdown markers ("**Bold.** Next") stay with the sentence they end,
+    and newlines always do (markdown lists, paragraphs), except numbered
+    list markers ("1. ") which are kept with their item
+
+    the first utterance can be flushed early, at a word boundary, once
+    early_flush_words words were received or early_flush_ms elapsed since
+    the first token, to cut the time until TTS starts speaking
+    """
+
+    def __init__(self, lang: Optional[str] = None,
+                 early_flush_words: int = 0,
+                 early_flush_ms: float = 0):
+        lang = (lang or "en").split("-")[0].lower()
+        self.abbreviations = ABBREVIATIONS.get(lang, ABBREVIATIONS["en"])
+        self.early_flush_words = early_flush_words
+        self.early_flush_ms = early_flush_ms
+        self._parts: List[str] = []  # fragments of the current sentence
+        self._word: List[str] = []  # chars of the current word
+        self._candidate = False  # terminator seen, waiting for the next char
+        self._number_abbreviation = False  # the terminator ends "No.", "Nr."...
+        self._pending_split: Optional[int] = None  # fragments ending the sentence unless a number follows
+        self._line_start = True  # only digits since the start of the line
+        self._n_words = 0
+        self._emitted = 0
+        self._start: Optional[float] = None
+
+    def _is_abbreviation(self) -> bool:
+        word = "".join(self._word).rstrip(".").lstrip(OPENERS)
+        if not word:
+            return False
+        if len(word) == 1 and word.isupper():
+            return True  # initials, "J. R. R. Tolkien"
+        if self._line_start and word.isdigit():
+            return True  # numbered list marker
+        return word.lower() in self.abbreviations
+
+    def _is_number_abbreviation(self) -> bool:
+        return "".join(self._word).rstrip(".").lstrip(OPENERS).lower() in NUMBER_ABBREVIATIONS
+
+    def _early_flush(self) -> bool:
+        if self._emitted:
+            return False
+        if self.early_flush_words and self._n_words >= self.early_flush_words:
+            return True
+        return bool(self.early_flush_ms and self._start is not None and
+                    (time.monotonic() - self._start) * 1000 >= self.early_flush_ms)
+
+    def _emit(self, fragment: str, out: List[str]):
+        """close the sentence with the last fragment of text"""
+        self._parts.append(fragment)
+        sentence = "".join(self._parts).strip()
+        self._parts = []
+        self._word = []
+        self._n_words = 0
+        self._pending_split = None
+        if sentence:
+            self._emitted += 1
+            out.append(sentence)
+
+    def _split_pending(self, out: List[str]):
+        """the word after "No." is not a number, it ended a sentence"""
+        head, self._parts = self._parts[:self._pending_split], self._parts[self._pending_split:]
+        self._pending_split = None
+        self._n_words = 0
+        sentence = "".join(head).strip()
+        if sentence:
+            self._emitted += 1
+            out.append(sentence)
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Args:
+            chunk: text streamed by the LLM
+
+        Returns:
+            utterances completed by this chunk, often empty
+        """
+        if self._start is None:
+            self._start = time.monotonic()
+        out: List[str] = []
+        begin = 0  # start of the not yet emitted part of chunk
+        for idx, char in enumerate(chunk):
+            if self._pending_split is not None and not char.isspace():
+                if not char.isdigit():
+                    self._parts.append(chunk[begin:idx])
+                    begin = idx
+                    self._split_pending(out)
+                self._pending_split = None
+            if self._candidate:
+                if char in CLOSERS or char in MARKDOWN or char in TERMINATORS:
+                    continue
+                self._candidate = False
+                if char.isspace() and self._number_abbreviation:
+                    # wait for the next word to know if the sentence ended
+                    self._parts.append(chunk[begin:idx])
+                    begin = idx
+                    self._pending_split = len(self._parts)
+                elif char.isspace():
+                    self._emit(chunk[begin:idx], out)
+                    begin = idx
+            if char == "\n" or char in FULLWIDTH_TERMINATORS:
+                self._emit(chunk[begin:idx + 1], out)
+                begin = idx + 1
+                self._line_start = char == "\n"
+            elif char.isspace():
+                if self._word:
+                    self._n_words += 1
+                    self._line_start = False
+                    if self._early_flush():
+                        self._emit(chunk[begin:idx], out)
+                        begin = idx
+                self._word = []
+            elif char in TERMINATORS:
+                if char != "." or not self._is_abbreviation():
+                    self._candidate = True
+                    self._number_abbreviation = char == "." and self._is_number_abbreviation()
+                self._word.append(char)
+            else:
+                if self._line_start and not char.isdigit():
+                    self._line_start = False
+                self._word.append(char)
+        if begin < len(chunk):
+            self._parts.append(chunk[begin:])
+        return out
+
+    def flush(self) -> Optional[str]:
+        """end of stream, return whatever text is left"""
+        sentence = "".join(self._parts).strip()
+        self._parts = []
+        self._word = []
+        self._candidate = False
+        self._pending_split = None
+        self._line_start = True
+        self._n_words = 0
+        return sentence or None
@@ -0,0 +1,235 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class StreamTee:
+    """fan out one upstream iterator to several consumers
+
+    a background thread reads the upstream and buffers every chunk, consumers
+    that join late get the buffered chunks first; a consumer that stops
+    reading does not affect the others, the upstream is only closed once
+    every consumer left
+    """
+
+    def __init__(self, source: Iterator[str], on_done: Optional[Callable[[], None]] = None):
+        self.source = source
+        self.on_done = on_done
+        self.chunks: List[str] = []
+        self.done = False
+        self.abandoned = False
+        self.error: Optional[BaseException] = None
+        self.consumers = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self) -> Optional[Iterator[str]]:
+        """a new consumer, None if the upstream was already abandoned"""
+        with self._cond:
+            if self.abandoned:
+                return None
+            self.consumers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._pump, daemon=True)
+                self._thread.start()
+        return self._iter()
+
+    def _pump(self):
+        try:
+            for chunk in self.source:
+                with self._cond:
+                    if not self.consumers:
+                        self.abandoned = True
+                        break
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.abandoned and hasattr(self.source, "close"):
+                self.source.close()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            if self.on_done is not None:
+                self.on_done()
+
+    def _iter(self) -> Iterator[str]:
+        idx = 0
+        try:
+            while True:
+                with self._cond:
+                    while idx >= len(self.chunks) and not self.done:
+                        self._cond.wait()
+                    new = self.chunks[idx:]
+                    if not new:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                idx += len(new)
+                yield from new
+        finally:
+            with self._cond:
+                self.consumers -= 1
+
+
+class SingleFlight:
+    """share one upstream call between all threads asking for the same key at the same time
+
+    only requests in flight are shared, a request arriving after the call
+    finished starts a new one (caching finished answers is ResponseCache's job)
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, StreamTee] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable[[], str]) -> str:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stream(self, key: str, func: Callable[[], Iterator[str]]) -> Iterator[str]:
+        with self._lock:
+            tee = self._streams.get(key)
+            consumer = tee.subscribe() if tee is not None else None
+            if consumer is None:
+                tee = self._streams[key] = StreamTee(func(), on_done=lambda: self._forget(key, tee))
+                consumer = tee.subscribe()
+        yield from consumer
+
+    def _forget(self, key: str, tee: StreamTee):
+        with self._lock:
+            if self._streams.get(key) is tee:
+                del self._streams[key]
+
+
+class AsyncStreamTee:
+    """asyncio flavour of StreamTee, the upstream is read by a task"""
+
+    def __init__(self, source: AsyncIterator[str], on_done: Optional[Callable[[], None]] = None):
+        self.source = source
+        self.on_done = on_done
+        self.chunks: List[str] = []
+        self.done = False
+        self.abandoned = False
+        self.error: Optional[BaseException] = None
+        self.consumers = 0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> Optional[AsyncIterator[str]]:
+        if self.abandoned:
+            return None
+        self.consumers += 1
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._pump())
+        return self._iter()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self):
+        try:
+            async for chunk in self.source:
+                if not self.consumers:
+                    self.abandoned = True
+                    break
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.abandoned and hasattr(self.source, "aclose"):
+                await self.source.aclose()
+            self.done = True
+            self._notify()
+            if self.on_done is not None:
+                self.on_done()
+
+    async def _iter(self) -> AsyncIterator[str]:
+        idx = 0
+        try:
+            while True:
+                while idx >= len(self.chunks) and not self.done:
+                    await self._changed.wait()
+                new = self.chunks[idx:]
+                if not new:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                idx += len(new)
+                for chunk in new:
+                    yield chunk
+        finally:
+            self.consumers -= 1
+
+
+class AsyncSingleFlight:
+    """share one upstream call between all tasks asking for the same key at the same time
+
+    cancelling a caller does not cancel the shared call, unless it was the last one waiting for it
+    """
+
+    def __init__(self):
+        self._calls: Dict[tuple, asyncio.Future] = {}
+        self._waiters: Dict[tuple, int] = {}
+        self._streams: Dict[tuple, AsyncStreamTee] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[str]]) -> str:
+        key = (id(asyncio.get_running_loop()), key)
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1:
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    async def stream(self, key: str, func: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        key = (id(asyncio.get_running_loop()), key)
+        tee = self._streams.get(key)
+        consumer = tee.subscribe() if tee is not None else None
+        if consumer is None:
+            tee = self._streams[key] = AsyncStreamTee(func(), on_done=lambda: self._forget(key, tee))
+            consumer = tee.subscribe()
+        async for chunk in consumer:
+            yield chunk
+
+    def _forget(self, key: tuple, tee: AsyncStreamTee):
+        if self._streams.get(key) is tee:
+            del self._streams[key]
@@ -0,0 +1,151 @@
+import json
+import re
+from typing import List, Optional
+
+from ovos_utils.log import LOG
+
+# a delta is only worth decoding if it carries text, tool calls, usage, an error or a finish reason
+_PAYLOAD_MARKERS = re.compile(rb'"(?:content|text)"\s*:\s*"[^"]|"tool_calls"|"usage"\s*:\s*\{|'
+                              rb'"error"|"finish_reason"\s*:\s*"')
+
+
+def _has_payload(data: bytes) -> bool:
+    # fast path for the common compact text delta before falling back to the regex
+    if b'"content":"' in data and b'"content":""' not in data:
+        return True
+    return _PAYLOAD_MARKERS.search(data) is not None
+
+
+class SSEDecoder:
+    """incremental server-sent events decoder working on raw bytes
+
+    handles any line ending, comment/keepalive lines, multi-line data fields
+    and events split across network reads; returns (event, data) tuples
+
+    only the incomplete last line is carried over between reads
+    """
+
+    def __init__(self):
+        self._tail = b""  # incomplete last line
+        self._after_cr = False  # the last read ended with \r, a \n starting the next one ends the same line
+        self._event = "message"
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[tuple]:
+        if self._after_cr:
+            self._after_cr = False
+            if chunk.startswith(b"\n"):
+                chunk = chunk[1:]
+        data = self._tail + chunk if self._tail else chunk
+        if b"\r" in data:
+            self._after_cr = data.endswith(b"\r")
+            data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        if b"\n" not in data:
+            self._tail = data
+            return []
+        lines = data.split(b"\n")
+        self._tail = lines.pop()
+        events = []
+        for line in lines:
+            if line.startswith(b"data:"):
+                self._data.append(line[6:] if line[5:6] == b" " else line[5:])
+            elif not line:  # blank line dispatches the event
+                if self._data:
+                    events.append((self._event,
+                                   self._data[0] if len(self._data) == 1 else b"\n".join(self._data)))
+                    self._event = "message"
+                    self._data = []
+            elif line.startswith(b"event:"):
+                self._event = line[6:].strip().decode("utf-8") or "message"
+            # anything else is a comment (keepalive ping) or an unused field
+        return events
+
+    def close(self) -> List[tuple]:
+        """flush a last event not terminated by a blank line"""
+        self._after_cr = False
+        events = self.feed(b"\n\n") if (self._tail or self._data) else []
+        self._tail = b""
+        return events
+
+
+class ChatStreamParser:
+    """turn a streamed /chat/completions (or /completions) answer into text deltas
+
+    JSON is only decoded for events that carry a payload, keepalives and
+    empty deltas are skipped; usage, finish reason, errors and tool calls
+    (assembled from their fragments) are kept in attributes instead of being
+    mixed with the text
+    """
+
+    def __init__(self):
+        self.decoder = SSEDecoder()
+        self.done = False
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.tool_calls: List[dict] = []
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """
+        Args:
+            chunk: raw bytes read from the http response
+
+        Returns:
+            text deltas contained in chunk
+        """
+        events = self.decoder.feed(chunk)
+        return self._handle(events) if events else []
+
+    def close(self) -> List[str]:
+        return self._handle(self.decoder.close())
+
+    def _handle(self, events: List[tuple]) -> List[str]:
+        deltas = []
+        for event, data in events:
+            if self.done:
+                break
+            if data == b"[DONE]":
+                self.done = True
+                break
+            if event != "error" and not _has_payload(data):
+                continue
+            try:
+                chunk = json.loads(data.decode("utf-8"))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                LOG.warning(f"ignoring malformed stream event: {data[:100]}")
+                continue
+            if event == "error" or "error" in chunk:
+                error = chunk.get("error", chunk)
+                self.error = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+                LOG.error("API returned an error: " + self.error)
+                self.done = True
+                break
+            choices = chunk.get("choices")
+            if choices:
+                choice = choices[0]
+                delta = choice.get("delta")
+                content = delta.get("content") if delta is not None else choice.get("text")
+                if content:
+                    deltas.append(content)
+                if delta and delta.get("tool_calls"):
+                    self._add_tool_calls(delta["tool_calls"])
+                if choice.get("finish_reason"):
+                    self.finish_reason = choice["finish_reason"]
+            if chunk.get("usage"):
+                self.usage = chunk["usage"]
+        return deltas
+
+    def _add_tool_calls(self, fragments: List[dict]):
+        """tool calls are streamed in fragments, the arguments JSON split across many of them"""
+        for fragment in fragments:
+            idx = fragment.get("index", len(self.tool_calls))
+            while len(self.tool_calls) <= idx:
+                self.tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+            call = self.tool_calls[idx]
+            if fragment.get("id"):
+                call["id"] = fragment["id"]
+            function = fragment.get("function") or {}
+            if function.get("name"):
+                call["function"]["name"] += function["name"]
+            if function.get("arguments"):
+                call["function"]["arguments"] += function["arguments"]
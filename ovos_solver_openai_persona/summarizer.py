@@ -1,16 +1,124 @@
-from ovos_solver_openai_persona.engines import OpenAIChatCompletionsSolver
-from ovos_plugin_manager.templates.solvers import TldrSolver
+import hashlib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
 from ovos_plugin_manager.templates.language import LanguageTranslator, LanguageDetector
-from typing import Dict, Optional
+from ovos_plugin_manager.templates.solvers import TldrSolver
+from ovos_utils.log import LOG
+
+from ovos_solver_openai_persona.cache import LRUStore
+from ovos_solver_openai_persona.context import TokenCounter
+from ovos_solver_openai_persona.engines import MessageList, get_shared_engine
+from ovos_solver_openai_persona.payload import generation_params
+from ovos_solver_openai_persona.scheduler import PRIORITY_BACKGROUND
+
+# settings of the summarizer itself, not passed on to its chat engine
+_SUMMARIZER_KEYS = ("prompt_template", "chunk_prompt_template", "chunk_tokens", "chunk_overlap",
+                    "max_workers", "chunk_cache_size", "chunk_cache_ttl")
+
+_PARAGRAPHS = re.compile(r"\n\s*\n")
+_SENTENCES = re.compile(r"(?<=[.!?…。！？])\s+")
+
+
+def _split_units(text: str, counter: TokenCounter, max_tokens: int) -> List[str]:
+    """paragraphs, or sentences of paragraphs too long for a chunk, or hard cuts of sentences too long"""
+    units = []
+    for paragraph in _PARAGRAPHS.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if counter.count(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCES.split(paragraph):
+            while counter.count(sentence) > max_tokens:
+                head = counter.truncate(sentence, max_tokens)
+                if not head:
+                    break
+                units.append(head)
+                sentence = sentence[len(head):]
+            if sentence.strip():
+                units.append(sentence)
+    return units
+
+
+def _tail(text: str, counter: TokenCounter, max_tokens: int) -> str:
+    """trailing sentences of text worth at most max_tokens, its last max_tokens if the last sentence is longer"""
+    sentences = [s for s in _SENTENCES.split(text) if s.strip()]
+    tail: List[str] = []
+    while sentences and counter.count(" ".join([sentences[-1]] + tail)) <= max_tokens:
+        tail.insert(0, sentences.pop())
+    return " ".join(tail) if tail else counter.tail(text, max_tokens).strip()
+
+
+def _is_anchor(unit: str, n: int, expected_tokens: int) -> bool:
+    """content defined cut point, about one every expected_tokens tokens of text"""
+    digest = hashlib.blake2b(unit.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < n / max(1, expected_tokens) * 2 ** 64
+
+
+def split_document(text: str, counter: TokenCounter,
+                   chunk_tokens: int = 2000, overlap_tokens: int = 100) -> List[str]:
+    """split text into chunks of at most chunk_tokens at paragraph or sentence boundaries
+
+    chunks end after a paragraph/sentence picked by its hash once they hold half of
+    chunk_tokens, or before one that would not fit, so an edit only moves the
+    boundaries next to it and the chunks further away stay the same (and cached)
+
+    every chunk but the first starts with the last overlap_tokens worth of
+    paragraphs/sentences of the previous one, so that context is not lost at the cut,
+    when the last paragraph alone is longer its trailing sentences (or tokens) are carried over
+    """
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+    chunks = []
+    current: List[str] = []
+    tokens: List[int] = []
+    fresh = 0  # units of the chunk that are not carried over
+
+    def cut():
+        nonlocal current, tokens, fresh
+        chunks.append("\n\n".join(current))
+        # carry over the tail of the chunk
+        keep = 0
+        while keep < len(current) and sum(tokens[len(tokens) - keep - 1:]) <= overlap_tokens:
+            keep += 1
+        if keep or not overlap_tokens:
+            current, tokens = current[len(current) - keep:], tokens[len(tokens) - keep:]
+        else:  # the last paragraph alone is longer than the overlap
+            tail = _tail(current[-1], counter, overlap_tokens)
+            current, tokens = ([tail], [counter.count(tail) + 1]) if tail else ([], [])
+        fresh = 0
+
+    for unit in _split_units(text, counter, chunk_tokens - overlap_tokens):
+        n = counter.count(unit) + 1  # paragraph separator
+        if fresh and sum(tokens) + n > chunk_tokens:
+            cut()
+        current.append(unit)
+        tokens.append(n)
+        fresh += 1
+        if sum(tokens) >= chunk_tokens // 2 and _is_anchor(unit, n, chunk_tokens // 4):
+            cut()
+    if fresh:
+        chunks.append("\n\n".join(current))
+    return chunks
 
 
 class OpenAISummarizer(TldrSolver):
     TEMPLATE = """Your task is to summarize the text into a suitable format.
-Answer in plaintext with no formatting, 2 paragraphs long at most. 
+Answer in plaintext with no formatting, 2 paragraphs long at most.
 Focus on the most important information.
 ---------------------
 {content}
 """
+    CHUNK_TEMPLATE = """Your task is to summarize one part of a longer document.
+Answer in plaintext with no formatting, keep names, numbers and key facts.
+Do not mention that this is a part of a document.
+---------------------
+{content}
+"""
+
     def __init__(self, config: Optional[Dict] = None,
                  translator: Optional[LanguageTranslator] = None,
                  detector: Optional[LanguageDetector] = None,
@@ -22,20 +130,96 @@ Focus on the most important information.
                          detector=detector, priority=priority,
                          enable_tx=enable_tx, enable_cache=enable_cache,
                          internal_lang=internal_lang)
-        self.llm = OpenAIChatCompletionsSolver(config=config, translator=translator,
-                                               detector=detector, priority=priority,
-                                               enable_tx=enable_tx, enable_cache=enable_cache,
-                                               internal_lang=internal_lang)
+        # summaries are one-shot, the shared engine keeps no chat history
+        self.llm = get_shared_engine(self.config, plugin_keys=_SUMMARIZER_KEYS)
+        self.initial_prompt = self.config.get("initial_prompt", "You are a helpful assistant.")
+        self.params = generation_params(self.config)
+        # summaries can wait while the endpoint is busy answering someone
+        self.request_priority = self.config.get("request_priority", PRIORITY_BACKGROUND)
+        self.queue_timeout = self.config.get("queue_timeout")
         self.prompt_template = self.config.get("prompt_template") or self.TEMPLATE
+        self.chunk_prompt_template = self.config.get("chunk_prompt_template") or self.CHUNK_TEMPLATE
+        self.chunk_tokens = self.config.get("chunk_tokens", 2000)
+        self.chunk_overlap = self.config.get("chunk_overlap", 100)
+        self.max_workers = self.config.get("max_workers", 4)
+        # chunk hash -> summary, unchanged parts of an edited document are not summarized again
+        self.chunk_cache = LRUStore(max_entries=self.config.get("chunk_cache_size", 512),
+                                    ttl=self.config.get("chunk_cache_ttl", 86400))
+
+    def _messages(self, template: str, content: str) -> MessageList:
+        return [{"role": "system", "content": self.initial_prompt},
+                {"role": "user", "content": template.format(content=content)}]
+
+    def _ask(self, template: str, content: str, lang: Optional[str] = None) -> Optional[str]:
+        return self.llm.continue_chat(self._messages(template, content), lang, params=self.params,
+                                      request_priority=self.request_priority, queue_timeout=self.queue_timeout)
+
+    def _chunk_key(self, chunk: str) -> str:
+        data = "\0".join((self.llm.engine, self.chunk_prompt_template, chunk))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _summarize_chunk(self, chunk: str, lang: Optional[str] = None) -> str:
+        key = self._chunk_key(chunk)
+        summary = self.chunk_cache.get(key)
+        if summary is None:
+            summary = self._ask(self.chunk_prompt_template, chunk, lang)
+            if not summary:
+                LOG.warning("failed to summarize document chunk, using it as is")
+                return chunk
+            self.chunk_cache.put(key, summary)
+        return summary
 
+    def _map(self, chunks: List[str], lang: Optional[str] = None) -> List[str]:
+        if len(chunks) == 1 or self.max_workers <= 1:
+            return [self._summarize_chunk(c, lang) for c in chunks]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+            return list(pool.map(lambda c: self._summarize_chunk(c, lang), chunks))
+
+    def _reduce(self, document: str, lang: Optional[str] = None) -> str:
+        """summarize chunks until what is left fits a single prompt"""
+        counter = self.llm.token_counter
+        while counter.count(document) > self.chunk_tokens:
+            chunks = split_document(document, counter, self.chunk_tokens, self.chunk_overlap)
+            if len(chunks) == 1:
+                break
+            LOG.debug(f"summarizing {len(chunks)} chunks")
+            summaries = self._map(chunks, lang)
+            reduced = "\n\n".join(summaries)
+            if counter.count(reduced) >= counter.count(document):
+                LOG.warning("chunk summaries are not shorter than the document, stopping")
+                document = reduced
+                break
+            document = reduced
+        return document
 
     def get_tldr(self, document: str, lang: Optional[str] = None) -> str:
         """
         Summarize the provided document.
 
+        long documents are split in chunks that are summarized in parallel,
+        the summaries are then summarized together until a single prompt fits
+
         :param document: The text of the document to summarize, assured to be in the default language.
         :param lang: Optional language code.
         :return: A summary of the provided document.
         """
-        prompt = self.prompt_template.format(content=document)
-        return self.llm.get_spoken_answer(prompt, lang)
+        start = time.monotonic()
+        content = self._reduce(document, lang)
+        summary = self._ask(self.prompt_template, content, lang)
+        self.llm.metrics.observe("llm_tldr_seconds", time.monotonic() - start)
+        return summary
+
+    def stream_tldr(self, document: str, lang: Optional[str] = None) -> Iterable[str]:
+        """
+        Summarize the provided document, yielding the final summary sentence by sentence.
+
+        :param document: The text of the document to summarize, assured to be in the default language.
+        :param lang: Optional language code.
+        :return: An iterable of summary sentences.
+        """
+        start = time.monotonic()
+        content = self._reduce(document, lang)
+        yield from self.llm.stream_chat_utterances(self._messages(self.prompt_template, content), lang,
+                                                   params=self.params, request_priority=self.request_priority,
+                                                   queue_timeout=self.queue_timeout)
+        self.llm.metrics.observe("llm_tldr_seconds", time.monotonic() - start)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ovos_utils.log import LOG
+
+from ovos_solver_openai_persona.cache import LRUStore
+from ovos_solver_openai_persona.metrics import Metrics
+
+DEFAULT_TOOL_TIMEOUT = 10  # seconds
+
+
+class ToolCalls(list):
+    """tool calls requested by the model, marks the end of a streamed round"""
+
+
+class Tool:
+    """a python callable the model can call, with the JSON schema of its keyword arguments"""
+
+    def __init__(self, func: Callable[..., Any], name: Optional[str] = None,
+                 description: Optional[str] = None,
+                 parameters: Optional[dict] = None,
+                 idempotent: bool = False,
+                 timeout: Optional[float] = None):
+        self.func = func
+        self.name = name or func.__name__
+        self.description = description or (func.__doc__ or "").strip()
+        self.parameters = parameters or {"type": "object", "properties": {}}
+        self.idempotent = idempotent  # same arguments, same result: results can be cached
+        self.timeout = timeout
+
+    @property
+    def spec(self) -> dict:
+        return {"type": "function",
+                "function": {"name": self.name, "description": self.description, "parameters": self.parameters}}
+
+
+def _content(result: Any) -> str:
+    return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+
+
+class ToolRegistry:
+    """run the tool calls of a model answer
+
+    independent calls of the same answer run in parallel on a thread pool,
+    a call that does not finish within its timeout is answered with an error
+    (its thread is left to finish on its own), results of idempotent tools
+    are cached by arguments
+    """
+
+    def __init__(self, max_workers: int = 4, timeout: float = DEFAULT_TOOL_TIMEOUT,
+                 cache_size: int = 256, cache_ttl: float = 60,
+                 metrics: Optional[Metrics] = None):
+        self.tools: Dict[str, Tool] = {}
+        self.timeout = timeout
+        self.result_cache = LRUStore(max_entries=cache_size, ttl=cache_ttl)
+        self.metrics = metrics or Metrics()
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._specs: List[dict] = []
+
+    @staticmethod
+    def from_config(config: dict, metrics: Optional[Metrics] = None) -> "ToolRegistry":
+        return ToolRegistry(max_workers=config.get("tool_workers", 4),
+                            timeout=config.get("tool_timeout", DEFAULT_TOOL_TIMEOUT),
+                            cache_size=config.get("tool_cache_size", 256),
+                            cache_ttl=config.get("tool_cache_ttl", 60),
+                            metrics=metrics)
+
+    def __bool__(self) -> bool:
+        return bool(self.tools)
+
+    def register(self, tool: Tool):
+        self.tools[tool.name] = tool
+        self._specs = [t.spec for t in self.tools.values()]
+
+    def unregister(self, name: str):
+        self.tools.pop(name, None)
+        self._specs = [t.spec for t in self.tools.values()]
+
+    def specs(self) -> List[dict]:
+        """the "tools" list of a request"""
+        return self._specs
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="openai-tool")
+        return self._executor
+
+    @staticmethod
+    def _cache_key(name: str, arguments: dict) -> str:
+        data = json.dumps([name, arguments], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _call(self, tool: Tool, arguments: dict) -> str:
+        start = time.monotonic()
+        try:
+            result = tool.func(**arguments)
+        except Exception:
+            self.metrics.observe("llm_tool_seconds", time.monotonic() - start, tool=tool.name, outcome="error")
+            raise
+        content = _content(result)
+        self.metrics.observe("llm_tool_seconds", time.monotonic() - start, tool=tool.name, outcome="ok")
+        if tool.idempotent:
+            self.result_cache.put(self._cache_key(tool.name, arguments), content)
+        return content
+
+    def submit(self, calls: List[dict]) -> List[Tuple[dict, Any]]:
+        """start running tool calls, returns (call, Future or ready result) pairs for collect()"""
+        submitted = []
+        for call in calls:
+            function = call.get("function") or {}
+            tool = self.tools.get(function.get("name"))
+            if tool is None:
+                submitted.append((call, {"error": f"unknown tool '{function.get('name')}'"}))
+                continue
+            try:
+                arguments = json.loads(function.get("arguments") or "{}")
+            except json.JSONDecodeError as e:
+                submitted.append((call, {"error": f"invalid arguments: {e}"}))
+                continue
+            if tool.idempotent:
+                cached = self.result_cache.get(self._cache_key(tool.name, arguments))
+                if cached is not None:
+                    self.metrics.observe("llm_tool_seconds", 0, tool=tool.name, outcome="cached")
+                    submitted.append((call, cached))
+                    continue
+            submitted.append((call, self.executor.submit(self._call, tool, arguments)))
+        return submitted
+
+    def collect(self, submitted: List[Tuple[dict, Any]]) -> List[Dict[str, str]]:
+        """wait for submitted tool calls, returns the "tool" messages answering them"""
+        messages = []
+        start = time.monotonic()
+        for call, result in submitted:
+            name = (call.get("function") or {}).get("name")
+            if isinstance(result, Future):
+                tool = self.tools[name]
+                timeout = tool.timeout if tool.timeout is not None else self.timeout
+                try:
+                    result = result.result(timeout=max(0.0, start + timeout - time.monotonic()))
+                except FutureTimeout:
+                    LOG.warning(f"tool '{name}' did not answer within {timeout} seconds")
+                    self.metrics.observe("llm_tool_seconds", timeout, tool=name, outcome="timeout")
+                    result = {"error": f"timed out after {timeout} seconds"}
+                except Exception as e:
+                    LOG.warning(f"tool '{name}' failed: {e}")
+                    result = {"error": str(e)}
+            messages.append({"role": "tool", "tool_call_id": call.get("id", ""), "content": _content(result)})
+        return messages
+
+    def run(self, calls: List[dict]) -> List[Dict[str, str]]:
+        return self.collect(self.submit(calls))
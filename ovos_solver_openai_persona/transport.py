@@ -0,0 +1,169 @@
+import asyncio
+import threading
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ovos_utils.log import LOG
+
+if TYPE_CHECKING:
+    import aiohttp
+
+# (connect, read) timeouts in seconds, read timeout is per chunk when streaming
+DEFAULT_TIMEOUT = (3.05, 60)
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.3
+
+_SESSIONS: Dict[str, requests.Session] = {}
+# (event loop, api_url) -> (session, async generator closing it when the loop shuts down)
+_ASYNC_SESSIONS: Dict[Tuple[asyncio.AbstractEventLoop, str],
+                      Tuple["aiohttp.ClientSession", AsyncIterator[None]]] = {}
+_LOCK = threading.Lock()
+
+
+def _endpoint_key(api_url: str) -> str:
+    return api_url.rstrip("/")
+
+
+def get_session(api_url: str,
+                pool_size: int = DEFAULT_POOL_SIZE,
+                max_retries: int = DEFAULT_RETRIES,
+                backoff_factor: float = DEFAULT_BACKOFF) -> requests.Session:
+    """
+    Get the process wide keep-alive session for an endpoint.
+
+    Sessions are shared by every solver, dialog transformer and summarizer
+    pointing at the same api_url, so warm TCP/TLS connections are reused
+    across plugins. Pool and retry settings are taken from the first caller.
+
+    Args:
+        api_url (str): base url of the OpenAI compatible server
+        pool_size (int): max number of keep-alive connections kept open
+        max_retries (int): retries for connection errors and 502/503/504 answers
+        backoff_factor (float): exponential backoff between retries
+
+    Returns:
+        requests.Session: pooled session for api_url
+    """
+    key = _endpoint_key(api_url)
+    with _LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            retry = Retry(total=max_retries,
+                          connect=max_retries,
+                          read=0,  # never replay a request the server may be generating
+                          status=max_retries,
+                          backoff_factor=backoff_factor,
+                          # 429 is left to the endpoint scheduler, which pauses the endpoint and
+                          # fails over or sheds instead of sleeping while holding a request slot
+                          status_forcelist=(502, 503, 504),
+                          allowed_methods=None,  # LLM calls are POST
+                          respect_retry_after_header=False,
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=pool_size,
+                                  max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[key] = session
+        return session
+
+
+def session_from_config(api_url: str, config: Optional[dict] = None) -> requests.Session:
+    """get_session with pool/retry settings read from a plugin config"""
+    config = config or {}
+    return get_session(api_url,
+                       pool_size=config.get("pool_size", DEFAULT_POOL_SIZE),
+                       max_retries=config.get("max_retries", DEFAULT_RETRIES),
+                       backoff_factor=config.get("retry_backoff", DEFAULT_BACKOFF))
+
+
+def timeout_from_config(config: Optional[dict] = None) -> Tuple[float, float]:
+    """(connect, read) timeout tuple read from a plugin config"""
+    config = config or {}
+    return (config.get("connect_timeout", DEFAULT_TIMEOUT[0]),
+            config.get("timeout", DEFAULT_TIMEOUT[1]))
+
+
+def get_async_session(api_url: str,
+                      pool_size: int = DEFAULT_POOL_SIZE,
+                      timeout: Tuple[float, float] = DEFAULT_TIMEOUT) -> "aiohttp.ClientSession":
+    """
+    Get the pooled aiohttp session for an endpoint in the running event loop.
+
+    aiohttp sessions are bound to the loop that created them, so there is
+    one session per (event loop, api_url) pair. The session is closed when its
+    loop shuts down its async generators, as asyncio.run does before returning,
+    or by close_async_sessions, which a loop closed by hand should await first.
+
+    Args:
+        api_url (str): base url of the OpenAI compatible server
+        pool_size (int): max number of keep-alive connections kept open
+        timeout (Tuple[float, float]): (connect, read) timeouts in seconds
+
+    Returns:
+        aiohttp.ClientSession: pooled session for api_url
+    """
+    try:
+        import aiohttp
+    except ImportError as e:
+        LOG.error("aiohttp is not installed, install with 'pip install ovos-openai-plugin[async]'")
+        raise e
+    loop = asyncio.get_running_loop()
+    key = (loop, _endpoint_key(api_url))
+    with _LOCK:
+        # loops closed without shutting down their async generators
+        for dead in [k for k in _ASYNC_SESSIONS if k[0].is_closed()]:
+            del _ASYNC_SESSIONS[dead]
+        session, _ = _ASYNC_SESSIONS.get(key, (None, None))
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size)
+            session = aiohttp.ClientSession(connector=connector,
+                                            timeout=aiohttp.ClientTimeout(sock_connect=timeout[0],
+                                                                          sock_read=timeout[1]))
+            LOG.debug(f"created pooled async http session for {key[1]} (pool_size={pool_size})")
+            closer = _close_on_shutdown(key, session)
+            try:  # run it up to its yield, the loop tracks async generators once started
+                closer.__anext__().send(None)
+            except StopIteration:
+                pass
+            _ASYNC_SESSIONS[key] = (session, closer)
+        return session
+
+
+async def _close_on_shutdown(key: Tuple[asyncio.AbstractEventLoop, str],
+                             session: "aiohttp.ClientSession") -> AsyncIterator[None]:
+    """async generator the loop closes on shutdown_asyncgens(), closing session with it
+
+    it is started right away so the loop tracks it, the finally block then runs
+    while the loop can still await session.close()
+    """
+    try:
+        yield
+    finally:
+        with _LOCK:
+            if _ASYNC_SESSIONS.get(key, (None,))[0] is session:
+                del _ASYNC_SESSIONS[key]
+        await session.close()
+
+
+def close_sessions():
+    """close all pooled connections, eg. on shutdown or in tests"""
+    with _LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+async def close_async_sessions():
+    """close the pooled aiohttp sessions owned by the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        keys = [k for k in _ASYNC_SESSIONS if k[0] is loop]
+        sessions = [_ASYNC_SESSIONS.pop(k)[0] for k in keys]
+    for session in sessions:
+        await session.close()
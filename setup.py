@@ -51,6 +51,7 @@ PERSONA_ENTRY_POINT = 'Remote Llama=ovos_solver_openai_persona:LLAMA_DEMO'
 PLUGIN_ENTRY_POINT = 'ovos-solver-openai-plugin=ovos_solver_openai_persona:OpenAIPersonaSolver'
 DIALOG_PLUGIN_ENTRY_POINT = 'ovos-dialog-transformer-openai-plugin=ovos_solver_openai_persona.dialog_transformers:OpenAIDialogTransformer'
 SUMMARIZER_ENTRY_POINT = 'ovos-summarizer-openai-plugin=ovos_solver_openai_persona.summarizer:OpenAISummarizer'
+PREWARM_SCRIPT = 'ovos-openai-prewarm-dialogs=ovos_solver_openai_persona.dialog_transformers:main'
 
 
 setup(
@@ -68,9 +69,14 @@ setup(
         'neon.plugin.solver': PLUGIN_ENTRY_POINT,
         "opm.transformer.dialog": DIALOG_PLUGIN_ENTRY_POINT,
         'opm.solver.summarization': SUMMARIZER_ENTRY_POINT,
-        "opm.plugin.persona": PERSONA_ENTRY_POINT
+        "opm.plugin.persona": PERSONA_ENTRY_POINT,
+        "console_scripts": [PREWARM_SCRIPT]
     },
     install_requires=required("requirements.txt"),
+    extras_require={
+        "async": ["aiohttp>=3.10"],
+        "tiktoken": ["tiktoken"]
+    },
     long_description=long_description,
     long_description_content_type='text/markdown'
 )
@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ovos_solver_openai_persona.engines import OpenAIChatCompletionsSolver
+from ovos_solver_openai_persona.memory import InMemoryChatMemory, PersistentChatMemory
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+def questions(pairs):
+    return [q for q, _ in pairs]
+
+
+class TestInMemoryChatMemory(unittest.TestCase):
+    def test_window_and_sessions(self):
+        memory = InMemoryChatMemory(max_turns=2)
+        for i in range(3):
+            memory.append("a", f"q{i}", f"a{i}")
+        memory.append("b", "hi", "hello")
+        self.assertEqual(questions(memory.get("a")), ["q1", "q2"])
+        self.assertEqual(questions(memory.get("b")), ["hi"])
+        memory.clear("a")
+        self.assertEqual(memory.get("a"), [])
+        self.assertEqual(questions(memory.get("b")), ["hi"])
+
+    def test_evicts_least_recently_used(self):
+        memory = InMemoryChatMemory(max_turns=2, max_total_turns=3)
+        memory.append("a", "q", "a")
+        memory.append("b", "q", "a")
+        memory.append("c", "q", "a")
+        memory.get("a")
+        memory.append("d", "q", "a")
+        self.assertEqual(memory.get("b"), [])
+        self.assertEqual(len(memory.get("a")), 1)
+
+
+class TestPersistentChatMemory(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def log_records(self, session_id):
+        with open(os.path.join(self.path, f"{session_id}.jsonl"), encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_reload(self):
+        memory = PersistentChatMemory(self.path, max_turns=3)
+        for i in range(2):
+            memory.append("s", f"q{i}", f"a{i}")
+        reloaded = PersistentChatMemory(self.path, max_turns=3)
+        self.assertEqual(reloaded.get("s"), [("q0", "a0"), ("q1", "a1")])
+        self.assertEqual(reloaded.get("other"), [])
+
+    def test_reload_after_truncated_line(self):
+        memory = PersistentChatMemory(self.path, max_turns=3)
+        memory.append("s", "q0", "a0")
+        with open(os.path.join(self.path, "s.jsonl"), "a", encoding="utf-8") as f:
+            f.write('["t","q1","a')  # crashed while writing
+        reloaded = PersistentChatMemory(self.path, max_turns=3)
+        self.assertEqual(questions(reloaded.get("s")), ["q0"])
+        # the next record starts on a line of its own
+        reloaded.append("s", "q2", "a2")
+        again = PersistentChatMemory(self.path, max_turns=3)
+        self.assertEqual(questions(again.get("s")), ["q0", "q2"])
+
+    def test_session_ids_are_escaped(self):
+        memory = PersistentChatMemory(self.path)
+        memory.append("../evil/id", "q", "a")
+        self.assertEqual(os.listdir(self.path), ["..%2Fevil%2Fid.jsonl"])
+        self.assertEqual(PersistentChatMemory(self.path).get("../evil/id"), [("q", "a")])
+
+    def test_compaction_without_summary(self):
+        memory = PersistentChatMemory(self.path, max_turns=2, compact_turns=3)
+        for i in range(5):
+            memory.append("s", f"q{i}", f"a{i}")
+        self.assertEqual(questions(memory.get("s")), ["q3", "q4"])
+        # 3 turns fell out of the window, the log was rewritten with the 2 still sent
+        self.assertEqual(self.log_records("s"), [["t", "q3", "a3"], ["t", "q4", "a4"]])
+        self.assertEqual(questions(PersistentChatMemory(self.path, max_turns=2).get("s")), ["q3", "q4"])
+
+    def test_summary_batches(self):
+        calls = []
+
+        def summarize(summary, pairs):
+            calls.append(questions(pairs))
+            return (summary or "") + "".join(q for q, _ in pairs)
+
+        memory = PersistentChatMemory(self.path, max_turns=2, summarize=summarize, summary_batch=3)
+        for i in range(4):
+            memory.append("s", f"q{i}", f"a{i}")
+        # fewer than summary_batch turns out of the window, they are still sent
+        self.assertEqual(calls, [])
+        self.assertEqual(questions(memory.get("s")), ["q0", "q1", "q2", "q3"])
+        memory.append("s", "q4", "a4")
+        wait_for(lambda: memory.get_summary("s"))
+        self.assertEqual(calls, [["q0", "q1", "q2"]])
+        self.assertEqual(memory.get_summary("s"), "q0q1q2")
+        self.assertEqual(questions(memory.get("s")), ["q3", "q4"])
+
+        reloaded = PersistentChatMemory(self.path, max_turns=2, summarize=summarize, summary_batch=3)
+        self.assertEqual(reloaded.get_summary("s"), "q0q1q2")
+        self.assertEqual(questions(reloaded.get("s")), ["q3", "q4"])
+
+    def test_failed_summary_is_retried(self):
+        results = [None, "summary"]
+        memory = PersistentChatMemory(self.path, max_turns=1, summary_batch=1,
+                                      summarize=lambda summary, pairs: results.pop(0))
+        memory.append("s", "q0", "a0")
+        memory.append("s", "q1", "a1")
+        wait_for(lambda: not memory._sessions["s"].summarizing)
+        self.assertIsNone(memory.get_summary("s"))
+        memory.append("s", "q2", "a2")
+        wait_for(lambda: memory.get_summary("s"))
+        self.assertEqual(questions(memory.get("s")), ["q2"])
+
+    def test_compaction_keeps_summary(self):
+        memory = PersistentChatMemory(self.path, max_turns=1, summary_batch=1, compact_turns=2,
+                                      summarize=lambda summary, pairs: f"{summary or ''}+{len(pairs)}")
+        for i in range(3):
+            memory.append("s", f"q{i}", f"a{i}")
+            wait_for(lambda: not memory._sessions["s"].summarizing)
+        records = self.log_records("s")
+        self.assertEqual(records[0][0], "s")
+        self.assertLess(len(records), 5)
+        reloaded = PersistentChatMemory(self.path, max_turns=1, summarize=lambda summary, pairs: None)
+        self.assertEqual(reloaded.get_summary("s"), memory.get_summary("s"))
+        self.assertEqual(questions(reloaded.get("s")), ["q2"])
+
+    def test_clear(self):
+        memory = PersistentChatMemory(self.path)
+        memory.append("a", "q", "a")
+        memory.append("b", "q", "a")
+        memory.clear("a")
+        self.assertEqual(sorted(os.listdir(self.path)), ["b.jsonl"])
+        memory.clear()
+        self.assertEqual(os.listdir(self.path), [])
+        self.assertEqual(memory.get("b"), [])
+
+
+class TestChatHistory(unittest.TestCase):
+    def test_summary_is_its_own_message(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        solver = OpenAIChatCompletionsSolver({"key": "sk-test", "memory_path": path, "memory_size": 1,
+                                              "memory_summary_batch": 1})
+        solver.chat_memory.summarize = lambda summary, pairs: "the user likes cats"
+        solver.chat_memory.append("s", "q0", "a0")
+        solver.chat_memory.append("s", "q1", "a1")
+        wait_for(lambda: solver.chat_memory.get_summary("s"))
+        messages = solver.get_chat_history("Be nice.", session_id="s")
+        # the system prompt stays byte identical, the summary follows it
+        self.assertEqual(messages, [
+            {"role": "system", "content": "Be nice."},
+            {"role": "system", "content": "Summary of the conversation so far:\nthe user likes cats"},
+            {"role": "user", "content": "q1"},
+            {"role": "assistant", "content": "a1"},
+        ])
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+import unittest
+from email.utils import formatdate
+
+from ovos_solver_openai_persona.endpoints import Endpoint
+from ovos_solver_openai_persona.engines import _http_error
+from ovos_solver_openai_persona.scheduler import EndpointScheduler, retry_after
+
+
+def queue(scheduler, priorities, admitted, timeout=2.0):
+    """start a thread per priority, in that order, each waiting for a slot and releasing it right away"""
+    threads = []
+    for priority in priorities:
+        def run(priority=priority):
+            if scheduler.acquire(priority, timeout=timeout):
+                admitted.append((priority, time.monotonic()))
+                scheduler.release()
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        # wait for it to be queued so the sequence numbers follow the list
+        deadline = time.monotonic() + 1
+        while scheduler.queued < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.001)
+    return threads
+
+
+class TestEndpointScheduler(unittest.TestCase):
+    def test_priority_order(self):
+        scheduler = EndpointScheduler("http://test", max_in_flight=1)
+        self.assertTrue(scheduler.acquire())
+        admitted = []
+        threads = queue(scheduler, [100, 0, 50, 0], admitted)
+        scheduler.release()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual([p for p, _ in admitted], [0, 0, 50, 100])
+        self.assertEqual(scheduler.in_flight, 0)
+
+    def test_token_bucket(self):
+        scheduler = EndpointScheduler("http://test", rate=20, burst=2)
+        start = time.monotonic()
+        admitted = []
+        for _ in range(6):
+            self.assertTrue(scheduler.acquire())
+            admitted.append(time.monotonic() - start)
+            scheduler.release()
+        # the burst goes through at once, then one request every 1/rate seconds
+        self.assertLess(admitted[1], 0.03)
+        self.assertGreaterEqual(admitted[5], 4 / 20 - 0.02)
+        self.assertLess(admitted[5], 4 / 20 + 0.15)
+
+    def test_token_bucket_priority_order(self):
+        scheduler = EndpointScheduler("http://test", rate=20, burst=1)
+        self.assertTrue(scheduler.acquire())  # empties the bucket
+        scheduler.release()
+        admitted = []
+        threads = queue(scheduler, [100, 50, 0], admitted)
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual([p for p, _ in admitted], [0, 50, 100])
+
+    def test_pause_order(self):
+        scheduler = EndpointScheduler("http://test", max_in_flight=1)
+        scheduler.pause(0.2)
+        paused_until = time.monotonic() + 0.2
+        admitted = []
+        threads = queue(scheduler, [100, 50, 0], admitted)
+        for thread in threads:
+            thread.join(2)
+        # nothing goes through during the pause, then the most urgent first
+        self.assertEqual([p for p, _ in admitted], [0, 50, 100])
+        self.assertGreaterEqual(admitted[0][1], paused_until - 0.01)
+
+    def test_pause_is_not_shortened(self):
+        scheduler = EndpointScheduler("http://test")
+        scheduler.pause(0.3)
+        scheduler.pause(0.05)
+        start = time.monotonic()
+        self.assertTrue(scheduler.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_shed_after_timeout(self):
+        scheduler = EndpointScheduler("http://test", max_in_flight=1)
+        self.assertTrue(scheduler.acquire())
+        self.assertFalse(scheduler.acquire(timeout=0.05))
+        self.assertEqual(scheduler.queued, 0)
+        scheduler.release()
+        self.assertTrue(scheduler.acquire(timeout=0.05))
+
+    def test_async_priority_order(self):
+        scheduler = EndpointScheduler("http://test", max_in_flight=1)
+        admitted = []
+
+        async def request(priority):
+            if await scheduler.acquire_async(priority, timeout=2):
+                admitted.append(priority)
+                await asyncio.sleep(0)
+                scheduler.release()
+
+        async def main():
+            scheduler.pause(0.1)
+            await asyncio.gather(*(request(p) for p in (100, 50, 0)))
+
+        asyncio.run(main())
+        self.assertEqual(admitted, [0, 50, 100])
+
+    def test_async_cancelled_waiter(self):
+        scheduler = EndpointScheduler("http://test", max_in_flight=1)
+
+        async def main():
+            self.assertTrue(await scheduler.acquire_async())
+            waiter = asyncio.ensure_future(scheduler.acquire_async())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            self.assertEqual(scheduler.queued, 0)
+            scheduler.release()
+            self.assertTrue(await scheduler.acquire_async(timeout=0.1))
+
+        asyncio.run(main())
+
+
+class TestRateLimited(unittest.TestCase):
+    def test_retry_after(self):
+        self.assertEqual(retry_after("2"), 2.0)
+        self.assertIsNone(retry_after(None))
+        self.assertIsNone(retry_after("soon"))
+        self.assertAlmostEqual(retry_after(formatdate(time.time() + 30, usegmt=True)), 30, delta=2)
+
+    def test_429_pauses_the_endpoint(self):
+        endpoint = Endpoint("http://test-429", "sk-test", scheduler=EndpointScheduler("http://test-429", max_in_flight=1))
+        self.assertTrue(_http_error(endpoint, 429, "slow down", {"Retry-After": "0.2"}))
+        admitted = []
+        threads = queue(endpoint.scheduler, [100, 0], admitted)
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual([p for p, _ in admitted], [0, 100])
+        self.assertGreaterEqual(admitted[0][1], endpoint.scheduler.paused_until - 0.01)
+
+    def test_other_errors_do_not_pause(self):
+        endpoint = Endpoint("http://test-500", "sk-test", scheduler=EndpointScheduler("http://test-500"))
+        self.assertTrue(_http_error(endpoint, 503, "down", {}))
+        self.assertFalse(_http_error(endpoint, 400, "bad request", {}))
+        self.assertEqual(endpoint.scheduler.paused_until, 0.0)
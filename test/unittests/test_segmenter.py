@@ -0,0 +1,68 @@
+import unittest
+
+from ovos_solver_openai_persona.segmenter import SentenceSegmenter
+
+
+def segment(text, chunk_size=None, lang=None):
+    segmenter = SentenceSegmenter(lang=lang)
+    chunks = [text] if chunk_size is None else [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    sentences = []
+    for chunk in chunks:
+        sentences += segmenter.feed(chunk)
+    last = segmenter.flush()
+    return sentences + [last] if last else sentences
+
+
+class TestSentenceSegmenter(unittest.TestCase):
+    def test_sentences(self):
+        self.assertEqual(segment("Hello there. How are you? Fine!"),
+                         ["Hello there.", "How are you?", "Fine!"])
+
+    def test_abbreviations(self):
+        self.assertEqual(segment("Dr. Smith met Mr. Jones, e.g. at work. Then left."),
+                         ["Dr. Smith met Mr. Jones, e.g. at work.", "Then left."])
+        self.assertEqual(segment("J. R. R. Tolkien wrote it. Yes."),
+                         ["J. R. R. Tolkien wrote it.", "Yes."])
+
+    def test_abbreviations_per_language(self):
+        self.assertEqual(segment("O Sr. Cabral chegou. Depois partiu.", lang="pt-PT"),
+                         ["O Sr. Cabral chegou.", "Depois partiu."])
+        self.assertEqual(segment("Das ist z.B. gut. Ja.", lang="de"),
+                         ["Das ist z.B. gut.", "Ja."])
+
+    def test_number_abbreviations(self):
+        self.assertEqual(segment("See No. 5 for details. Ok."), ["See No. 5 for details.", "Ok."])
+        self.assertEqual(segment("The answer is No. Sorry."), ["The answer is No.", "Sorry."])
+
+    def test_decimals(self):
+        self.assertEqual(segment("Pi is 3.14 roughly. It costs $2.50."),
+                         ["Pi is 3.14 roughly.", "It costs $2.50."])
+
+    def test_ellipsis(self):
+        self.assertEqual(segment("Well... maybe. Sure."), ["Well...", "maybe.", "Sure."])
+
+    def test_closing_quotes(self):
+        self.assertEqual(segment('He said "stop." Then ran.'), ['He said "stop."', "Then ran."])
+
+    def test_markdown_emphasis(self):
+        self.assertEqual(segment("**Bold.** Next one."), ["**Bold.**", "Next one."])
+        self.assertEqual(segment("It is *done!* Then _more._ Ok"), ["It is *done!*", "Then _more._", "Ok"])
+        self.assertEqual(segment("Ask **Dr. Who** now. Ok"), ["Ask **Dr. Who** now.", "Ok"])
+
+    def test_numbered_list(self):
+        self.assertEqual(segment("Steps:\n1. Open it\n2. Close it"),
+                         ["Steps:", "1. Open it", "2. Close it"])
+
+    def test_split_tokens(self):
+        text = "Dr. Smith paid 3.14 dollars. **Bold.** Next one. The answer is No. Sorry."
+        expected = segment(text)
+        for size in (1, 2, 3, 7):
+            self.assertEqual(segment(text, size), expected)
+
+    def test_fullwidth(self):
+        self.assertEqual(segment("你好。再见！"), ["你好。", "再见！"])
+
+    def test_early_flush(self):
+        segmenter = SentenceSegmenter(early_flush_words=3)
+        self.assertEqual(segmenter.feed("one two three four five six. seven "), ["one two three", "four five six."])
+        self.assertEqual(segmenter.flush(), "seven")
@@ -0,0 +1,281 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from ovos_solver_openai_persona.singleflight import AsyncSingleFlight, SingleFlight, StreamTee
+
+
+class Source:
+    """upstream stream handing out one chunk each time step() is called"""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = list(chunks)
+        self.error = error
+        self.closed = False
+        self.calls = 0
+        self._steps = threading.Semaphore(0)
+
+    def step(self, n=1):
+        for _ in range(n):
+            self._steps.release()
+
+    def __call__(self):
+        self.calls += 1
+        return self._gen()
+
+    def _wait(self):
+        if not self._steps.acquire(timeout=2):
+            raise TimeoutError("step() was not called")
+
+    def _gen(self):
+        try:
+            for chunk in self.chunks:
+                self._wait()
+                yield chunk
+            if self.error is not None:
+                self._wait()
+                raise self.error
+        finally:
+            self.closed = True
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_do_shares_the_call(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return "answer"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("k", func)))
+        leader.start()
+        started.wait(2)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("k", func))) for _ in range(3)]
+        for t in followers:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in [leader] + followers:
+            t.join(2)
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ["answer"] * 4)
+        # finished calls are not cached
+        self.assertEqual(flight.do("k", lambda: "again"), "again")
+
+    def test_do_leader_error(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def func():
+            started.set()
+            release.wait(2)
+            raise ValueError("boom")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("k", func)
+            except ValueError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(2)
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join(2)
+        follower.join(2)
+        self.assertEqual(errors, ["boom", "boom"])
+        self.assertEqual(flight.do("k", lambda: "ok"), "ok")
+
+    def test_stream_is_shared(self):
+        flight = SingleFlight()
+        source = Source(["a", "b", "c"])
+        first = flight.stream("k", source)
+        source.step()
+        self.assertEqual(next(first), "a")
+        # a late consumer gets the buffered chunks first
+        second = flight.stream("k", source)
+        self.assertEqual(next(second), "a")
+        source.step(2)
+        self.assertEqual(list(first), ["b", "c"])
+        self.assertEqual(list(second), ["b", "c"])
+        self.assertEqual(source.calls, 1)
+
+    def test_stream_consumer_stops_early(self):
+        flight = SingleFlight()
+        source = Source(["a", "b", "c"])
+        first = flight.stream("k", source)
+        second = flight.stream("k", source)
+        source.step()
+        self.assertEqual(next(first), "a")
+        self.assertEqual(next(second), "a")
+        first.close()
+        source.step(2)
+        self.assertEqual(list(second), ["b", "c"])
+        self.assertEqual(source.calls, 1)
+
+    def test_stream_every_consumer_stops(self):
+        flight = SingleFlight()
+        source = Source(["a", "b", "c"])
+        consumer = flight.stream("k", source)
+        source.step()
+        self.assertEqual(next(consumer), "a")
+        consumer.close()
+        source.step()
+        wait_for(lambda: source.closed)
+        # the abandoned upstream is not joined, a new call starts
+        source.step(3)
+        self.assertEqual(list(flight.stream("k", source)), ["a", "b", "c"])
+        self.assertEqual(source.calls, 2)
+
+    def test_stream_leader_error(self):
+        flight = SingleFlight()
+        source = Source(["a"], error=ValueError("boom"))
+        first = flight.stream("k", source)
+        second = flight.stream("k", source)
+        source.step()
+        self.assertEqual(next(first), "a")
+        self.assertEqual(next(second), "a")
+        source.step()
+        for consumer in (first, second):
+            with self.assertRaises(ValueError):
+                next(consumer)
+        self.assertEqual(source.calls, 1)
+
+    def test_tee_on_done(self):
+        done = threading.Event()
+        tee = StreamTee(iter(["a", "b"]), on_done=done.set)
+        self.assertEqual(list(tee.subscribe()), ["a", "b"])
+        self.assertTrue(done.wait(2))
+
+
+class TestAsyncSingleFlight(unittest.TestCase):
+    def test_do_shares_the_call(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def main():
+            return await asyncio.gather(*(flight.do("k", func) for _ in range(4)))
+
+        self.assertEqual(asyncio.run(main()), ["answer"] * 4)
+        self.assertEqual(calls, [1])
+
+    def test_do_cancelled_caller(self):
+        flight = AsyncSingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def main():
+            first = asyncio.ensure_future(flight.do("k", func))
+            second = asyncio.ensure_future(flight.do("k", func))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            # the shared call goes on for the caller still waiting
+            return await second
+
+        self.assertEqual(asyncio.run(main()), "answer")
+
+    def test_do_leader_error(self):
+        flight = AsyncSingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def main():
+            return await asyncio.gather(flight.do("k", func), flight.do("k", func), return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertEqual([type(r) for r in results], [ValueError, ValueError])
+
+    def test_stream_consumer_stops_early(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def source():
+            calls.append(1)
+            for chunk in ["a", "b", "c"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def main():
+            first = flight.stream("k", source)
+            second = flight.stream("k", source)
+            self.assertEqual(await first.__anext__(), "a")
+            await first.aclose()
+            return [chunk async for chunk in second]
+
+        self.assertEqual(asyncio.run(main()), ["a", "b", "c"])
+        self.assertEqual(calls, [1])
+
+    def test_stream_leader_error(self):
+        flight = AsyncSingleFlight()
+
+        async def source():
+            yield "a"
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def consume():
+            chunks = []
+            try:
+                async for chunk in flight.stream("k", source):
+                    chunks.append(chunk)
+            except ValueError:
+                chunks.append("error")
+            return chunks
+
+        async def main():
+            return await asyncio.gather(consume(), consume())
+
+        self.assertEqual(asyncio.run(main()), [["a", "error"], ["a", "error"]])
+
+    def test_stream_every_consumer_stops(self):
+        flight = AsyncSingleFlight()
+        state = {"read": 0, "closed": False}
+
+        async def source():
+            try:
+                for chunk in ["a", "b", "c", "d", "e"]:
+                    await asyncio.sleep(0.01)
+                    state["read"] += 1
+                    yield chunk
+            finally:
+                state["closed"] = True
+
+        async def main():
+            consumer = flight.stream("k", source)
+            self.assertEqual(await consumer.__anext__(), "a")
+            await consumer.aclose()
+            await asyncio.sleep(0.1)
+
+        asyncio.run(main())
+        self.assertTrue(state["closed"])
+        self.assertLess(state["read"], 5)
@@ -0,0 +1,113 @@
+import json
+import unittest
+
+from ovos_solver_openai_persona.sse import ChatStreamParser, SSEDecoder
+
+
+def delta(content=None, finish_reason=None, **extra):
+    choice = {"index": 0, "delta": {"content": content} if content is not None else {},
+              "finish_reason": finish_reason}
+    return json.dumps({"choices": [choice], **extra}).encode()
+
+
+STREAM = (b": keepalive\n\n"
+          b"data: " + delta("Hello") + b"\n\n"
+          b"data: " + delta(" world") + b"\n\n"
+          b"data: " + delta(finish_reason="stop", usage={"total_tokens": 7}) + b"\n\n"
+          b"data: [DONE]\n\n")
+
+
+def feed_all(parser, chunks):
+    deltas = []
+    for chunk in chunks:
+        deltas += parser.feed(chunk)
+    return deltas + parser.close()
+
+
+class TestSSEDecoder(unittest.TestCase):
+    def test_events(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"data: a\n\nevent: error\ndata: b\n\n"),
+                         [("message", b"a"), ("error", b"b")])
+
+    def test_line_endings(self):
+        for sep in (b"\n", b"\r\n", b"\r"):
+            decoder = SSEDecoder()
+            self.assertEqual(decoder.feed(b"data: a" + sep + sep + b"data: b" + sep + sep),
+                             [("message", b"a"), ("message", b"b")])
+
+    def test_crlf_split_between_reads(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"data: a\r"), [])
+        self.assertEqual(decoder.feed(b"\n\r"), [("message", b"a")])
+        self.assertEqual(decoder.feed(b"\ndata: b\r\n\r\n"), [("message", b"b")])
+
+    def test_cr_at_end_of_read(self):
+        # a bare \r ends the line right away, the event is not held back until the next read
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"data: a\r\r"), [("message", b"a")])
+        self.assertEqual(decoder.feed(b"data: b\r\r"), [("message", b"b")])
+
+    def test_split_event(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"da"), [])
+        self.assertEqual(decoder.feed(b"ta: hel"), [])
+        self.assertEqual(decoder.feed(b"lo\n"), [])
+        self.assertEqual(decoder.feed(b"\n"), [("message", b"hello")])
+
+    def test_comments_and_unknown_fields(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b": ping\n\nid: 1\nretry: 10\ndata: a\n\n: ping\n\n"),
+                         [("message", b"a")])
+
+    def test_multiline_data(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"data: a\ndata:b\n\n"), [("message", b"a\nb")])
+
+    def test_close_flushes_last_event(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"data: a"), [])
+        self.assertEqual(decoder.close(), [("message", b"a")])
+        self.assertEqual(decoder.close(), [])
+
+
+class TestChatStreamParser(unittest.TestCase):
+    def test_stream(self):
+        parser = ChatStreamParser()
+        self.assertEqual(feed_all(parser, [STREAM]), ["Hello", " world"])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.finish_reason, "stop")
+        self.assertEqual(parser.usage, {"total_tokens": 7})
+
+    def test_any_split(self):
+        for size in (1, 3, 17):
+            for stream in (STREAM, STREAM.replace(b"\n", b"\r\n")):
+                parser = ChatStreamParser()
+                chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+                self.assertEqual("".join(feed_all(parser, chunks)), "Hello world")
+                self.assertEqual(parser.finish_reason, "stop")
+
+    def test_nothing_after_done(self):
+        parser = ChatStreamParser()
+        self.assertEqual(feed_all(parser, [b"data: [DONE]\n\ndata: " + delta("late") + b"\n\n"]), [])
+
+    def test_error(self):
+        parser = ChatStreamParser()
+        error = json.dumps({"error": {"message": "overloaded"}}).encode()
+        self.assertEqual(feed_all(parser, [b"data: " + delta("Hi") + b"\n\ndata: " + error + b"\n\n"]), ["Hi"])
+        self.assertEqual(parser.error, "overloaded")
+        self.assertTrue(parser.done)
+
+    def test_malformed_event_is_skipped(self):
+        parser = ChatStreamParser()
+        self.assertEqual(feed_all(parser, [b'data: {"content":"x\n\ndata: ' + delta("ok") + b"\n\n"]), ["ok"])
+
+    def test_tool_calls(self):
+        fragments = [{"index": 0, "id": "call_1", "function": {"name": "get_time", "arguments": '{"tz"'}},
+                     {"index": 0, "function": {"arguments": ': "UTC"}'}}]
+        stream = b"".join(b"data: " + json.dumps({"choices": [{"delta": {"tool_calls": [f]}}]}).encode() + b"\n\n"
+                          for f in fragments)
+        parser = ChatStreamParser()
+        self.assertEqual(feed_all(parser, [stream]), [])
+        self.assertEqual(parser.tool_calls, [{"id": "call_1", "type": "function",
+                                              "function": {"name": "get_time", "arguments": '{"tz": "UTC"}'}}])